@@ -1,5 +1,8 @@
 import logging
-from typing import Any, Dict, Optional
+import threading
+import time
+from concurrent.futures import CancelledError
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import llm
 from IPython.core.debugger import prompt
@@ -57,8 +60,50 @@ class AIModel(StrictBaseModel):
             logger.info(f"Loaded model {model.name}")
         return self.llm_model
 
-    def prompt(self, user_input: str, template: Optional[Template] = None, system_prompt: Optional[str] = None, extra_system_prompt: Optional[str] = None, case: Optional[TestCase]=None, **kwargs) -> Response:
-        m = self.ensure_llm_model
+    @property
+    def provider(self) -> str:
+        """
+        The endpoint serving the model, used to apply per-provider concurrency limits.
+
+        This is the API base for OpenAI-compatible models, otherwise the
+        module of the llm plugin providing the model.
+        """
+        model = self.ensure_llm_model
+        return getattr(model, "api_base", None) or type(model).__module__
+
+    @property
+    def supports_samples(self) -> bool:
+        """
+        True if the model can sample several completions of a prompt in one request.
+
+        This is the case for models with an ``n`` option that return the
+        completions as OpenAI-style ``choices``, unless a subclass changes how
+        prompts are sent.
+        """
+        if type(self).prompt is not AIModel.prompt:
+            # e.g. plugins adding retrieved context to the prompt
+            return False
+        options = getattr(self.ensure_llm_model, "Options", None)
+        return "n" in getattr(options, "model_fields", {})
+
+    def render(self, user_input: str, template: Optional[Template] = None, system_prompt: Optional[str] = None, extra_system_prompt: Optional[str] = None, case: Optional[TestCase]=None) -> Tuple[str, Optional[str]]:
+        """
+        Render the main prompt and system prompt, without calling the model.
+
+        Example:
+
+            >>> template = Template(system="Answer in {language}", prompt="Q: {input}")
+            >>> case = TestCase(input="1+1", original_input={"language": "French"})
+            >>> AIModel().render("1+1", template=template, case=case)
+            ('Q: 1+1', 'Answer in French')
+
+        :param user_input:
+        :param template:
+        :param system_prompt:
+        :param extra_system_prompt:
+        :param case:
+        :return: tuple of main prompt and system prompt
+        """
         template_params = {"input": user_input}
         if case and case.original_input:
             template_params.update(case.original_input)
@@ -75,9 +120,158 @@ class AIModel(StrictBaseModel):
                 system_prompt = extra_system_prompt
             else:
                 system_prompt = f"{system_prompt}\n{extra_system_prompt}"
+        return main_prompt, system_prompt
+
+    def prompt(
+        self,
+        user_input: str,
+        template: Optional[Template] = None,
+        system_prompt: Optional[str] = None,
+        extra_system_prompt: Optional[str] = None,
+        case: Optional[TestCase]=None,
+        stream: bool = False,
+        stop: Optional[Callable[[str], bool]] = None,
+        cancel: Optional[threading.Event] = None,
+        **kwargs
+    ) -> Response:
+        """
+        Prompt the model.
+
+        With ``stream``, the response is consumed chunk by chunk, recording the
+        time to the first token; if ``stop`` is given, reading stops as soon as
+        it returns True for the text received so far, and the response is
+        marked as truncated. If ``cancel`` is given, reading stops at the
+        next chunk once it is set, e.g. when a hedged request lost.
+
+        :param user_input:
+        :param template:
+        :param system_prompt:
+        :param extra_system_prompt:
+        :param case:
+        :param stream: consume the response as a stream
+        :param stop: stop condition on the text received so far; only applies when streaming
+        :param cancel: set when the response is no longer needed
+        :return:
+        """
+        m = self.ensure_llm_model
+        main_prompt, system_prompt = self.render(
+            user_input,
+            template=template,
+            system_prompt=system_prompt,
+            extra_system_prompt=extra_system_prompt,
+            case=case,
+        )
         prompt_params = self._prompt_parameters()
         logger.debug(f"Prompting with MAIN: {main_prompt} SYS:{system_prompt} P: {prompt_params}")
         # print(f"Prompting with MAIN: {main_prompt} SYS:{system_prompt} P: {prompt_params}")
+        start = time.monotonic()
         r = m.prompt(main_prompt, system=system_prompt, **prompt_params)
-        return Response(text=r.text(), prompt=main_prompt, system=system_prompt)
+        if not stream and cancel is None:
+            text = r.text()
+            return Response(text=text, prompt=main_prompt, system=system_prompt, latency=time.monotonic() - start)
+        chunks = []
+        time_to_first_token = None
+        truncated = False
+        chunk_iter = iter(r)
+        for chunk in chunk_iter:
+            if time_to_first_token is None:
+                time_to_first_token = time.monotonic() - start
+            chunks.append(chunk)
+            if cancel is not None and cancel.is_set():
+                truncated = True
+                break
+            if stream and stop and stop("".join(chunks)):
+                truncated = True
+                break
+        if truncated and hasattr(chunk_iter, "close"):
+            # stop reading from the provider
+            chunk_iter.close()
+        return Response(
+            text="".join(chunks),
+            prompt=main_prompt,
+            system=system_prompt,
+            latency=time.monotonic() - start,
+            time_to_first_token=time_to_first_token if stream else None,
+            truncated=truncated if stream else truncated or None,
+        )
 
+    def prompt_samples(
+        self,
+        user_input: str,
+        n: int,
+        template: Optional[Template] = None,
+        system_prompt: Optional[str] = None,
+        extra_system_prompt: Optional[str] = None,
+        case: Optional[TestCase] = None,
+        cancel: Optional[threading.Event] = None,
+    ) -> List[Response]:
+        """
+        Sample several completions of a prompt in a single request.
+
+        The prompt is sent, and paid for, once; every response records the
+        latency of the request. Models that do not :attr:`supports_samples`,
+        or that do not return the completions as OpenAI-style ``choices``,
+        are prompted once per (remaining) completion instead. If ``cancel``
+        is set while the response is read, the call fails with
+        :class:`~concurrent.futures.CancelledError`.
+
+        :param user_input:
+        :param n: number of completions
+        :param template:
+        :param system_prompt:
+        :param extra_system_prompt:
+        :param case:
+        :param cancel: set when the responses are no longer needed
+        :return: n responses
+        """
+        prompt_args = dict(
+            template=template,
+            system_prompt=system_prompt,
+            extra_system_prompt=extra_system_prompt,
+            case=case,
+            cancel=cancel,
+        )
+        if not self.supports_samples:
+            return [self.prompt(user_input, **prompt_args) for _ in range(n)]
+        m = self.ensure_llm_model
+        main_prompt, system_prompt = self.render(
+            user_input,
+            template=template,
+            system_prompt=system_prompt,
+            extra_system_prompt=extra_system_prompt,
+            case=case,
+        )
+        start = time.monotonic()
+        r = m.prompt(main_prompt, system=system_prompt, stream=False, **self._prompt_parameters(), n=n)
+        chunks = []
+        for chunk in r:
+            chunks.append(chunk)
+            if cancel is not None and cancel.is_set():
+                raise CancelledError(f"Sampling {m.model_id} cancelled")
+        latency = time.monotonic() - start
+        texts = _choice_texts(r.response_json)
+        if len(texts) != n:
+            logger.warning(f"Model {m.model_id} returned {len(texts)} completions, expected {n}; "
+                           f"prompting once per remaining completion")
+            first = Response(text="".join(chunks), prompt=main_prompt, system=system_prompt, latency=latency)
+            return [first] + [self.prompt(user_input, **prompt_args) for _ in range(n - 1)]
+        return [Response(text=text, prompt=main_prompt, system=system_prompt, latency=latency) for text in texts]
+
+
+def _choice_texts(response_json: Optional[Dict[str, Any]]) -> List[str]:
+    """
+    The texts of the OpenAI-style choices of a response, or none if it has another shape.
+
+    >>> _choice_texts({"choices": [{"message": {"content": "a"}}, {"text": "b"}]})
+    ['a', 'b']
+    >>> _choice_texts({"content": [{"text": "a"}]})
+    []
+    """
+    choices = (response_json or {}).get("choices") if isinstance(response_json, dict) else None
+    if not isinstance(choices, list):
+        return []
+    texts = [
+        (choice.get("message") or {}).get("content") if "message" in choice else choice.get("text")
+        for choice in choices if isinstance(choice, dict)
+    ]
+    return texts if len(texts) == len(choices) and all(isinstance(t, str) for t in texts) else []
@@ -0,0 +1,358 @@
+"""
+Confidence intervals and significance tests for scores.
+
+Scores are arranged in a :class:`ScoreMatrix`, one row per case and one
+column per hyperparameter combination ("configuration"), read straight from
+the store. Missing or unscored cells are NaN.
+
+All resampling is vectorized over the whole matrix:
+
+- confidence intervals use the bootstrap; a resample is expressed as the
+  number of times each case was drawn, so a chunk of resamples is a single
+  weight-matrix product with the scores
+- differences between two configurations are paired on the cases both
+  have scores for; they are tested with a paired sign-flip permutation test,
+  which randomly swaps the two scores of each case
+
+When two configurations were scored on the same cases, paired statistics
+follow from the per-configuration ones of the same resamples, so comparing
+all pairs costs little more than the configurations themselves.
+"""
+import json
+import logging
+import math
+from dataclasses import dataclass
+from itertools import combinations
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from llm_matrix.schema import Suite
+from llm_matrix.store import Store, suite_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESAMPLES = 1000
+DEFAULT_CONFIDENCE = 0.95
+CHUNK_SIZE = 50_000_000
+"""Maximum number of resample weights held in memory at a time"""
+
+
+@dataclass
+class ScoreMatrix:
+    """
+    Scores of cases (rows) under configurations (columns).
+
+    Example:
+
+        >>> df = pd.DataFrame({
+        ...     "case_input": ["a", "b", "a", "b"],
+        ...     "hyperparameters": ["model=m1", "model=m1", "model=m2", "model=m2"],
+        ...     "score": [1.0, 0.0, 1.0, None],
+        ... })
+        >>> matrix = ScoreMatrix.from_dataframe(df)
+        >>> matrix.configs
+        ['model=m1', 'model=m2']
+        >>> matrix.values.tolist()
+        [[1.0, 1.0], [0.0, nan]]
+    """
+    values: np.ndarray
+    cases: List[str]
+    configs: List[str]
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame) -> "ScoreMatrix":
+        """
+        Arrange results flattened by :func:`llm_matrix.schema.results_to_dataframe`, averaging replicates.
+
+        :param df: with ``case_input``, ``hyperparameters`` and ``score`` columns
+        :return:
+        """
+        df = df.assign(score=pd.to_numeric(df["score"], errors="coerce"))
+        if "replicate" in df:
+            df = df.groupby(["case_input", "hyperparameters"], as_index=False)["score"].mean()
+        case_codes, cases = pd.factorize(df["case_input"], sort=True)
+        config_codes, configs = pd.factorize(df["hyperparameters"], sort=True)
+        values = np.full((len(cases), len(configs)), np.nan)
+        values[case_codes, config_codes] = df["score"].to_numpy(dtype=float)
+        return cls(values=values, cases=list(cases), configs=list(configs))
+
+    @classmethod
+    def from_store(cls, store: Store, suite: Optional[Suite] = None) -> "ScoreMatrix":
+        """
+        Read the scores of a store, numbering cases and configurations in the database.
+
+        Configurations are labelled as in :func:`llm_matrix.schema.results_to_dataframe`.
+        Without a suite, cases of different suites are different rows. The
+        replicates of a cell are averaged.
+
+        :param store:
+        :param suite: only read the results of this suite (and version)
+        :return:
+        """
+        where, params = ("WHERE suite_name = ?", [suite_key(suite)]) if suite else ("", [])
+        data = store.query(f"""
+            WITH r AS (
+                SELECT suite_name, test_case, ideal, CAST(hyperparameters AS VARCHAR) AS config, AVG(score) AS score
+                FROM results {where}
+                GROUP BY ALL
+            )
+            SELECT
+                dense_rank() OVER (ORDER BY suite_name, test_case, ideal) - 1 AS case_id,
+                dense_rank() OVER (ORDER BY config) - 1 AS config_id,
+                score,
+                test_case,
+                config
+            FROM r
+        """, params)
+        n_cases = int(data["case_id"].max()) + 1 if len(data) else 0
+        configs = data.drop_duplicates("config_id").sort_values("config_id")["config"]
+        cases = data.drop_duplicates("case_id").sort_values("case_id")["test_case"]
+        values = np.full((n_cases, len(configs)), np.nan)
+        values[data["case_id"].to_numpy(), data["config_id"].to_numpy()] = data["score"].to_numpy(dtype=float)
+        return cls(values=values, cases=list(cases), configs=[_config_label(c) for c in configs])
+
+
+def _config_label(hyperparameters_json: str) -> str:
+    """
+    Label a configuration as results dataframes do.
+
+    >>> _config_label('{"model": "gpt-4o", "temperature": 0.5}')
+    'model=gpt-4o_temperature=0.5'
+    """
+    return "_".join(f"{k}={v}" for k, v in json.loads(hyperparameters_json).items())
+
+
+def _chunks(n_resamples: int, n: int) -> List[int]:
+    """Numbers of resamples to draw at a time, bounding memory use."""
+    chunk = max(1, min(n_resamples, CHUNK_SIZE // max(n, 1)))
+    return [min(chunk, n_resamples - start) for start in range(0, n_resamples, chunk)]
+
+
+def _resample_weights(rng: np.random.Generator, n_resamples: int, n: int) -> Iterator[np.ndarray]:
+    """How many times each case is drawn in each bootstrap resample, in chunks of resamples."""
+    for size in _chunks(n_resamples, n):
+        draws = rng.integers(0, n, size=(size, n)).reshape(-1)
+        draws += np.repeat(np.arange(size) * n, n)
+        yield np.bincount(draws, minlength=size * n).reshape(size, n).astype(np.float32)
+
+
+def _sign_flips(rng: np.random.Generator, n_resamples: int, n: int) -> Iterator[np.ndarray]:
+    """Random signs for each resample and case, in chunks of resamples."""
+    for size in _chunks(n_resamples, n):
+        bits = np.unpackbits(rng.integers(0, 256, size=(size, (n + 7) // 8), dtype=np.uint8), axis=1, count=n)
+        yield bits.astype(np.float32) * 2 - 1
+
+
+def _interval(samples: np.ndarray, confidence: float) -> Tuple[np.ndarray, np.ndarray]:
+    alpha = (1 - confidence) / 2
+    return np.nanquantile(samples, alpha, axis=0), np.nanquantile(samples, 1 - alpha, axis=0)
+
+
+def summarize_configs(matrix: ScoreMatrix) -> pd.DataFrame:
+    """
+    Number of scored cases, mean and standard deviation of the scores of each configuration.
+
+    >>> summarize_configs(ScoreMatrix(np.array([[1.0, 0.0], [0.0, np.nan]]), ["x", "y"], ["a", "b"])).values.tolist()
+    [['a', 2, 0.5, 0.7071067811865476], ['b', 1, 0.0, nan]]
+    """
+    values = matrix.values
+    mask = ~np.isnan(values)
+    n = mask.sum(axis=0)
+    filled = np.where(mask, values, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = filled.sum(axis=0) / n
+        std = np.sqrt(np.where(mask, (filled - mean) ** 2, 0.0).sum(axis=0) / (n - 1))
+    return pd.DataFrame({"config": matrix.configs, "n": n, "mean": mean, "std": std})
+
+
+def confidence_intervals(
+    matrix: ScoreMatrix,
+    n_resamples: int = DEFAULT_RESAMPLES,
+    confidence: float = DEFAULT_CONFIDENCE,
+    seed: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Bootstrap confidence intervals of the mean score of each configuration.
+
+    Example:
+
+        >>> rng = np.random.default_rng(0)
+        >>> matrix = ScoreMatrix(rng.binomial(1, [0.9, 0.5], size=(500, 2)).astype(float), [], ["good", "coin"])
+        >>> ci = confidence_intervals(matrix, seed=1).set_index("config")
+        >>> bool(ci.loc["good", "ci_low"] < 0.9 < ci.loc["good", "ci_high"])
+        True
+        >>> bool(ci.loc["coin", "ci_high"] < ci.loc["good", "ci_low"])
+        True
+
+    :param matrix:
+    :param n_resamples:
+    :param confidence:
+    :param seed:
+    :return: one row per configuration, with the number of scored cases, mean, std and interval
+    """
+    values = matrix.values
+    mask = ~np.isnan(values)
+    filled = np.where(mask, values, 0.0).astype(np.float32)
+    rng = np.random.default_rng(seed)
+    means = []
+    for weights in _resample_weights(rng, n_resamples, len(values)):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means.append((weights @ filled) / (weights @ mask.astype(np.float32)))
+    low, high = _interval(np.vstack(means), confidence)
+    return summarize_configs(matrix).assign(ci_low=low, ci_high=high)
+
+
+def compare_configs(
+    matrix: ScoreMatrix,
+    n_resamples: int = DEFAULT_RESAMPLES,
+    confidence: float = DEFAULT_CONFIDENCE,
+    seed: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Compare every pair of configurations on the cases both were scored on.
+
+    The difference of mean scores gets a paired bootstrap confidence
+    interval, and a two-sided p-value from a paired sign-flip permutation
+    test. ``p_adjusted`` corrects for the number of pairs (Holm).
+
+    Example:
+
+        >>> rng = np.random.default_rng(0)
+        >>> base = rng.random(400)
+        >>> values = np.column_stack([base, base + 0.05, base + rng.normal(0, 0.01, 400)])
+        >>> df = compare_configs(ScoreMatrix(values, [], ["a", "b", "c"]), seed=1)
+        >>> df[["config_a", "config_b"]].values.tolist()
+        [['a', 'b'], ['a', 'c'], ['b', 'c']]
+        >>> [bool(p < 0.05) for p in df["p_value"]]
+        [True, False, True]
+
+    :param matrix:
+    :param n_resamples:
+    :param confidence:
+    :param seed:
+    :return: one row per pair, with the number of paired cases, mean difference (a - b),
+             its interval, and p-values
+    """
+    values = matrix.values
+    n_cases, n_configs = values.shape
+    mask = ~np.isnan(values)
+    filled = np.where(mask, values, 0.0).astype(np.float32)
+    pairs = list(combinations(range(n_configs), 2))
+    if not pairs:
+        return pd.DataFrame(
+            columns=["config_a", "config_b", "n", "diff", "ci_low", "ci_high", "p_value", "p_adjusted"]
+        )
+    # pairs scored on the same cases follow from per-configuration sums; others need their own columns
+    same_cases = [bool(np.array_equal(mask[:, a], mask[:, b])) for a, b in pairs]
+    other = [i for i, same in enumerate(same_cases) if not same]
+    both = np.column_stack([mask[:, a] & mask[:, b] for a, b in (pairs[i] for i in other)]) if other else None
+    diffs = (
+        np.column_stack([np.where(both[:, j], filled[:, a] - filled[:, b], 0.0) for j, (a, b) in
+                         enumerate(pairs[i] for i in other)]).astype(np.float32)
+        if other else None
+    )
+    a_idx = np.array([a for a, _ in pairs])
+    b_idx = np.array([b for _, b in pairs])
+    n_paired = np.array([
+        int(mask[:, a].sum()) if same else int((mask[:, a] & mask[:, b]).sum())
+        for (a, b), same in zip(pairs, same_cases)
+    ])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        observed = np.array([
+            np.mean(values[mask[:, a] & mask[:, b], a] - values[mask[:, a] & mask[:, b], b])
+            if n else np.nan
+            for (a, b), n in zip(pairs, n_paired)
+        ])
+    rng = np.random.default_rng(seed)
+
+    def pair_statistics(weights: np.ndarray, normalize: bool) -> np.ndarray:
+        """Weighted mean differences of all pairs, for each row of weights."""
+        sums = weights @ filled
+        stats = np.empty((len(weights), len(pairs)), dtype=np.float64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if normalize:
+                counts = weights @ mask.astype(np.float32)
+                stats[:] = sums[:, a_idx] / counts[:, a_idx] - sums[:, b_idx] / counts[:, b_idx]
+            else:
+                stats[:] = (sums[:, a_idx] - sums[:, b_idx]) / n_paired
+            if other:
+                other_sums = weights @ diffs
+                if normalize:
+                    stats[:, other] = other_sums / (weights @ both.astype(np.float32))
+                else:
+                    stats[:, other] = other_sums / n_paired[other]
+        return stats
+
+    boot = np.vstack([pair_statistics(w, normalize=True) for w in _resample_weights(rng, n_resamples, n_cases)])
+    low, high = _interval(boot, confidence)
+    # sign flips of a case swap its two scores; cases missing from a pair contribute zero
+    flipped = np.vstack([pair_statistics(s, normalize=False) for s in _sign_flips(rng, n_resamples, n_cases)])
+    exceed = (np.abs(flipped) >= np.abs(observed) - 1e-12).sum(axis=0)
+    p_values = (1 + exceed) / (1 + n_resamples)
+    p_values[np.isnan(observed)] = np.nan
+    return pd.DataFrame({
+        "config_a": [matrix.configs[a] for a in a_idx],
+        "config_b": [matrix.configs[b] for b in b_idx],
+        "n": n_paired,
+        "diff": observed,
+        "ci_low": low,
+        "ci_high": high,
+        "p_value": p_values,
+        "p_adjusted": holm(p_values),
+    })
+
+
+def holm(p_values: np.ndarray) -> np.ndarray:
+    """
+    Holm-adjust p-values for multiple comparisons.
+
+    >>> holm(np.array([0.01, 0.04, 0.03])).tolist()
+    [0.03, 0.06, 0.06]
+    """
+    p = np.asarray(p_values, dtype=float)
+    adjusted = np.full_like(p, np.nan)
+    valid = np.flatnonzero(~np.isnan(p))
+    order = valid[np.argsort(p[valid])]
+    m = len(order)
+    running = 0.0
+    for rank, i in enumerate(order):
+        running = max(running, min(1.0, (m - rank) * p[i]))
+        adjusted[i] = running
+    return adjusted
+
+
+EXACT_SIGN_TEST_LIMIT = 10_000
+"""Largest number of changed cases for which the sign test sums binomial terms; above it, a normal approximation"""
+
+
+def sign_test(improved: int, regressed: int) -> float:
+    """
+    Two-sided paired sign test of whether scores moved, from the numbers of cases that went up and down.
+
+    Cases whose score did not change carry no information and are left out.
+
+    >>> round(sign_test(9, 1), 6)
+    0.021484
+    >>> sign_test(5, 5)
+    1.0
+    >>> round(sign_test(60_000, 59_000), 4)
+    0.0038
+
+    :param improved: number of cases scoring higher
+    :param regressed: number of cases scoring lower
+    :return: p-value, NaN if no case changed
+    """
+    n = improved + regressed
+    if n == 0:
+        return float("nan")
+    k = min(improved, regressed)
+    if n > EXACT_SIGN_TEST_LIMIT:
+        # with continuity correction
+        z = (abs(improved - regressed) - 1) / math.sqrt(n)
+        return min(1.0, math.erfc(max(z, 0.0) / math.sqrt(2)))
+    log_half = n * math.log(0.5)
+    lgamma_n = math.lgamma(n + 1)
+    tail = sum(math.exp(lgamma_n - math.lgamma(i + 1) - math.lgamma(n - i + 1) + log_half) for i in range(k + 1))
+    return min(1.0, 2 * tail)
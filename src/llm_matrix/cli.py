@@ -15,9 +15,10 @@ pipx run llm-runner --help
 """
 import json
 import logging
+import sys
 from enum import Enum
 from pathlib import Path
-from typing import Annotated, List, Optional
+from typing import Annotated, List, Optional, Set
 
 import pandas as pd
 import typer
@@ -26,7 +27,26 @@ from typer.main import get_command
 
 from llm_matrix import LLMRunner
 from llm_matrix.runner import LLMRunnerConfig
-from llm_matrix.schema import results_to_dataframe, load_suite
+from llm_matrix.analytics import (
+    DEFAULT_CONFIDENCE, DEFAULT_RESAMPLES, ScoreMatrix, compare_configs, confidence_intervals, summarize_configs,
+)
+from llm_matrix.diff import RunDiff, version_key
+from llm_matrix.converter import DEFAULT_CHUNK_SIZE, convert as convert_tables
+from llm_matrix.estimate import (
+    ModelPrice, check_budget, count_actions, estimate_calls, estimate_wall_clock, summarize_calls
+)
+from llm_matrix.planner import plan_to_dataframe
+from llm_matrix.results import ResultSet
+from llm_matrix.progress import DEFAULT_REFRESH_INTERVAL, JsonLinesSink, ProgressReporter, ProgressTracker, TerminalSink
+from llm_matrix.schema import results_to_dataframe, load_suite, load_suites
+from llm_matrix.server import DEFAULT_HOST, DEFAULT_PORT, DEFAULT_SERVER_URL, make_server, submit_results
+from llm_matrix.store import Store, merge_stores, compact_store
+from llm_matrix.summary_stats import agreement_by_config, replicate_summary
+from llm_matrix.utils import CaseIndex, Shard, select_cases
+from llm_matrix.workqueue import (
+    DEFAULT_CLAIM_SIZE, DEFAULT_LEASE_SECONDS, DEFAULT_MAX_ATTEMPTS, LEASED, PENDING, WorkQueue,
+    default_worker_name, run_worker,
+)
 
 logger = logging.getLogger()
 
@@ -35,6 +55,14 @@ app = typer.Typer()
 output_file_option = typer.Option(None, "--output-file", "-o", help="Output file path")
 output_dir_option = typer.Option(None, "--output-dir", "-D", help="Output directory path")
 
+prices_option = typer.Option(
+    None,
+    "--prices",
+    help="YAML file with the price per million input and output tokens of each model, "
+         "e.g. 'gpt-4o: {input: 2.5, output: 10}'"
+)
+
+
 class FormatEnum(str,  Enum):
     csv = "csv"
     tsv = "tsv"
@@ -43,6 +71,12 @@ class FormatEnum(str,  Enum):
     json = "json"
     yaml = "yaml"
 
+
+class StratifyEnum(str, Enum):
+    tag = "tag"
+    ideal = "ideal"
+
+
 def configure_logging(verbosity: int):
     """Configure logging based on verbosity level"""
     if verbosity == 1:
@@ -66,6 +100,19 @@ def configure_logging(verbosity: int):
     logger.setLevel(level)
     logger.addHandler(handler)
 
+def load_runner_config(runner_config_path: Optional[Path], prices_path: Optional[Path] = None) -> Optional[LLMRunnerConfig]:
+    """Load the runner config, adding the prices from a separate price table if given."""
+    runner_config = None
+    if runner_config_path:
+        with open(runner_config_path) as f:
+            runner_config = LLMRunnerConfig(**yaml.safe_load(f))
+    if prices_path:
+        with open(prices_path) as f:
+            prices = {k: ModelPrice(**v) for k, v in yaml.safe_load(f).items()}
+        runner_config = runner_config or LLMRunnerConfig()
+        runner_config.model_prices = {**(runner_config.model_prices or {}), **prices}
+    return runner_config
+
 # This callback runs before any subcommand
 @app.callback()
 def main(
@@ -81,30 +128,69 @@ def convert(
         input_files: List[Path] = typer.Argument(
                                       ...,
                                       exists=True,
-                                      help="Path to files to be converted"
+                                      help="CSV, TSV or Parquet files to be converted"
                                       ),
-        source_field: Optional[str] = typer.Option(..., "-s", "--source"),
-        target_field: Optional[str] = typer.Option(..., "-t", "--target"),
-
+        source_field: str = typer.Option(..., "-s", "--source", help="Column with the case input"),
+        target_field: Optional[str] = typer.Option(None, "-t", "--target", help="Column with the ideal output"),
+        output_file: Optional[Path] = output_file_option,
+        output_format: FormatEnum = typer.Option(
+            FormatEnum.yaml,
+            "--output-format",
+            "-F",
+            help="Output format, yaml or jsonl",
+        ),
+        header_path: Optional[Path] = typer.Option(
+            None,
+            "--header",
+            exists=True,
+            help="YAML file with the other keys of the suite (name, matrix, templates), written before the cases"
+        ),
+        chunk_size: int = typer.Option(
+            DEFAULT_CHUNK_SIZE,
+            "--chunk-size",
+            help="Number of rows read at a time"
+        ),
 ):
     """
-    Converts input files
+    Converts tabular files to suite test cases.
+
+    The source column becomes the case input, the target column the ideal
+    output, and the remaining columns are kept as the original input of the case.
+
+    Example:
 
-    :param input_files:
-    :return:
+        llm-runner convert genes.tsv -s question -t answer --header suite-header.yaml -o suite.yaml
     """
-    dfs = [pd.read_csv(fn) for fn in input_files]
-    df = pd.concat(dfs)
-    for _, row in df.iterrows():
-        x = {}
+    if output_format not in (FormatEnum.yaml, FormatEnum.jsonl):
+        raise typer.BadParameter(f"Cannot write cases as {output_format.value}", param_hint="--output-format")
+    header = None
+    if header_path:
+        with open(header_path) as f:
+            header = yaml.safe_load(f)
+    output = open(output_file, "w") if output_file else sys.stdout
+    try:
+        n = convert_tables(
+            input_files,
+            output,
+            source_field,
+            target_field,
+            syntax=output_format.value,
+            header=header,
+            chunk_size=chunk_size,
+        )
+    finally:
+        if output_file:
+            output.close()
+    if output_file:
+        typer.echo(f"{n} cases written to {output_file}", err=True)
 
 
 @app.command()
 def run(
-    suite_path: Path = typer.Argument(
+    suite_paths: List[Path] = typer.Argument(
                                       ...,
                                       exists=True,
-                                      help="Path to the eval suite yaml"
+                                      help="Paths to eval suite yamls, or manifests listing them"
                                       ),
     store_path: Optional[Path] = typer.Option(
         None,
@@ -126,6 +212,63 @@ def run(
         help="Output format",
 
     ),
+    shard_spec: Optional[str] = typer.Option(
+        None,
+        "--shard",
+        help="Only run shard i of N of the cells, e.g. 2/4. Each shard writes its own store by default"
+    ),
+    plan: bool = typer.Option(
+        False,
+        "--plan",
+        help="Only show which cells would be generated, rescored or taken from the store, and why"
+    ),
+    verbose: bool = typer.Option(
+        False,
+        "--verbose",
+        help="Print every result as it completes, instead of a progress line"
+    ),
+    progress_log: Optional[str] = typer.Option(
+        None,
+        "--progress-log",
+        help="Also write progress as JSON lines to this file, or to a socket given as tcp://host:port"
+    ),
+    progress_interval: float = typer.Option(
+        DEFAULT_REFRESH_INTERVAL,
+        "--progress-interval",
+        help="Seconds between progress updates"
+    ),
+    prices_path: Optional[Path] = prices_option,
+    budget: Optional[float] = typer.Option(
+        None,
+        "--budget",
+        help="Do not run if the estimated cost of the uncached cells exceeds this (see the plan command)"
+    ),
+    tags: Optional[List[str]] = typer.Option(
+        None,
+        "--tags",
+        help="Only run cases with any of these tags (repeatable)"
+    ),
+    exclude_tags: Optional[List[str]] = typer.Option(
+        None,
+        "--exclude-tags",
+        help="Skip cases with any of these tags (repeatable)"
+    ),
+    sample: Optional[int] = typer.Option(
+        None,
+        "--sample",
+        min=1,
+        help="Only run a random sample of this many cases of each suite"
+    ),
+    stratify_by: Optional[StratifyEnum] = typer.Option(
+        None,
+        "--stratify-by",
+        help="Sample each case tag (the first tag of a case) or ideal answer in proportion to its size"
+    ),
+    seed: int = typer.Option(
+        0,
+        "--seed",
+        help="Random seed for --sample; the same seed gives the same cases"
+    ),
 ):
     """
     Run the evaluation suite.
@@ -134,25 +277,122 @@ def run(
 
         llm-runner run my-conf.yaml
 
+    To split a large suite over several processes or machines:
+
+        llm-runner run my-conf.yaml --shard 1/2
+        llm-runner run my-conf.yaml --shard 2/2
+        llm-runner merge-stores my-conf.shard-*.db -o my-conf.db
+
+    To run several suites together, sharing models, workers and a store
+    (outputs go to a directory per suite):
+
+        llm-runner run genes.yaml diseases.yaml -s nightly.db -D nightly-output
+        llm-runner run nightly-manifest.yaml
+
+    For a quick run over a representative subset of the cases (whose results
+    are reused by the full run):
+
+        llm-runner run my-conf.yaml --sample 200 --stratify-by tag --exclude-tags slow
+
     """
-    suite = load_suite(suite_path)
+    suites = load_suites(suite_paths)
+    if tags or exclude_tags or sample:
+        selected = []
+        for path, suite in suites:
+            subset = select_cases(
+                suite, CaseIndex.from_cases(suite.cases), tags=tags, exclude_tags=exclude_tags,
+                sample=sample, stratify_by=stratify_by.value if stratify_by else None, seed=seed,
+            )
+            logger.info(f"Selected {len(subset.cases)} of {len(suite.cases)} cases of {suite.name}")
+            selected.append((path, subset))
+        suites = selected
+    shard = Shard.parse(shard_spec) if shard_spec else None
+    several = len(suites) > 1
+
+    def stem_of(path: Path) -> str:
+        return str(path.stem) + (f".{shard.suffix}" if shard else "")
+
     if not store_path:
-        store_path = suite_path.parent / (str(suite_path.stem) + ".db")
-    if not output_directory:
-        output_directory = suite_path.parent / (str(suite_path.stem) + "-output")
-    runner_config = None
-    if runner_config_path:
-        with open(runner_config_path) as f:
-            runner_config = LLMRunnerConfig(**yaml.safe_load(f))
-    runner = LLMRunner(store_path=store_path, config=runner_config)
-    results = []
-    source_keys = set()
-    for r in runner.run_iter(suite):
-        results.append(r)
-        print(f"## {r.score} {r.case.input} :: ideal= {r.case.ideal} :: resp= {r.response.text}")
-        print(yaml.dump(r.model_dump()))
-        if r.case.original_input:
-            source_keys.update(r.case.original_input.keys())
+        if len(suite_paths) > 1:
+            raise typer.BadParameter("A store path is needed to run several suite files", param_hint="--store-path")
+        # a single suite, or a manifest
+        store_path = suite_paths[0].parent / (stem_of(suite_paths[0]) + ".db")
+    if several and output_file:
+        raise typer.BadParameter("Cannot write several suites to one file; use --output-dir", param_hint="--output-file")
+    output_directories = [
+        output_directory / suite.name if several and output_directory
+        else output_directory or path.parent / (stem_of(path) + "-output")
+        for path, suite in suites
+    ]
+    runner_config = load_runner_config(runner_config_path, prices_path)
+    runner = LLMRunner(store_path=store_path, config=runner_config, shard=shard)
+    if budget is not None:
+        calls = pd.concat([estimate_calls(runner, runner.plan(suite)) for _, suite in suites])
+        check = check_budget(calls, budget)
+        if check["unpriced"]:
+            typer.echo(f"No price for {', '.join(check['unpriced'])}; cannot check the budget", err=True)
+            raise typer.Exit(1)
+        if not check["ok"]:
+            typer.echo(f"Estimated cost {check['cost']:.4f} is over the budget of {budget:.4f}; not running", err=True)
+            raise typer.Exit(1)
+        logger.info(f"Estimated cost {check['cost']:.4f} is within the budget of {budget:.4f}")
+    if plan:
+        plan_df = pd.concat(
+            [plan_to_dataframe(runner.plan(suite)).assign(suite=suite.name) for _, suite in suites],
+            ignore_index=True,
+        )
+        if not several:
+            plan_df = plan_df.drop(columns=["suite"])
+        if len(plan_df):
+            to_run = plan_df[plan_df["action"] != "cached"]
+            if len(to_run):
+                typer.echo(to_run.to_string(index=False))
+            typer.echo(plan_df.groupby("action").size().to_string())
+        if output_file:
+            plan_df.to_csv(output_file, index=False, sep="\t")
+        return
+    results = {id(suite): ResultSet(interner=runner.interner) for _, suite in suites}
+    source_keys = {id(suite): set() for _, suite in suites}
+    runner.progress = ProgressTracker()
+    sinks = [] if verbose else [TerminalSink()]
+    if progress_log:
+        sinks.append(JsonLinesSink(progress_log))
+    with ProgressReporter(runner.progress, sinks, interval=progress_interval):
+        for suite, r in runner.run_suites_iter([suite for _, suite in suites]):
+            results[id(suite)].append(r)
+            if verbose:
+                print(f"## {r.score} {r.case.input} :: ideal= {r.case.ideal} :: resp= {r.response.text}")
+                print(yaml.dump(r.model_dump()))
+            if r.case.original_input:
+                source_keys[id(suite)].update(r.case.original_input.keys())
+    if runner.progress.errors:
+        typer.echo(f"{runner.progress.errors} cells failed, see the log", err=True)
+    hedges, timeouts = sum(runner.progress.hedges.values()), sum(runner.progress.timeouts.values())
+    if hedges or timeouts:
+        typer.echo(
+            f"{hedges} calls hedged ({sum(runner.progress.hedge_wins.values())} won by the hedge), "
+            f"{timeouts} timed out",
+            err=True,
+        )
+    if runner.progress.evaluation_tiers:
+        tiers = sorted(runner.progress.evaluation_tiers.items(), key=lambda item: -item[1])
+        typer.echo(f"Scored by tier: {', '.join(f'{tier} {n}' for tier, n in tiers)}", err=True)
+    for (_, suite), suite_output_directory in zip(suites, output_directories):
+        if several:
+            typer.echo(f"# {suite.name}")
+        write_results(
+            results[id(suite)], source_keys[id(suite)], output_file, output_format, suite_output_directory
+        )
+
+
+def write_results(
+    results: ResultSet,
+    source_keys: Set[str],
+    output_file: Optional[Path],
+    output_format: str,
+    output_directory: Optional[Path],
+):
+    """Write the results of a suite to a file and summaries to a directory."""
     df = results_to_dataframe(results)
     typer.echo(df.describe())
     if output_file:
@@ -246,8 +486,485 @@ def run(
         grouped_by_input.to_csv(output_directory / "grouped_by_input.tsv", index=True, sep="\t")
         grouped_by_input.to_excel(output_directory / "grouped_by_input.xlsx", index=True)
         typer.echo(f"Conversion result written to {output_directory}")
+    if "replicate" in df and df["replicate"].notna().any():
+        # stability of each combination across the replicates of its cells
+        by_cell = replicate_summary(df)
+        agreement = agreement_by_config(by_cell)
+        typer.echo(agreement.to_string(index=False))
+        if output_directory:
+            by_cell.to_csv(output_directory / "by_cell.csv", index=False)
+            agreement.to_csv(output_directory / "agreement.csv", index=False)
+
+
+
+@app.command("plan")
+def plan_command(
+    suite_path: Path = typer.Argument(..., exists=True, help="Path to the eval suite yaml"),
+    store_path: Optional[Path] = typer.Option(
+        None,
+        "--store-path", "-s",
+        help="Path to the cache store. Defaults to same directory as suite with .db extension"
+    ),
+    runner_config_path: Optional[Path] = typer.Option(None, "--runner-config", "-C", help="Path to the runner config"),
+    prices_path: Optional[Path] = prices_option,
+    output_file: Optional[Path] = typer.Option(
+        None, "--output-file", "-o",
+        help="Write the estimated calls for every cell to this TSV file"
+    ),
+):
+    """
+    Estimate the calls, tokens, cost and time of a run, without calling any model.
+
+    Cells already in the store are not counted. Cost needs a price per model,
+    from --prices or the runner config; time needs latencies recorded by
+    earlier runs in the store.
+
+    Example:
+
+        llm-matrix plan my-suite.yaml --prices prices.yaml
+
+    """
+    suite = load_suite(suite_path)
+    if not store_path:
+        store_path = suite_path.parent / (suite_path.stem + ".db")
+    runner = LLMRunner(store_path=store_path, config=load_runner_config(runner_config_path, prices_path))
+    cells = runner.plan(suite)
+    typer.echo(count_actions(cells).to_string(index=False))
+    calls = estimate_calls(runner, cells)
+    if calls.empty:
+        typer.echo("Nothing to run")
+        return
+    typer.echo("")
+    typer.echo(summarize_calls(calls).round({"calls": 1}).to_string(index=False))
+    if runner.config and runner.config.evaluation_cascade:
+        typer.echo("Judge calls for cells to generate are expected from the cascade on stored responses")
+    cost = calls[calls["kind"] != "retrieval"]["cost"]
+    typer.echo("")
+    typer.echo(f"Total cost: {cost.sum():.4f}" + (" (some models have no price)" if cost.isna().any() else ""))
+    seconds = estimate_wall_clock(runner, calls)
+    if seconds is None:
+        typer.echo("Total time: unknown (some models have no recorded latency)")
+    else:
+        typer.echo(f"Total time: {seconds / 60:.1f} min")
+    if output_file:
+        calls.to_csv(output_file, index=False, sep="\t")
+
+
+@app.command("merge-stores")
+def merge_stores_command(
+    store_paths: List[Path] = typer.Argument(
+        ...,
+        exists=True,
+        help="Paths to the stores to merge, e.g. the stores of a sharded run"
+    ),
+    output_path: Path = typer.Option(
+        ...,
+        "--output", "-o",
+        help="Path to the merged store; existing results in it are kept unless newer ones are merged in"
+    ),
+):
+    """
+    Merge several cache stores into one.
+
+    Results are de-duplicated on the cache key, keeping the newest result.
+
+    Example:
+
+        llm-runner merge-stores my-conf.shard-1-of-2.db my-conf.shard-2-of-2.db -o my-conf.db
+
+    """
+    store = merge_stores(store_paths, output_path)
+    typer.echo(f"Merged {len(store_paths)} stores into {output_path} ({store.size} results)")
+    store.close()
+
+
+@app.command()
+def compact(
+    store_path: Path = typer.Argument(
+        ...,
+        exists=True,
+        help="Path to the store to compact"
+    ),
+    output_path: Optional[Path] = typer.Option(
+        None,
+        "--output", "-o",
+        help="Path for the compacted store. Defaults to replacing the input store"
+    ),
+):
+    """
+    Rewrite a cache store in the compact layout.
+
+    Cases, rendered prompts and system prompts are moved into a
+    de-duplicated, compressed side table.
+
+    Example:
+
+        llm-runner compact my-conf.db
+
+    """
+    size_before = store_path.stat().st_size
+    store = compact_store(store_path, output_path)
+    store.close()
+    size_after = (output_path or store_path).stat().st_size
+    typer.echo(f"Compacted {store_path}: {size_before} -> {size_after} bytes")
+
+
+@app.command()
+def report(
+    store_path: Path = typer.Argument(
+        ...,
+        exists=True,
+        help="Path to the store to report on"
+    ),
+    suite_path: Optional[Path] = typer.Option(
+        None,
+        "--suite", "-s",
+        exists=True,
+        help="Only report on the results of this suite"
+    ),
+    ci: bool = typer.Option(
+        False,
+        "--ci/--no-ci",
+        help="Add bootstrap confidence intervals, and compare every pair of configurations"
+    ),
+    resamples: int = typer.Option(
+        DEFAULT_RESAMPLES,
+        "--resamples",
+        help="Number of bootstrap resamples and permutations"
+    ),
+    confidence: float = typer.Option(
+        DEFAULT_CONFIDENCE,
+        "--confidence",
+        help="Confidence level of the intervals"
+    ),
+    seed: Optional[int] = typer.Option(
+        None,
+        "--seed",
+        help="Random seed, for reproducible intervals and p-values"
+    ),
+    output_directory: Optional[Path] = output_dir_option,
+):
+    """
+    Report the scores of each hyperparameter combination in a store.
+
+    With ``--ci``, means get bootstrap confidence intervals, and every pair
+    of combinations is compared on the cases both were scored on: the mean
+    score difference gets a paired bootstrap interval and a paired
+    permutation test p-value (also Holm-adjusted for the number of pairs).
+
+    Example:
+
+        llm-runner report results/cache.db --suite my-suite.yaml --ci --seed 42
+
+    """
+    store = Store(store_path)
+    suite = load_suite(suite_path) if suite_path else None
+    matrix = ScoreMatrix.from_store(store, suite)
+    store.close()
+    logger.info(f"Score matrix: {len(matrix.cases)} cases x {len(matrix.configs)} configurations")
+    if ci:
+        by_config = confidence_intervals(matrix, n_resamples=resamples, confidence=confidence, seed=seed)
+    else:
+        by_config = summarize_configs(matrix)
+    by_config = by_config.sort_values("mean", ascending=False)
+    with pd.option_context("display.max_rows", None, "display.width", None):
+        typer.echo(by_config.to_string(index=False))
+        comparisons = None
+        if ci:
+            comparisons = compare_configs(matrix, n_resamples=resamples, confidence=confidence, seed=seed)
+            typer.echo("")
+            typer.echo(comparisons.sort_values("p_value").to_string(index=False))
+    if output_directory:
+        output_directory.mkdir(parents=True, exist_ok=True)
+        by_config.to_csv(output_directory / "by_config.csv", index=False)
+        if comparisons is not None:
+            comparisons.to_csv(output_directory / "comparisons.csv", index=False)
+
+
+@app.command()
+def diff(
+    store_path: Path = typer.Argument(
+        ...,
+        exists=True,
+        help="Path to the store of the first run"
+    ),
+    other_store_path: Optional[Path] = typer.Argument(
+        None,
+        exists=True,
+        help="Path to the store of the second run; defaults to the same store, comparing two suite versions"
+    ),
+    suite_path: Optional[Path] = typer.Option(
+        None,
+        "--suite", "-s",
+        exists=True,
+        help="Only compare the results of this suite"
+    ),
+    from_version: Optional[str] = typer.Option(
+        None,
+        "--from",
+        help="Suite version of the first run (defaults to the version in the suite file)"
+    ),
+    to_version: Optional[str] = typer.Option(
+        None,
+        "--to",
+        help="Suite version of the second run (defaults to the version in the suite file)"
+    ),
+    limit: int = typer.Option(
+        20,
+        "--limit", "-n",
+        help="Number of changed cases to show"
+    ),
+    responses: bool = typer.Option(
+        False,
+        "--responses",
+        help="Also list cases whose response text changed but whose score did not"
+    ),
+    output_directory: Optional[Path] = output_dir_option,
+):
+    """
+    Show what changed between two runs: per-model score deltas, and the cases that flipped.
+
+    Results are matched on case and hyperparameters inside the database.
+    Deltas are the second run minus the first, with a 95% interval and a
+    paired sign test p-value (Holm-adjusted over the models).
+
+    Example:
+
+        llm-runner diff before.db after.db
+        llm-runner diff cache.db --suite my-suite.yaml --from 1 --to 2 -D diff-output
+
+    """
+    suite = load_suite(suite_path) if suite_path else None
+    if suite is None and (from_version or to_version):
+        raise typer.BadParameter("Versions need a suite", param_hint="--suite")
+    name = suite.name if suite else None
+    suite_a = version_key(name, from_version or (suite.version if suite else None))
+    suite_b = version_key(name, to_version or (suite.version if suite else None))
+    if other_store_path is None and (suite_a is None or suite_a == suite_b):
+        raise typer.BadParameter("Give a second store, or two suite versions with --from and --to")
+    store = Store(store_path)
+    with RunDiff(store, other_store_path, suite_a=suite_a, suite_b=suite_b) as run_diff:
+        by_model = run_diff.by_model()
+        changed = run_diff.changed_cases(limit=limit, responses=responses)
+        with pd.option_context("display.max_rows", None, "display.width", None, "display.max_colwidth", 60):
+            typer.echo(by_model.to_string(index=False))
+            if len(changed):
+                typer.echo("")
+                typer.echo(changed.drop(columns=["response_a", "response_b"]).to_string(index=False))
+        if output_directory:
+            output_directory.mkdir(parents=True, exist_ok=True)
+            by_model.to_csv(output_directory / "by_model.csv", index=False)
+            run_diff.write_changed_cases(output_directory / "changed.tsv", responses=responses)
+    store.close()
+
+
+
+@app.command()
+def serve(
+    store_path: Path = typer.Option(
+        Path("results") / "cache.db",
+        "--store-path", "-s",
+        help="Path to the cache store"
+    ),
+    runner_config_path: Optional[Path] = typer.Option(None, "--runner-config", "-C", help="Path to the runner config"),
+    host: str = typer.Option(DEFAULT_HOST, "--host", help="Host to listen on"),
+    port: int = typer.Option(DEFAULT_PORT, "--port", help="Port to listen on"),
+    socket_path: Optional[Path] = typer.Option(
+        None,
+        "--socket",
+        help="Listen on this Unix socket instead of a TCP port"
+    ),
+):
+    """
+    Serve evaluations from a long-running process.
+
+    The runner, its store and its models stay loaded between jobs, so small
+    jobs submitted with the submit command return quickly.
+
+    Example:
+
+        llm-runner serve -s my-store.db -C runner-config.yaml
+
+    """
+    runner = LLMRunner(store_path=store_path, config=load_runner_config(runner_config_path))
+    server = make_server(runner, host=host, port=port, socket_path=socket_path)
+    where = f"unix://{socket_path.absolute()}" if socket_path else f"http://{host}:{server.server_address[1]}"
+    typer.echo(f"Serving {store_path} on {where}", err=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path and socket_path.exists():
+            socket_path.unlink()
+
+
+@app.command()
+def submit(
+    suite_paths: List[Path] = typer.Argument(
+        ...,
+        exists=True,
+        help="Paths to eval suite yamls, or manifests listing them"
+    ),
+    server_url: str = typer.Option(
+        DEFAULT_SERVER_URL,
+        "--server",
+        help="Server to submit to, http://host:port or unix:///path/to/socket"
+    ),
+    output_file: Optional[Path] = output_file_option,
+    output_format: str = typer.Option(
+        "tsv",
+        "--output-format",
+        "-F",
+        help="Output format",
+    ),
+    verbose: bool = typer.Option(
+        False,
+        "--verbose",
+        help="Print every result as it arrives"
+    ),
+):
+    """
+    Submit suites to a server started with the serve command.
+
+    Results are the same as from the run command, but the store and models
+    of the server are used.
+
+    Example:
+
+        llm-runner submit my-conf.yaml -o results.tsv
+
+    """
+    suites = load_suites(suite_paths)
+    if len(suites) > 1 and output_file:
+        raise typer.BadParameter("Cannot write several suites to one file", param_hint="--output-file")
+    for _, suite in suites:
+        results = ResultSet()
+        source_keys = set()
+        try:
+            for r in submit_results(suite, server_url):
+                results.append(r)
+                if verbose:
+                    print(f"## {r.score} {r.case.input} :: ideal= {r.case.ideal} :: resp= {r.response.text}")
+                if r.case.original_input:
+                    source_keys.update(r.case.original_input.keys())
+        except (ConnectionError, RuntimeError, ValueError) as e:
+            typer.echo(f"Suite {suite.name}: {e}", err=True)
+            raise typer.Exit(1)
+        if len(suites) > 1:
+            typer.echo(f"# {suite.name}")
+        write_results(results, source_keys, output_file, output_format, None)
+
+
+queue_app = typer.Typer(help="Share the cells of a run between worker processes through a queue file.")
+app.add_typer(queue_app, name="queue")
+
+
+@queue_app.command("init")
+def queue_init(
+    queue_path: Path = typer.Argument(..., help="Queue file to create or add to, e.g. on shared storage"),
+    suite_paths: List[Path] = typer.Argument(..., exists=True, help="Paths to eval suite yamls, or manifests"),
+):
+    """
+    Add the cells of suites to a work queue.
+
+    Example:
+
+        llm-runner queue init my-run.queue my-conf.yaml
+
+    """
+    queue = WorkQueue(queue_path)
+    for _, suite in load_suites(suite_paths):
+        try:
+            n = queue.add_suite(suite)
+        except ValueError as e:
+            typer.echo(str(e), err=True)
+            raise typer.Exit(1)
+        typer.echo(f"Queued {n} cells of {suite.name}")
+
+
+@queue_app.command("work")
+def queue_work(
+    queue_path: Path = typer.Argument(..., exists=True, help="Queue file"),
+    store_path: Optional[Path] = typer.Option(
+        None,
+        "--store-path", "-s",
+        help="Store for this worker's results. Defaults to a store named after the worker, next to the queue"
+    ),
+    runner_config_path: Optional[Path] = typer.Option(None, "--runner-config", "-C", help="Path to the runner config"),
+    name: Optional[str] = typer.Option(None, "--name", help="Worker name; defaults to host name and process id"),
+    lease: float = typer.Option(DEFAULT_LEASE_SECONDS, "--lease", help="Seconds a claim lasts unless renewed"),
+    claim_size: int = typer.Option(DEFAULT_CLAIM_SIZE, "--claim-size", help="Number of cells claimed at a time"),
+    max_attempts: int = typer.Option(
+        DEFAULT_MAX_ATTEMPTS,
+        "--max-attempts",
+        help="Give up on a cell after this many failures (with continue_on_error)"
+    ),
+    wait: bool = typer.Option(
+        True,
+        "--wait/--no-wait",
+        help="When nothing is left to claim, wait for the cells other workers hold, in case they die"
+    ),
+):
+    """
+    Process cells from a work queue until it is empty.
+
+    Start as many workers as needed, on one or more machines. Each worker
+    holds leases on the few cells it is working on; if it dies, its cells
+    are picked up by the others once the leases expire.
+
+    Example:
+
+        llm-runner queue work my-run.queue -C runner-config.yaml
+
+    """
+    name = name or default_worker_name()
+    queue = WorkQueue(queue_path, lease_seconds=lease)
+    if not store_path:
+        store_path = queue_path.parent / f"{queue_path.stem}.worker-{name}.db"
+    runner = LLMRunner(store_path=store_path, config=load_runner_config(runner_config_path))
+    n = run_worker(queue, runner, owner=name, claim_size=claim_size, max_attempts=max_attempts, wait=wait)
+    typer.echo(f"Worker {name} completed {n} cells", err=True)
 
 
+@queue_app.command("status")
+def queue_status(
+    queue_path: Path = typer.Argument(..., exists=True, help="Queue file"),
+):
+    """
+    Show how many cells of a work queue are pending, leased, done or failed.
+    """
+    queue = WorkQueue(queue_path)
+    typer.echo(" ".join(f"{state}: {n}" for state, n in queue.counts().items()))
+    for key, params, error in queue.errors():
+        typer.echo(f"failed: {key} {params}: {error}")
+
+
+@queue_app.command("collect")
+def queue_collect(
+    queue_path: Path = typer.Argument(..., exists=True, help="Queue file"),
+    output_path: Path = typer.Option(..., "--output", "-o", help="Store to merge the workers' results into"),
+):
+    """
+    Merge the stores of all workers of a queue into one.
+
+    Running the suites with the merged store then writes the usual outputs
+    without calling any model.
+
+    Example:
+
+        llm-runner queue collect my-run.queue -o my-conf.db
+        llm-runner run my-conf.yaml -s my-conf.db
+
+    """
+    queue = WorkQueue(queue_path)
+    counts = queue.counts()
+    if counts[PENDING] or counts[LEASED]:
+        typer.echo(f"Queue is not finished ({counts[PENDING]} pending, {counts[LEASED]} leased)", err=True)
+    store = queue.collect(output_path)
+    typer.echo(f"Collected {store.size} results into {output_path}")
+    store.close()
 
 # DO NOT REMOVE THIS LINE
 # added this for mkdocstrings to work
@@ -0,0 +1,209 @@
+"""
+Convert tabular data (CSV, TSV, Parquet) into suite test cases.
+
+Rows are read in chunks through DuckDB and written out as they are
+converted, so sources with millions of rows are converted in bounded
+memory. One column becomes the case ``input``, optionally another the
+``ideal``, and the remaining columns are kept in ``original_input``, where
+templates can refer to them.
+
+CSV and TSV columns are read as text, so values such as identifiers with
+leading zeros are kept as written.
+"""
+import json
+import logging
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO, Union
+
+import duckdb
+import yaml
+
+from llm_matrix.schema import TestCase
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 10_000
+
+TSV_SUFFIXES = (".tsv", ".tab")
+PARQUET_SUFFIXES = (".parquet", ".pq")
+COMPRESSION_SUFFIXES = (".gz", ".zst")
+
+
+def _table_function(path: Path) -> str:
+    """The DuckDB table function that reads a file, chosen by its suffix."""
+    suffixes = [s.lower() for s in path.suffixes if s.lower() not in COMPRESSION_SUFFIXES]
+    suffix = suffixes[-1] if suffixes else ""
+    if suffix in PARQUET_SUFFIXES:
+        return "read_parquet(?)"
+    if suffix in TSV_SUFFIXES:
+        return "read_csv(?, delim='\t', header=true, all_varchar=true)"
+    return "read_csv(?, header=true, all_varchar=true)"
+
+
+def iter_rows(path: Union[str, Path], chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+    """
+    Iterate over the rows of a CSV, TSV or Parquet file as dicts.
+
+    :param path: file to read; CSV and TSV files may be compressed
+    :param chunk_size: number of rows held in memory at a time
+    :return:
+    """
+    path = Path(path)
+    conn = duckdb.connect()
+    try:
+        cursor = conn.execute(f"SELECT * FROM {_table_function(path)}", [str(path)])
+        columns = [d[0] for d in cursor.description]
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(zip(columns, row))
+    finally:
+        conn.close()
+
+
+def row_to_case(row: Dict[str, Any], source_field: str, target_field: Optional[str] = None) -> TestCase:
+    """
+    Make a test case from a row.
+
+    Example:
+
+        >>> case = row_to_case({"question": "1+1?", "answer": "2", "topic": "math", "note": None}, "question", "answer")
+        >>> case.input, case.ideal, case.original_input
+        ('1+1?', '2', {'topic': 'math'})
+
+    :param row:
+    :param source_field: column for the case input
+    :param target_field: column for the ideal output, if any
+    :return:
+    """
+    if source_field not in row:
+        raise ValueError(f"Source column {source_field} not in {list(row)}")
+    if target_field and target_field not in row:
+        raise ValueError(f"Target column {target_field} not in {list(row)}")
+    ideal = row[target_field] if target_field else None
+    original_input = {
+        k: _plain(v) for k, v in row.items() if k not in (source_field, target_field) and v is not None
+    }
+    return TestCase(
+        input=str(row[source_field]),
+        ideal=str(ideal) if ideal is not None else None,
+        original_input=original_input or None,
+    )
+
+
+def _plain(value: Any) -> Any:
+    """Keep values that serialize as-is; render others (e.g. dates, decimals) as text."""
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def convert_files(
+    input_paths: Iterable[Union[str, Path]],
+    source_field: str,
+    target_field: Optional[str] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Iterator[TestCase]:
+    """
+    Convert the rows of one or more files to test cases, lazily.
+
+    Rows without a value in the source column are skipped.
+
+    :param input_paths:
+    :param source_field: column for the case input
+    :param target_field: column for the ideal output, if any
+    :param chunk_size: number of rows held in memory at a time
+    :return:
+    """
+    for path in input_paths:
+        skipped = 0
+        for row in iter_rows(path, chunk_size=chunk_size):
+            if row.get(source_field) is None and source_field in row:
+                skipped += 1
+                continue
+            yield row_to_case(row, source_field, target_field)
+        if skipped:
+            logger.warning(f"Skipped {skipped} rows of {path} without {source_field}")
+
+
+def write_cases(
+    cases: Iterable[TestCase],
+    output: TextIO,
+    syntax: str = "yaml",
+    header: Optional[Dict[str, Any]] = None,
+) -> int:
+    """
+    Write test cases as they are produced.
+
+    In YAML, the cases are written under ``cases:``, after the other keys of
+    the suite given as ``header``, so the output can be loaded with
+    :func:`llm_matrix.schema.load_suite` once it has a name and matrix. In
+    JSON Lines, each case is a line and the header is ignored.
+
+    Example:
+
+        >>> import io
+        >>> out = io.StringIO()
+        >>> write_cases([TestCase(input="1+1?", ideal="2")], out, header={"name": "math"})
+        1
+        >>> print(out.getvalue())
+        name: math
+        cases:
+        - input: 1+1?
+          ideal: '2'
+        <BLANKLINE>
+
+    :param cases:
+    :param output:
+    :param syntax: ``yaml`` or ``jsonl``
+    :param header: other suite keys, for YAML
+    :return: number of cases written
+    """
+    if syntax not in ("yaml", "jsonl"):
+        raise ValueError(f"Cannot write cases as {syntax}")
+    n = 0
+    if syntax == "yaml":
+        header = {k: v for k, v in (header or {}).items() if k != "cases"}
+        if header:
+            yaml.safe_dump(header, output, sort_keys=False)
+    for case in cases:
+        obj = case.model_dump(exclude_none=True)
+        if syntax == "yaml":
+            if not n:
+                output.write("cases:\n")
+            yaml.safe_dump([obj], output, sort_keys=False, allow_unicode=True)
+        else:
+            output.write(json.dumps(obj) + "\n")
+        n += 1
+    if syntax == "yaml" and not n:
+        output.write("cases: []\n")
+    return n
+
+
+def convert(
+    input_paths: List[Union[str, Path]],
+    output: TextIO,
+    source_field: str,
+    target_field: Optional[str] = None,
+    syntax: str = "yaml",
+    header: Optional[Dict[str, Any]] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> int:
+    """
+    Convert tabular files to a suite cases file.
+
+    :param input_paths:
+    :param output:
+    :param source_field: column for the case input
+    :param target_field: column for the ideal output, if any
+    :param syntax: ``yaml`` or ``jsonl``
+    :param header: other suite keys, for YAML
+    :param chunk_size: number of rows held in memory at a time
+    :return: number of cases written
+    """
+    cases = convert_files(input_paths, source_field, target_field, chunk_size=chunk_size)
+    n = write_cases(cases, output, syntax=syntax, header=header)
+    logger.info(f"Converted {n} cases")
+    return n
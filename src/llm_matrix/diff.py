@@ -0,0 +1,223 @@
+"""
+Differences between two runs: two stores, or two versions of a suite in one store.
+
+Results are joined inside DuckDB on their key (suite, case input and ideal,
+hyperparameters and replicate), so that even stores with millions of results
+are compared without loading them: only per-model aggregates, and the changed
+cases asked for, are returned. Differences are the second run minus the first.
+"""
+import logging
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from llm_matrix.analytics import holm, sign_test
+from llm_matrix.store import Store
+
+logger = logging.getLogger(__name__)
+
+OTHER_ALIAS = "diff_other"
+ALL_MODELS = "(all)"
+Z_95 = 1.959964
+
+CHANGED_COLUMNS = [
+    "suite_name", "test_case", "ideal", "hyperparameters", "replicate", "model",
+    "score_a", "score_b", "delta", "response_changed", "response_a", "response_b",
+]
+
+
+@dataclass
+class RunDiff:
+    """
+    Compare the results of two runs.
+
+    Example:
+
+        >>> from llm_matrix.schema import Response, Suite, TestCase, TestCaseResult
+        >>> store = Store(None)
+        >>> cases = [TestCase(input=f"q{i}", ideal="YES") for i in range(3)]
+        >>> for version, scores in [("1", [1.0, 0.0, 1.0]), ("2", [1.0, 1.0, 0.0])]:
+        ...     suite = Suite(name="s", version=version, cases=cases, matrix={"hyperparameters": {}})
+        ...     store.add_results(suite, [
+        ...         TestCaseResult(case=case, response=Response(text=str(score)), hyperparameters={"model": "m1"},
+        ...                        score=score)
+        ...         for case, score in zip(cases, scores)
+        ...     ])
+        >>> diff = RunDiff(store, suite_a="s--1", suite_b="s--2")
+        >>> diff.changed_cases()[["test_case", "score_a", "score_b"]].values.tolist()
+        [['q1', 0.0, 1.0], ['q2', 1.0, 0.0]]
+        >>> diff.by_model()[["model", "n", "delta", "improved", "regressed"]].values.tolist()
+        [['m1', 3, 0.0, 1, 1], ['(all)', 3, 0.0, 1, 1]]
+
+    :param store: the store of the first run
+    :param other_path: the store of the second run; the same store if None
+    :param suite_a: stored suite name (with version, as in :func:`llm_matrix.store.suite_key`) of the first run
+    :param suite_b: stored suite name of the second run; results of
+        different suite names are only joined when both are given
+    """
+    store: Store
+    other_path: Optional[Union[str, Path]] = None
+    suite_a: Optional[str] = None
+    suite_b: Optional[str] = None
+    _attached: bool = field(default=False, init=False, repr=False)
+
+    def __post_init__(self):
+        if self.other_path is not None:
+            # opening brings the other store up to the current layout
+            Store(self.other_path).close()
+            escaped_path = str(self.other_path).replace("'", "''")
+            self.store._conn.execute(f"ATTACH '{escaped_path}' AS {OTHER_ALIAS} (READ_ONLY)")
+            self._attached = True
+
+    def close(self):
+        """Detach the other store."""
+        if self._attached:
+            self.store._conn.execute(f"DETACH {OTHER_ALIAS}")
+            self._attached = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _joined(self) -> str:
+        """A query joining the results of the two runs, one row per key in either."""
+        other_table = f"{OTHER_ALIAS}.results" if self._attached else "results"
+        same_suite = self.suite_a is None or self.suite_b is None
+        on = " AND ".join(
+            f"a.{column} = b.{column}"
+            for column in (["suite_name"] if same_suite else []) + ["test_case", "ideal", "hyperparameters", "replicate"]
+        )
+
+        def side(table: str, suite: Optional[str]) -> str:
+            where = f"WHERE suite_name = '{_escape(suite)}'" if suite is not None else ""
+            return f"""
+                SELECT suite_name, test_case, ideal, hyperparameters, replicate, model, score, response_text
+                FROM {table} {where}
+            """
+
+        return f"""
+            SELECT
+                coalesce(a.suite_name, b.suite_name) AS suite_name,
+                coalesce(a.test_case, b.test_case) AS test_case,
+                coalesce(a.ideal, b.ideal) AS ideal,
+                CAST(coalesce(a.hyperparameters, b.hyperparameters) AS VARCHAR) AS hyperparameters,
+                coalesce(a.replicate, b.replicate) AS replicate,
+                coalesce(a.model, b.model, '') AS model,
+                a.test_case IS NOT NULL AS in_a,
+                b.test_case IS NOT NULL AS in_b,
+                a.score AS score_a,
+                b.score AS score_b,
+                a.response_text AS response_a,
+                b.response_text AS response_b
+            FROM ({side("results", self.suite_a)}) a
+            FULL OUTER JOIN ({side(other_table, self.suite_b)}) b ON {on}
+        """
+
+    def changed_cases(self, limit: Optional[int] = None, responses: bool = False) -> pd.DataFrame:
+        """
+        Results in both runs whose score changed, largest changes first.
+
+        :param limit: at most this many
+        :param responses: also list results whose score is the same but whose response text changed
+        :return: with the columns of :data:`CHANGED_COLUMNS`
+        """
+        return self.store.query(self._changed_sql(limit, responses))
+
+    def write_changed_cases(self, path: Union[str, Path], responses: bool = False, delimiter: str = "\t"):
+        """
+        Write all changed results to a file, from the database.
+
+        :param path:
+        :param responses: also write results whose response text changed
+        :param delimiter:
+        :return:
+        """
+        self.store._conn.execute(
+            f"COPY ({self._changed_sql(None, responses)}) TO '{_escape(str(path))}' "
+            f"(HEADER, DELIMITER '{_escape(delimiter)}')"
+        )
+
+    def _changed_sql(self, limit: Optional[int], responses: bool) -> str:
+        condition = "score_a IS DISTINCT FROM score_b"
+        if responses:
+            condition += " OR response_a IS DISTINCT FROM response_b"
+        return f"""
+            SELECT
+                suite_name, test_case, ideal, hyperparameters, replicate, model,
+                score_a, score_b, score_b - score_a AS delta,
+                response_a IS DISTINCT FROM response_b AS response_changed,
+                response_a, response_b
+            FROM ({self._joined()})
+            WHERE in_a AND in_b AND ({condition})
+            ORDER BY abs(coalesce(score_b, 0) - coalesce(score_a, 0)) DESC, suite_name, test_case, hyperparameters,
+                     replicate
+            {f"LIMIT {int(limit)}" if limit is not None else ""}
+        """
+
+    def by_model(self, confidence_z: float = Z_95) -> pd.DataFrame:
+        """
+        Per-model change of the mean score on the results scored in both runs, and over all models.
+
+        The interval of the mean difference uses the normal approximation, and
+        the p-value a paired sign test of the cases that went up against those
+        that went down; ``p_adjusted`` corrects for the number of models (Holm).
+        ``added`` and ``removed`` count results only in the second or the first run.
+
+        :param confidence_z: z value of the interval, 1.96 for 95%
+        :return: one row per model, then one for all models
+        """
+        paired = "in_a AND in_b AND score_a IS NOT NULL AND score_b IS NOT NULL"
+        df = self.store.query(f"""
+            SELECT
+                CASE WHEN grouping(model) = 1 THEN '{ALL_MODELS}' ELSE model END AS model,
+                count(*) FILTER ({paired}) AS n,
+                avg(score_a) FILTER ({paired}) AS mean_a,
+                avg(score_b) FILTER ({paired}) AS mean_b,
+                avg(score_b - score_a) FILTER ({paired}) AS delta,
+                stddev_samp(score_b - score_a) FILTER ({paired}) AS std,
+                count(*) FILTER ({paired} AND score_b > score_a) AS improved,
+                count(*) FILTER ({paired} AND score_b < score_a) AS regressed,
+                count(*) FILTER (in_a AND in_b AND response_a IS DISTINCT FROM response_b) AS responses_changed,
+                count(*) FILTER (NOT in_a) AS added,
+                count(*) FILTER (NOT in_b) AS removed
+            FROM ({self._joined()})
+            GROUP BY GROUPING SETS ((model), ())
+            ORDER BY grouping(model), model
+        """)
+        for column in ("n", "improved", "regressed", "responses_changed", "added", "removed"):
+            df[column] = df[column].astype(int)
+        half_width = confidence_z * df["std"] / np.sqrt(df["n"].where(df["n"] > 0))
+        p_values = np.array([sign_test(i, r) for i, r in zip(df["improved"], df["regressed"])], dtype=float)
+        models = (df["model"] != ALL_MODELS).to_numpy()
+        p_adjusted = np.full(len(df), np.nan)
+        p_adjusted[models] = holm(p_values[models])
+        p_adjusted[~models] = p_values[~models]
+        return df.assign(
+            ci_low=df["delta"] - half_width,
+            ci_high=df["delta"] + half_width,
+            p_value=p_values,
+            p_adjusted=p_adjusted,
+        )
+
+
+def _escape(value: str) -> str:
+    return value.replace("'", "''")
+
+
+def version_key(suite: Optional[str], version: Optional[str]) -> Optional[str]:
+    """
+    The stored suite name of a suite version, as :func:`llm_matrix.store.suite_key` makes it.
+
+    >>> version_key("genes", "2")
+    'genes--2'
+    >>> version_key("genes", None)
+    'genes'
+    """
+    if suite is None:
+        return None
+    return f"{suite}--{version}" if version else suite
@@ -0,0 +1,278 @@
+"""
+Estimate the calls, tokens, cost and time of a suite run without calling any model.
+
+The estimate starts from the plan (see :mod:`llm_matrix.planner`), so cells
+already in the store cost nothing. For each cell to generate, input tokens
+are estimated from the rendered prompts, and output tokens from the mean
+length of the model's stored responses. Cells with LLM-based metrics add
+judge calls, and models with the citeseek plugin add retrieval calls. With
+``evaluation_cascade``, the judge calls of cells to generate are weighted by
+the share of the model's stored responses that the local checks cannot decide.
+
+Token counts use a character-based approximation, which is close enough for
+budgeting without depending on a provider tokenizer. Abstracts retrieved by
+plugins at prompt time are not included in the input tokens.
+"""
+import logging
+import math
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional
+
+import pandas as pd
+from pydantic import Field
+
+from llm_matrix.planner import Action
+from llm_matrix.schema import StrictBaseModel
+from llm_matrix.store import suite_key
+from llm_matrix.utils import Cell
+
+if TYPE_CHECKING:
+    from llm_matrix.runner import LLMRunner
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4
+DEFAULT_OUTPUT_TOKENS = 256
+JUDGE_OUTPUT_TOKENS = 32
+CASCADE_SAMPLE_SIZE = 1000
+
+CALL_COLUMNS = [
+    "case_input", "hyperparameters", "action", "kind", "model", "provider",
+    "calls", "input_tokens", "output_tokens", "cost", "seconds",
+]
+
+
+class ModelPrice(StrictBaseModel):
+    """Price of a model, in currency units per million tokens."""
+    input: float = Field(..., description="Price per million input tokens")
+    output: float = Field(..., description="Price per million output tokens")
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """
+    Approximate the number of tokens in a text.
+
+    Example:
+
+        >>> estimate_tokens("What is the capital of France?")
+        8
+        >>> estimate_tokens(None)
+        0
+
+    :param text:
+    :return:
+    """
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def estimate_calls(runner: "LLMRunner", cells: Iterable[Cell]) -> pd.DataFrame:
+    """
+    Estimate the model calls needed for planned cells, one row per call kind per cell.
+
+    Kinds are ``generate`` (the model under test), ``judge`` (the evaluation
+    model, once per LLM-based metric) and ``retrieval`` (citeseek searches,
+    which are not priced). Cost is NaN for models without a price in the
+    runner config, and seconds is NaN for models without recorded latency.
+
+    With ``evaluation_cascade``, rescored cells whose stored response the local
+    checks decide need no judge call. For generated cells, the judge calls are
+    expected values: each is weighted by the share of stored responses of the
+    same model (in the same suite if it has any) that the checks do not decide,
+    so calls and tokens may be fractional. A model without stored responses
+    counts every judge call.
+
+    :param runner: runner whose store, config and models are used
+    :param cells: cells planned with :meth:`LLMRunner.plan`
+    :return:
+    """
+    from llm_matrix.metrics import DEFAULT_EVALUATION_MODEL_NAME, CascadeEvaluator, LLMBasedEvaluator, get_evaluator
+    store = runner._get_store()
+    latencies = store.model_latencies()
+    output_tokens = {
+        model: math.ceil(chars / CHARS_PER_TOKEN) for model, chars in store.model_response_lengths().items()
+    }
+    prices = runner.config.model_prices if runner.config and runner.config.model_prices else {}
+    judge_model = DEFAULT_EVALUATION_MODEL_NAME
+    if runner.config and runner.config.evaluation_model_name:
+        judge_model = runner.config.evaluation_model_name
+    rows = []
+    settled: Dict[tuple, float] = {}
+
+    def settle_rate(cell: Cell, metric: str, evaluator: CascadeEvaluator) -> float:
+        # share of stored responses of the cell's model the local checks decide
+        model_name = str(cell.hyperparameters.get("model"))
+        key = (cell.suite.name, model_name, metric)
+        if key not in settled:
+            responses = store.model_responses(model_name, suite_key(cell.suite), limit=CASCADE_SAMPLE_SIZE)
+            if not responses:
+                responses = store.model_responses(model_name, limit=CASCADE_SAMPLE_SIZE)
+            decided = sum(1 for text, ideal in responses if evaluator.decide(text, ideal))
+            settled[key] = decided / len(responses) if responses else 0.0
+        return settled[key]
+
+    def add(cell: Cell, kind: str, model: str, calls: float, input_tokens: float, out_tokens: float, provider=None):
+        price = prices.get(model)
+        cost = float("nan")
+        if price:
+            cost = (input_tokens * price.input + out_tokens * price.output) / 1_000_000
+        elif kind == "retrieval":
+            cost = 0.0
+        latency = latencies.get(model)
+        rows.append({
+            "case_input": cell.case.input,
+            "hyperparameters": "_".join(f"{k}={v}" for k, v in cell.hyperparameters.items()),
+            "action": cell.action.value,
+            "kind": kind,
+            "model": model,
+            "provider": provider or model,
+            "calls": calls,
+            "input_tokens": input_tokens,
+            "output_tokens": out_tokens,
+            "cost": cost,
+            "seconds": latency * calls if latency is not None else float("nan"),
+        })
+
+    for cell in cells:
+        if cell.action not in (Action.GENERATE, Action.RESCORE):
+            continue
+        model_name = str(cell.hyperparameters.get("model"))
+        template = runner.get_template(cell.case, cell.suite)
+        if cell.action == Action.GENERATE:
+            actual_params = runner.resolve_parameters(cell.hyperparameters)
+            model = runner.get_aimodel(actual_params, suite=cell.suite)
+            prompt, system = model.render(cell.case.input, template=template, case=cell.case)
+            response_tokens = output_tokens.get(model_name, DEFAULT_OUTPUT_TOKENS)
+            add(cell, "generate", model_name, 1, estimate_tokens(prompt) + estimate_tokens(system),
+                response_tokens, provider=_provider(runner, cell))
+            model_info = cell.suite.models.get(model_name) if cell.suite.models else None
+            if model_info and "citeseek" in (model_info.plugins or []):
+                add(cell, "retrieval", "citeseek", 1, 0, 0)
+            response_text = "x" * (response_tokens * CHARS_PER_TOKEN)
+        else:
+            response_text = cell.result.response.text
+        judges = []
+        for metric in (template.metrics or []) if template else []:
+            evaluator = get_evaluator(metric, runner)
+            weight = 1.0
+            if isinstance(evaluator, CascadeEvaluator):
+                if cell.action == Action.RESCORE:
+                    if evaluator.decide(response_text, cell.case.ideal):
+                        continue
+                else:
+                    weight = 1.0 - settle_rate(cell, metric, evaluator)
+                evaluator = evaluator.evaluator
+            if isinstance(evaluator, LLMBasedEvaluator) and weight > 0:
+                judges.append((evaluator, weight))
+        if judges:
+            input_tokens = sum(
+                weight * (
+                    estimate_tokens(e.system_prompt)
+                    + estimate_tokens(e._format_user_input(response_text, cell.case.ideal))
+                )
+                for e, weight in judges
+            )
+            calls = sum(weight for _, weight in judges)
+            add(cell, "judge", judge_model, calls, input_tokens, JUDGE_OUTPUT_TOKENS * calls)
+    return pd.DataFrame(rows, columns=CALL_COLUMNS)
+
+
+def _provider(runner: "LLMRunner", cell: Cell) -> str:
+    try:
+        return runner.provider(cell) or str(cell.hyperparameters.get("model"))
+    except Exception as e:
+        # e.g. no API key configured; estimating should still work
+        logger.info(f"Cannot determine provider for {cell.hyperparameters}: {e}")
+        return str(cell.hyperparameters.get("model"))
+
+
+def summarize_calls(calls: pd.DataFrame) -> pd.DataFrame:
+    """
+    Total the estimated calls per kind and model.
+
+    The cost of a group is NaN if any of its calls is unpriced.
+
+    :param calls: output of :func:`estimate_calls`
+    :return:
+    """
+    return (
+        calls.groupby(["kind", "model"])
+        .agg(
+            calls=("calls", "sum"),
+            input_tokens=("input_tokens", "sum"),
+            output_tokens=("output_tokens", "sum"),
+            cost=("cost", lambda c: c.sum(min_count=len(c))),
+            seconds=("seconds", lambda c: c.sum(min_count=len(c))),
+        )
+        .reset_index()
+    )
+
+
+def estimate_wall_clock(runner: "LLMRunner", calls: pd.DataFrame) -> Optional[float]:
+    """
+    Project the wall-clock time of a run from recorded latencies.
+
+    Providers are called concurrently, each with its own workers, and judge
+    calls overlap with generation, so the run takes as long as the busiest
+    of these.
+
+    :param runner:
+    :param calls: output of :func:`estimate_calls`
+    :return: seconds, or None if a model has no recorded latency
+    """
+    if calls.empty:
+        return 0.0
+    timed = calls[calls["kind"] != "retrieval"]
+    if timed["seconds"].isna().any():
+        return None
+    config = runner.config
+    spans: List[float] = []
+    generation = timed[timed["kind"] == "generate"]
+    for provider, seconds in generation.groupby("provider")["seconds"].sum().items():
+        spans.append(seconds / runner._provider_workers(provider))
+    judge_seconds = timed[timed["kind"] == "judge"]["seconds"].sum()
+    if judge_seconds:
+        from llm_matrix.metrics import DEFAULT_EVALUATION_CONCURRENCY
+        workers = (config.evaluation_workers if config and config.evaluation_workers else 1)
+        concurrency = (
+            config.evaluation_concurrency if config and config.evaluation_concurrency else DEFAULT_EVALUATION_CONCURRENCY
+        )
+        spans.append(judge_seconds / (workers * concurrency))
+    return max(spans) if spans else 0.0
+
+
+def count_actions(cells: Iterable[Cell]) -> pd.DataFrame:
+    """
+    Count planned cells per model and action.
+
+    :param cells:
+    :return: one row per model, one column per action
+    """
+    df = pd.DataFrame(
+        [{"model": str(c.hyperparameters.get("model")), "action": c.action.value} for c in cells],
+        columns=["model", "action"],
+    )
+    counts = df.groupby(["model", "action"]).size().unstack(fill_value=0)
+    return counts.reindex(columns=[a.value for a in Action], fill_value=0).reset_index()
+
+
+def check_budget(calls: pd.DataFrame, budget: float) -> Dict[str, object]:
+    """
+    Check an estimate against a budget.
+
+    Example:
+
+        >>> calls = pd.DataFrame({"model": ["a", "b"], "kind": ["generate", "generate"], "cost": [1.5, 2.0]})
+        >>> check_budget(calls, 5.0)["ok"]
+        True
+        >>> check_budget(calls, 3.0)["ok"]
+        False
+
+    :param calls: output of :func:`estimate_calls`
+    :param budget:
+    :return: dict with ``ok``, the estimated ``cost``, and ``unpriced`` models
+    """
+    priced = calls[calls["kind"] != "retrieval"]
+    unpriced = sorted(priced[priced["cost"].isna()]["model"].unique())
+    cost = float(priced["cost"].sum())
+    return {"ok": not unpriced and cost <= budget, "cost": cost, "unpriced": unpriced}
@@ -0,0 +1,213 @@
+"""
+Deadlines and hedged requests for model calls.
+
+A few slow provider calls can decide how long a whole run takes. A
+:class:`RequestHedger` runs each call in its own thread, so that it can:
+
+- give up on a call after a deadline, failing it with :class:`DeadlineExceeded`
+- hedge: if a call has not returned after the model's observed latency
+  quantile (by default p95), send a duplicate request; whichever response
+  arrives first wins, and the other is cancelled. Hedges are capped at a
+  fraction of the calls made, so a slow provider is not sent twice the traffic.
+
+Python threads cannot be interrupted: a cancelled call stops reading its
+response at the next chunk, but a call blocked on the provider finishes in
+the background, and its response is discarded.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, List, Optional, TypeVar
+
+from llm_matrix.progress import ProgressTracker
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEDGE_QUANTILE = 0.95
+DEFAULT_HEDGE_BUDGET = 0.1
+DEFAULT_MIN_SAMPLES = 20
+LATENCY_WINDOW = 1000
+"""Number of recent latencies per model the hedge delay is estimated from"""
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(TimeoutError):
+    """A model call did not return before its deadline."""
+
+
+@dataclass
+class _Attempt:
+    future: Future
+    cancel: threading.Event
+
+
+def latency_quantile(latencies: List[float], q: float) -> float:
+    """
+    Quantile of latencies, interpolating linearly.
+
+    >>> latency_quantile([0.1, 0.2, 0.3, 0.4, 1.0], 0.5)
+    0.3
+    >>> latency_quantile([0.1, 0.2, 0.3, 0.4, 1.0], 0.95)
+    0.88
+    """
+    ordered = sorted(latencies)
+    position = q * (len(ordered) - 1)
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return round(ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower), 12)
+
+
+@dataclass
+class RequestHedger:
+    """
+    Apply deadlines and hedging to model calls.
+
+    A call is a function of a cancellation event, which it should check
+    while reading the response. Latencies are tracked per model, from the
+    calls that completed without being cancelled; until ``min_samples``
+    have been seen, the hedge delay falls back to the ``baseline`` latency
+    of the model (e.g. from past runs), and without one, calls are not hedged.
+
+    Example:
+
+        >>> hedger = RequestHedger(timeout=0.1)
+        >>> hedger.call("m1", lambda cancel: "fast")
+        'fast'
+        >>> hedger.call("m1", lambda cancel: cancel.wait(1) and "slow")
+        Traceback (most recent call last):
+        ...
+        llm_matrix.hedging.DeadlineExceeded: m1 did not respond within 0.1s
+    """
+    timeout: Optional[float] = None
+    model_timeouts: Dict[str, float] = field(default_factory=dict)
+    hedge: bool = False
+    quantile: float = DEFAULT_HEDGE_QUANTILE
+    budget: float = DEFAULT_HEDGE_BUDGET
+    min_samples: int = DEFAULT_MIN_SAMPLES
+    baseline: Dict[str, float] = field(default_factory=dict)
+    calls: int = 0
+    hedges: int = 0
+    _latencies: Dict[str, Deque[float]] = field(default_factory=dict, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @property
+    def active(self) -> bool:
+        """True if calls need a deadline or may be hedged."""
+        return self.hedge or self.timeout is not None or bool(self.model_timeouts)
+
+    def deadline(self, model: str) -> Optional[float]:
+        """
+        Seconds a call to a model may take.
+
+        >>> RequestHedger(timeout=60, model_timeouts={"o1": 300}).deadline("o1")
+        300
+        """
+        return self.model_timeouts.get(model, self.timeout)
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """
+        Seconds after which a call to a model is hedged, or None if it is not.
+
+        :param model:
+        :return:
+        """
+        if not self.hedge:
+            return None
+        with self._lock:
+            latencies = self._latencies.get(model)
+            if latencies and len(latencies) >= self.min_samples:
+                return latency_quantile(list(latencies), self.quantile)
+        return self.baseline.get(model)
+
+    def record(self, model: str, latency: float):
+        """
+        Record the latency of a completed call.
+
+        :param model:
+        :param latency: seconds
+        :return:
+        """
+        with self._lock:
+            self._latencies.setdefault(model, deque(maxlen=LATENCY_WINDOW)).append(latency)
+
+    def call(self, model: str, fn: Callable[[threading.Event], T], tracker: Optional[ProgressTracker] = None) -> T:
+        """
+        Call a model, applying its deadline and hedging.
+
+        :param model: name of the model, for its deadline and latencies
+        :param fn: the call, given an event that is set if its response is no longer needed
+        :param tracker: counts hedged and timed out calls
+        :return: the result of the first attempt to succeed
+        """
+        if not self.active:
+            return fn(threading.Event())
+        with self._lock:
+            self.calls += 1
+        timeout = self.deadline(model)
+        delay = self.hedge_delay(model)
+        start = time.monotonic()
+        attempts = [self._start(model, fn)]
+        hedged = False
+        while True:
+            now = time.monotonic()
+            waits = []
+            if timeout is not None:
+                waits.append(start + timeout - now)
+            if delay is not None and not hedged:
+                waits.append(start + delay - now)
+            wait([a.future for a in attempts], timeout=max(0.0, min(waits)) if waits else None,
+                 return_when=FIRST_COMPLETED)
+            winner = next((a for a in attempts if a.future.done() and a.future.exception() is None), None)
+            if winner:
+                break
+            if all(a.future.done() for a in attempts):
+                # every attempt failed; hedges are not retries
+                raise attempts[0].future.exception()
+            now = time.monotonic()
+            if timeout is not None and now >= start + timeout:
+                for attempt in attempts:
+                    attempt.cancel.set()
+                if tracker:
+                    tracker.count_call(model, hedged=len(attempts) > 1, timed_out=True)
+                raise DeadlineExceeded(f"{model} did not respond within {timeout}s")
+            if delay is not None and not hedged and now >= start + delay:
+                hedged = True
+                if self._take_hedge():
+                    logger.debug(f"Hedging a call to {model} after {now - start:.2f}s")
+                    attempts.append(self._start(model, fn))
+        for attempt in attempts:
+            if attempt is not winner:
+                attempt.cancel.set()
+        if tracker:
+            tracker.count_call(model, hedged=len(attempts) > 1, hedge_won=winner is not attempts[0])
+        return winner.future.result()
+
+    def _take_hedge(self) -> bool:
+        """Count a hedge, if the budget allows one."""
+        with self._lock:
+            if self.hedges + 1 > self.budget * self.calls:
+                return False
+            self.hedges += 1
+            return True
+
+    def _start(self, model: str, fn: Callable[[threading.Event], T]) -> _Attempt:
+        attempt = _Attempt(future=Future(), cancel=threading.Event())
+
+        def run():
+            started = time.monotonic()
+            try:
+                result = fn(attempt.cancel)
+            except BaseException as e:
+                attempt.future.set_exception(e)
+                return
+            if not attempt.cancel.is_set():
+                self.record(model, time.monotonic() - started)
+            attempt.future.set_result(result)
+
+        # a thread per attempt, so that abandoned calls never hold up others
+        threading.Thread(target=run, name=f"call-{model}", daemon=True).start()
+        return attempt
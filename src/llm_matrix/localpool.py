@@ -0,0 +1,150 @@
+"""
+A pool of worker processes for local models.
+
+Local models (e.g. served in-process by gpt4all or llama.cpp llm plugins)
+are CPU-bound, and often hold the GIL while generating, so calling them from
+several threads does not make a run faster. A :class:`LocalModelPool` runs
+the calls in worker processes instead, one per core by default:
+
+- each worker loads a model once, the first time it is prompted, and keeps it
+- only the model parameters, the prompt inputs and the response are sent
+  between processes; the model itself is never pickled
+
+Workers are started with ``spawn``, so that forking a process with running
+threads (such as the pipeline's) cannot deadlock; they only see llm plugins
+installed as packages, and the modules listed in ``imports``.
+"""
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import FIRST_COMPLETED, CancelledError, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+from llm_matrix.aimodel import AIModel
+from llm_matrix.schema import Response, Template, TestCase
+
+logger = logging.getLogger(__name__)
+
+LOCAL_PROVIDER = "local"
+"""The provider lane of the models run in the pool"""
+
+CANCEL_POLL_INTERVAL = 0.1
+
+_models: Dict[str, AIModel] = {}
+"""The models loaded in a worker process, by their parameters"""
+
+
+def _init_worker(imports: Sequence[str]):
+    for module in imports:
+        importlib.import_module(module)
+
+
+def _prompt(
+    parameters: Dict[str, Any],
+    user_input: str,
+    template: Optional[Template],
+    case: Optional[TestCase],
+    stream: bool,
+    stop_patterns: List[re.Pattern],
+) -> Response:
+    """Prompt a model in a worker process, loading it on first use."""
+    key = json.dumps(parameters, sort_keys=True, default=str)
+    model = _models.get(key)
+    if model is None:
+        model = _models[key] = AIModel(parameters=parameters)
+        logger.info(f"Worker {os.getpid()} loading {parameters.get('model')}")
+    return model.prompt(
+        user_input,
+        template=template,
+        case=case,
+        stream=stream,
+        stop=(lambda text: all(p.search(text) for p in stop_patterns)) if stop_patterns else None,
+    )
+
+
+@dataclass
+class LocalModelPool:
+    """
+    Run calls to local models in a pool of worker processes.
+
+    The processes are started on the first call, and stopped by :meth:`close`.
+
+    Example:
+
+        >>> pool = LocalModelPool(workers=2)
+        >>> pool.size
+        2
+        >>> pool.close()
+
+    :param workers: number of worker processes (default: the number of cores)
+    :param imports: modules imported by each worker before it loads a model,
+        e.g. to register llm plugins that are not installed as packages
+    """
+    workers: Optional[int] = None
+    imports: List[str] = field(default_factory=list)
+    _executor: Optional[ProcessPoolExecutor] = field(default=None, init=False, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    @property
+    def size(self) -> int:
+        """Number of worker processes."""
+        return self.workers or os.cpu_count() or 1
+
+    def executor(self) -> ProcessPoolExecutor:
+        """The pool, starting it if needed."""
+        with self._lock:
+            if self._executor is None:
+                logger.info(f"Starting {self.size} worker processes for local models")
+                self._executor = ProcessPoolExecutor(
+                    self.size,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(tuple(self.imports),),
+                )
+            return self._executor
+
+    def prompt(
+        self,
+        parameters: Dict[str, Any],
+        user_input: str,
+        template: Optional[Template] = None,
+        case: Optional[TestCase] = None,
+        stream: bool = False,
+        stop_patterns: Optional[List[re.Pattern]] = None,
+        cancel: Optional[threading.Event] = None,
+    ) -> Response:
+        """
+        Prompt a model in a worker process.
+
+        A call that is cancelled before a worker has taken it is dropped; once
+        running, it completes in its worker, and its response is discarded.
+
+        :param parameters: parameters of the model, as for :class:`AIModel`
+        :param user_input:
+        :param template:
+        :param case:
+        :param stream: consume the response as a stream, see :meth:`AIModel.prompt`
+        :param stop_patterns: reading a streamed response stops once all of these match
+        :param cancel: set when the response is no longer needed
+        :return:
+        """
+        future = self.executor().submit(
+            _prompt, parameters, user_input, template, case, stream, list(stop_patterns or [])
+        )
+        if cancel is not None:
+            while not wait([future], timeout=CANCEL_POLL_INTERVAL, return_when=FIRST_COMPLETED).done:
+                if cancel.is_set() and future.cancel():
+                    raise CancelledError(f"Call to {parameters.get('model')} cancelled")
+        return future.result()
+
+    def close(self):
+        """Stop the worker processes, dropping calls not yet started."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
@@ -1,17 +1,50 @@
 import re
 import logging
 from abc import ABC, abstractmethod
-from typing import Optional, Dict, Any, Type
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, Type, List, Callable, Tuple
 
+import numpy as np
 from llm_matrix import LLMRunner
-from llm_matrix.schema import TestCaseResult, MetricEnum, Response
+from llm_matrix.schema import TestCaseResult, MetricEnum, Response, TestCase
 
 logger = logging.getLogger(__name__)
 DEFAULT_EVALUATION_MODEL_NAME = "gpt-4o"
+DEFAULT_EVALUATION_CONCURRENCY = 4
+
+FIRST_TOKEN_PATTERN = re.compile(r"^(\w+)")
+SCORE_PATTERN = re.compile(r"(\d+(\.\d+)?)")
+# a number on its own at the start of a text, e.g. "42" or "4.2." but not "1990s"
+NUMBER_PATTERN = re.compile(r"^\s*(-?\d+(?:\.\d+)?)(?!\w|\.\d)")
+NON_WORD_PATTERN = re.compile(r"[\W_]+")
+LIST_SEPARATOR_PATTERN = re.compile(r"[,;\n]|\band\b")
+# a bulleted or numbered line, e.g. "- x", "* x", "2. x", "(2) x"
+LIST_ITEM_PATTERN = re.compile(r"^\s*(?:[-*\u2022+]|\(?\d+[.)])\s+(.+)$", re.MULTILINE)
+# where the item ends and its description starts, e.g. "TP53: a tumor suppressor"
+ITEM_DESCRIPTION_PATTERN = re.compile(r":\s|\s[-\u2013\u2014]\s|\s?\(")
+
+DEFAULT_SIMILARITY_THRESHOLD = 0.75
+LIST_CHUNK_SIZE = 64
+"""Number of results whose list items are matched together, bounding the size of the incidence matrices"""
+
+POLAR_ANSWERS = {"YES", "NO", "TRUE", "FALSE"}
+STOPWORDS = {"a", "an", "the", "of", "in", "on", "and", "or", "is", "are", "to", "for", "it", "its", "by", "with"}
+LLM_TIER = "llm"
+"""Tier recorded for results scored by the wrapped evaluator of a :class:`CascadeEvaluator`"""
+
+LocalCheck = Callable[[str, str], Optional[float]]
+"""A check of an actual against an expected output, returning a score, or None if it cannot decide"""
 
 
 class MetricEvaluator(ABC):
     """Base class for metric evaluators."""
+
+    prefix_pattern: Optional[re.Pattern] = None
+    """
+    If set, the evaluator only looks at the start of the response, and its
+    score is final once this pattern matches the text received so far.
+    Streaming runs can then stop reading the response early.
+    """
     
     @abstractmethod
     def evaluate(
@@ -32,9 +65,38 @@ class MetricEvaluator(ABC):
         """
         pass
 
+    def evaluate_batch(
+        self,
+        results: List[TestCaseResult],
+        runner: Optional[LLMRunner] = None,
+    ) -> List[float]:
+        """
+        Evaluate a batch of results, returning one score per result.
+
+        The default implementation falls back to scoring each result with
+        :meth:`evaluate`; subclasses can override this to score the whole
+        batch at once.
+
+        :param results: The TestCaseResult instances to score
+        :param runner: The LLMRunner instance
+        :return: A list of scores between 0 and 1, in the same order as results
+        """
+        return [
+            self.evaluate(
+                actual_output=result.response.text,
+                expected_output=result.case.ideal,
+                runner=runner,
+                result=result,
+            )
+            for result in results
+        ]
+
 
 class QAWithExplanationEvaluator(MetricEvaluator):
     """Evaluator for QA with explanation metrics."""
+
+    # the first token is settled once any non-word character has arrived
+    prefix_pattern = re.compile(r"^\w*\W")
     
     def evaluate(
         self, 
@@ -44,12 +106,48 @@ class QAWithExplanationEvaluator(MetricEvaluator):
         result: Optional[TestCaseResult] = None
     ) -> float:
         """Evaluate QA with explanation result."""
-        # First token regex
-        pattern = re.compile(r"^(\w+)")
-        match = pattern.match(actual_output)
-        actual_answer = match.group(1).upper() if match else "OTHER"
-        
-        expected_match = pattern.match(expected_output)
+        return self._score(self._first_token(actual_output), expected_output)
+
+    def evaluate_batch(
+        self,
+        results: List[TestCaseResult],
+        runner: Optional[LLMRunner] = None,
+    ) -> List[float]:
+        """
+        Evaluate a batch of QA with explanation results.
+
+        Expected answers are extracted once per distinct ideal output.
+
+        Example:
+
+            >>> evaluator = QAWithExplanationEvaluator()
+            >>> results = [
+            ...     TestCaseResult(case=TestCase(input="q", ideal="YES"),
+            ...                    response=Response(text=text), hyperparameters={})
+            ...     for text in ["YES, because", "NO", "..."]
+            ... ]
+            >>> evaluator.evaluate_batch(results)
+            [1.0, 0.0, 0.5]
+        """
+        actual_answers = [self._first_token(r.response.text) for r in results]
+        scores_by_expected: Dict[str, Dict[str, float]] = {}
+        scores = []
+        for result, actual_answer in zip(results, actual_answers):
+            expected_output = result.case.ideal
+            cache = scores_by_expected.setdefault(expected_output, {})
+            if actual_answer not in cache:
+                cache[actual_answer] = self._score(actual_answer, expected_output)
+            scores.append(cache[actual_answer])
+        return scores
+
+    @staticmethod
+    def _first_token(text: str) -> str:
+        match = FIRST_TOKEN_PATTERN.match(text)
+        return match.group(1).upper() if match else "OTHER"
+
+    @staticmethod
+    def _score(actual_answer: str, expected_output: str) -> float:
+        expected_match = FIRST_TOKEN_PATTERN.match(expected_output)
         if not expected_match:
             logger.warning(f"Could not extract first token from expected output: {expected_output}")
             return 0.0
@@ -98,6 +196,37 @@ class LLMBasedEvaluator(MetricEvaluator):
             
         score = self._extract_score(eval_response_text)
         return score
+
+    def evaluate_batch(
+        self,
+        results: List[TestCaseResult],
+        runner: Optional[LLMRunner] = None,
+    ) -> List[float]:
+        """
+        Evaluate a batch of results, dispatching the evaluation model calls concurrently.
+
+        The number of concurrent calls is taken from the runner config
+        ``evaluation_concurrency``.
+        """
+        if len(results) <= 1 or not runner:
+            return super().evaluate_batch(results, runner=runner)
+        # resolve the evaluation model once, before fanning out
+        self._get_eval_model(runner)
+        max_workers = DEFAULT_EVALUATION_CONCURRENCY
+        if runner.config and runner.config.evaluation_concurrency:
+            max_workers = runner.config.evaluation_concurrency
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(results))) as executor:
+            return list(
+                executor.map(
+                    lambda result: self.evaluate(
+                        actual_output=result.response.text,
+                        expected_output=result.case.ideal,
+                        runner=runner,
+                        result=result,
+                    ),
+                    results,
+                )
+            )
     
     def _get_eval_model(self, runner: LLMRunner):
         """Get the evaluation model."""
@@ -126,8 +255,7 @@ class LLMBasedEvaluator(MetricEvaluator):
     
     def _extract_score(self, response_text: str) -> float:
         """Extract a score from the LLM response."""
-        pattern = re.compile(r"(\d+(\.\d+)?)")
-        matches = pattern.match(response_text)
+        matches = SCORE_PATTERN.match(response_text)
         
         if matches:
             return float(matches.group(1))
@@ -212,6 +340,387 @@ class SimpleQuestionEvaluator(LLMBasedEvaluator):
         )
 
 
+def _normalize(text: str) -> str:
+    return " ".join(NON_WORD_PATTERN.sub(" ", text.casefold()).split())
+
+
+def exact_match(actual_output: str, expected_output: str) -> Optional[float]:
+    """
+    Score 1 if the response is the expected output, up to case, punctuation and whitespace.
+
+    >>> exact_match("Paris.", "paris")
+    1.0
+    >>> exact_match("Lyon", "Paris") is None
+    True
+    """
+    if _normalize(actual_output) == _normalize(expected_output):
+        return 1.0
+    return None
+
+
+def numeric_match(actual_output: str, expected_output: str) -> Optional[float]:
+    """
+    Compare the numbers that the response and the expected output start with.
+
+    >>> numeric_match("42, as computed", "42.0")
+    1.0
+    >>> numeric_match("41", "42")
+    0.0
+    >>> numeric_match("about 42", "42") is None
+    True
+    """
+    actual_match = NUMBER_PATTERN.match(actual_output)
+    expected_match = NUMBER_PATTERN.match(expected_output)
+    if not actual_match or not expected_match:
+        return None
+    return 1.0 if float(actual_match.group(1)) == float(expected_match.group(1)) else 0.0
+
+
+def first_token_match(actual_output: str, expected_output: str) -> Optional[float]:
+    """
+    Compare the first word of the response against a yes/no or one-word expected answer.
+
+    The first word is extracted as by :class:`QAWithExplanationEvaluator`.
+
+    >>> first_token_match("Yes, because it is", "YES")
+    1.0
+    >>> first_token_match("No", "YES. It is")
+    0.0
+    >>> first_token_match("Probably", "YES") is None
+    True
+    """
+    actual_answer = QAWithExplanationEvaluator._first_token(actual_output)
+    expected_answer = QAWithExplanationEvaluator._first_token(expected_output)
+    if expected_answer in POLAR_ANSWERS:
+        if actual_answer in POLAR_ANSWERS:
+            return 1.0 if actual_answer == expected_answer else 0.0
+        return None
+    if len(_normalize(expected_output).split()) == 1 and actual_answer == expected_answer:
+        return 1.0
+    return None
+
+
+def no_overlap(actual_output: str, expected_output: str) -> Optional[float]:
+    """
+    Score 0 if the response has none of the words of the expected output, ignoring stopwords.
+
+    >>> no_overlap("Lyon", "Paris")
+    0.0
+    >>> no_overlap("The capital is Paris", "Paris, France") is None
+    True
+    """
+    expected_words = set(_normalize(expected_output).split()) - STOPWORDS
+    if expected_words and not expected_words & set(_normalize(actual_output).split()):
+        return 0.0
+    return None
+
+
+def set_overlap(actual_output: str, expected_output: str) -> Optional[float]:
+    """
+    Score 1 if every expected list item is in the response, and 0 if none of their words are.
+
+    >>> set_overlap("The genes are BRCA1, TP53 and EGFR.", "TP53, BRCA1")
+    1.0
+    >>> set_overlap("KRAS", "TP53, BRCA1")
+    0.0
+    >>> set_overlap("TP53", "TP53, BRCA1") is None
+    True
+    """
+    items = [item for item in (_normalize(i) for i in LIST_SEPARATOR_PATTERN.split(expected_output)) if item]
+    if not items:
+        return None
+    actual = _normalize(actual_output)
+    padded = f" {actual} "
+    if all(f" {item} " in padded for item in items):
+        return 1.0
+    expected_words = {word for item in items for word in item.split()} - STOPWORDS
+    if expected_words and not expected_words & set(actual.split()):
+        return 0.0
+    return None
+
+
+class CascadeEvaluator(MetricEvaluator):
+    """
+    Score with cheap local checks first, and another evaluator only for the results they leave undecided.
+
+    The checks are tried in order, and the first to return a score decides.
+    By default only full matches (a score of 1) decide, since the evaluator
+    may give partial credit, or accept synonyms, where a check finds no match;
+    with ``negatives``, checks may also score a result 0. The tier that
+    produced each score, the name of the check or ``llm``, is recorded in
+    the ``evaluation_tier`` of the result.
+
+    Example:
+
+        >>> evaluator = CascadeEvaluator(SimpleQuestionEvaluator(), [exact_match, no_overlap], negatives=True)
+        >>> results = [
+        ...     TestCaseResult(case=TestCase(input="Capital of France?", ideal="Paris"),
+        ...                    response=Response(text=text), hyperparameters={})
+        ...     for text in ["Paris.", "Lyon"]
+        ... ]
+        >>> evaluator.evaluate_batch(results)
+        [1.0, 0.0]
+        >>> [r.evaluation_tier for r in results]
+        ['exact_match', 'no_overlap']
+        >>> CascadeEvaluator(SimpleQuestionEvaluator(), [exact_match, no_overlap]).decide("Lyon", "Paris") is None
+        True
+    """
+
+    def __init__(self, evaluator: MetricEvaluator, checks: List[LocalCheck], negatives: bool = False):
+        self.evaluator = evaluator
+        self.checks = checks
+        self.negatives = negatives
+
+    def decide(self, actual_output: str, expected_output: Optional[str]) -> Optional[Tuple[str, float]]:
+        """
+        Score a response with the local checks.
+
+        :param actual_output:
+        :param expected_output:
+        :return: the name of the deciding check and its score, or None if no check decided
+        """
+        if expected_output is None:
+            return None
+        for check in self.checks:
+            score = check(actual_output, expected_output)
+            if score is not None and (score >= 1.0 or self.negatives):
+                return check.__name__, score
+        return None
+
+    def evaluate(
+        self,
+        actual_output: str,
+        expected_output: str,
+        runner: Optional[LLMRunner] = None,
+        result: Optional[TestCaseResult] = None
+    ) -> float:
+        """Evaluate with the local checks, falling back to the wrapped evaluator."""
+        decided = self.decide(actual_output, expected_output)
+        if decided:
+            tier, score = decided
+        else:
+            tier = LLM_TIER
+            score = self.evaluator.evaluate(actual_output, expected_output, runner=runner, result=result)
+        if result:
+            result.evaluation_tier = tier
+        return score
+
+    def evaluate_batch(
+        self,
+        results: List[TestCaseResult],
+        runner: Optional[LLMRunner] = None,
+    ) -> List[float]:
+        """
+        Evaluate a batch, passing only the undecided results to the wrapped evaluator, as one batch.
+        """
+        scores: List[Optional[float]] = [None] * len(results)
+        undecided = []
+        for i, result in enumerate(results):
+            decided = self.decide(result.response.text, result.case.ideal)
+            if decided:
+                result.evaluation_tier, scores[i] = decided
+            else:
+                undecided.append(i)
+        if undecided:
+            batch_scores = self.evaluator.evaluate_batch([results[i] for i in undecided], runner=runner)
+            for i, score in zip(undecided, batch_scores):
+                results[i].evaluation_tier = LLM_TIER
+                scores[i] = score
+        logger.debug(f"Cascade decided {len(results) - len(undecided)} of {len(results)} results locally")
+        return scores
+
+
+def extract_list_items(text: str) -> List[str]:
+    """
+    Parse the items of a list from a text.
+
+    Bulleted or numbered lines are the items if there are any; otherwise the
+    text (after a leading colon, if any) is split on commas, semicolons,
+    newlines and "and". Descriptions after an item are dropped.
+
+    >>> extract_list_items("The genes are:\\n1. **TP53**: a tumor suppressor\\n2. BRCA1 (DNA repair)")
+    ['**TP53**', 'BRCA1']
+    >>> extract_list_items("Candidates: TP53, BRCA1 and EGFR.")
+    ['TP53', 'BRCA1', 'EGFR.']
+    """
+    lines = LIST_ITEM_PATTERN.findall(text)
+    if not lines:
+        _, colon, rest = text.partition(": ")
+        lines = LIST_SEPARATOR_PATTERN.split(rest if colon else text)
+    items = [ITEM_DESCRIPTION_PATTERN.split(line, maxsplit=1)[0].strip() for line in lines]
+    return [item for item in items if _normalize(item)]
+
+
+def _trigrams(text: str) -> set:
+    # without spaces, so that e.g. "BRCA-2" and "BRCA2" are the same
+    padded = f"  {text.replace(' ', '')} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _incidence(feature_sets: List[set]) -> np.ndarray:
+    """A 0/1 matrix of items by the features occurring in any of them."""
+    vocabulary: Dict[str, int] = {}
+    rows, cols = [], []
+    for i, features in enumerate(feature_sets):
+        for feature in features:
+            rows.append(i)
+            cols.append(vocabulary.setdefault(feature, len(vocabulary)))
+    matrix = np.zeros((len(feature_sets), max(len(vocabulary), 1)), dtype=np.float32)
+    matrix[rows, cols] = 1.0
+    return matrix
+
+
+def match_list_items(
+    pairs: List[Tuple[List[str], List[str]]],
+    threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+) -> List[np.ndarray]:
+    """
+    Match actual against expected list items, for a batch of lists.
+
+    Items are compared after normalization (case, punctuation and
+    whitespace; trigrams are taken with spaces removed). An actual item matches an expected one if the Dice
+    similarity of their character trigrams is at least the threshold, or if
+    it contains all the words of the expected item. Similarities are computed
+    for all pairs of a chunk of lists at once, from the products of the
+    trigram and word incidence matrices of its distinct items.
+
+    Example:
+
+        >>> matches = match_list_items([(["TP53", "BRCA-2"], ["brca2", "EGFR"]), (["kinases"], ["kinase"])])
+        >>> matches[0].astype(int).tolist()
+        [[0, 0], [1, 0]]
+        >>> matches[1].tolist()
+        [[True]]
+
+    :param pairs: actual and expected items of each list
+    :param threshold: minimum trigram similarity of matching items
+    :return: for each list, a boolean matrix of actual by expected items
+    """
+    matches = []
+    for start in range(0, len(pairs), LIST_CHUNK_SIZE):
+        matches.extend(_match_chunk(pairs[start:start + LIST_CHUNK_SIZE], threshold))
+    return matches
+
+
+def _match_chunk(pairs: List[Tuple[List[str], List[str]]], threshold: float) -> List[np.ndarray]:
+    index: Dict[str, int] = {}
+    actual_ids, expected_ids, shapes = [], [], []
+    for actual, expected in pairs:
+        a = [index.setdefault(_normalize(item), len(index)) for item in actual]
+        e = [index.setdefault(_normalize(item), len(index)) for item in expected]
+        actual_ids.append(np.repeat(np.array(a, dtype=np.intp), len(e)))
+        expected_ids.append(np.tile(np.array(e, dtype=np.intp), len(a)))
+        shapes.append((len(a), len(e)))
+    if not index:
+        return [np.zeros(shape, dtype=bool) for shape in shapes]
+    texts = list(index)
+    trigrams = _incidence([_trigrams(text) for text in texts])
+    words = _incidence([set(text.split()) for text in texts])
+    ai, ei = np.concatenate(actual_ids), np.concatenate(expected_ids)
+    shared_trigrams = (trigrams @ trigrams.T)[ai, ei]
+    shared_words = (words @ words.T)[ai, ei]
+    n_trigrams, n_words = trigrams.sum(axis=1), words.sum(axis=1)
+    dice = 2 * shared_trigrams / np.maximum(n_trigrams[ai] + n_trigrams[ei], 1)
+    matched = (dice >= threshold) | ((n_words[ei] > 0) & (shared_words == n_words[ei]))
+    sizes = [rows * cols for rows, cols in shapes]
+    return [
+        block.reshape(shape)
+        for block, shape in zip(np.split(matched, np.cumsum(sizes)[:-1]), shapes)
+    ]
+
+
+class LocalListEvaluator(MetricEvaluator):
+    """
+    Base class for evaluators scoring lists by matching their items locally, without an LLM.
+
+    Items are parsed with :func:`extract_list_items` from both the response
+    and the expected output, and matched with :func:`match_list_items`.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_SIMILARITY_THRESHOLD):
+        self.threshold = threshold
+
+    def evaluate(
+        self,
+        actual_output: str,
+        expected_output: str,
+        runner: Optional[LLMRunner] = None,
+        result: Optional[TestCaseResult] = None
+    ) -> float:
+        """Evaluate by matching list items."""
+        matches = match_list_items(
+            [(extract_list_items(actual_output), extract_list_items(expected_output or ""))], self.threshold
+        )[0]
+        score, message = self._score(matches)
+        if result:
+            result.evaluation_message = message
+        return score
+
+    def evaluate_batch(
+        self,
+        results: List[TestCaseResult],
+        runner: Optional[LLMRunner] = None,
+    ) -> List[float]:
+        """
+        Evaluate a batch, matching the items of all its lists together.
+        """
+        pairs = [
+            (extract_list_items(r.response.text), extract_list_items(r.case.ideal or "")) for r in results
+        ]
+        scores = []
+        for result, matches in zip(results, match_list_items(pairs, self.threshold)):
+            score, result.evaluation_message = self._score(matches)
+            scores.append(score)
+        return scores
+
+    @abstractmethod
+    def _score(self, matches: np.ndarray) -> Tuple[float, str]:
+        """
+        Score a list from its matches.
+
+        :param matches: boolean matrix of actual by expected items
+        :return: the score and an evaluation message
+        """
+
+
+class LocalListMembershipEvaluator(LocalListEvaluator):
+    """
+    Score the fraction of expected list items present in the response, as :class:`ListMembershipEvaluator` does.
+
+    Example:
+
+        >>> LocalListMembershipEvaluator().evaluate("- TP53\\n- EGFR\\n- KRAS", "TP53, BRCA1")
+        0.5
+    """
+
+    def _score(self, matches: np.ndarray) -> Tuple[float, str]:
+        found, expected = int(matches.any(axis=0).sum()), matches.shape[1]
+        if not expected:
+            return 0.0, "no expected items"
+        return found / expected, f"{found} of {expected} expected items found"
+
+
+class LocalRankedListEvaluator(LocalListEvaluator):
+    """
+    Score a ranked list by its first item matching an expected one, as :class:`RankedListEvaluator` does.
+
+    The score is 1 if it is ranked first, 0.5 if second, 0.25 if third and so
+    on, and 0 if no item matches.
+
+    Example:
+
+        >>> LocalRankedListEvaluator().evaluate("1. EGFR\\n2. TP53 (p53)\\n3. KRAS", "TP53")
+        0.5
+    """
+
+    def _score(self, matches: np.ndarray) -> Tuple[float, str]:
+        ranks = np.flatnonzero(matches.any(axis=1))
+        if not len(ranks):
+            return 0.0, "no item matches"
+        rank = int(ranks[0]) + 1
+        return 0.5 ** (rank - 1), f"first match at rank {rank}"
+
+
 # Registry of metric evaluators
 METRIC_REGISTRY: Dict[str, MetricEvaluator] = {
     MetricEnum.QA_WITH_EXPLANATION.value: QAWithExplanationEvaluator(),
@@ -219,9 +728,36 @@ METRIC_REGISTRY: Dict[str, MetricEvaluator] = {
     MetricEnum.REVIEW.value: ReviewEvaluator(),
     MetricEnum.RANKED_LIST.value: RankedListEvaluator(),
     MetricEnum.SIMPLE_QUESTION.value: SimpleQuestionEvaluator(),
+    MetricEnum.LIST_MEMBERSHIP_LOCAL.value: LocalListMembershipEvaluator(),
+    MetricEnum.RANKED_LIST_LOCAL.value: LocalRankedListEvaluator(),
 }
 
 
+# Local checks tried before the evaluator of a metric, with the evaluation_cascade runner option;
+# their scores of 0 are only used with evaluation_cascade_negatives
+CASCADE_CHECKS: Dict[str, List[LocalCheck]] = {
+    MetricEnum.SIMPLE_QUESTION.value: [exact_match, numeric_match, first_token_match, no_overlap],
+    MetricEnum.LIST_MEMBERSHIP.value: [exact_match, set_overlap],
+}
+
+
+def get_evaluator(metric_name: str, runner: Optional[LLMRunner] = None) -> MetricEvaluator:
+    """
+    Get the evaluator of a metric, as a cascade if the runner config has ``evaluation_cascade``.
+
+    :param metric_name:
+    :param runner:
+    :return:
+    """
+    if metric_name not in METRIC_REGISTRY:
+        raise NotImplementedError(f"Metric {metric_name} not implemented")
+    evaluator = METRIC_REGISTRY[metric_name]
+    checks = CASCADE_CHECKS.get(metric_name)
+    if checks and runner and runner.config and runner.config.evaluation_cascade:
+        return CascadeEvaluator(evaluator, checks, negatives=bool(runner.config.evaluation_cascade_negatives))
+    return evaluator
+
+
 def register_metric_evaluator(metric_name: str, evaluator: MetricEvaluator) -> None:
     """
     Register a custom metric evaluator.
@@ -259,30 +795,67 @@ def evaluate_result(result: TestCaseResult, runner: Optional[LLMRunner] = None):
     :param result: The test case result to evaluate
     :param runner: The LLMRunner instance
     """
-    actual_output = result.response.text
-    expected_output = result.case.ideal
-    
-    scores = []
-    
-    for metric_name in result.metrics or []:
-        if metric_name not in METRIC_REGISTRY:
-            raise NotImplementedError(f"Metric {metric_name} not implemented")
-            
-        evaluator = METRIC_REGISTRY[metric_name]
+    evaluate_results([result], runner=runner)
+
+
+def evaluate_results(results: List[TestCaseResult], runner: Optional[LLMRunner] = None):
+    """
+    Evaluate a batch of test case results.
+
+    Results are grouped by metric, and each metric evaluator scores its group
+    in a single :meth:`MetricEvaluator.evaluate_batch` call. The score of each
+    result is the mean over its metrics. With the ``evaluation_cascade``
+    runner option, metrics in :data:`CASCADE_CHECKS` are evaluated by a
+    :class:`CascadeEvaluator`; a result with several metrics gets the
+    ``evaluation_tier`` ``llm`` if any of them called the evaluation model,
+    otherwise the tier of its first cascaded metric.
+
+    Example:
+
+        >>> results = [
+        ...     TestCaseResult(
+        ...         case=TestCase(input="What is II+IV?", ideal="VI. Blah"),
+        ...         response=Response(text=text),
+        ...         hyperparameters={"model": "gpt-4o"},
+        ...         metrics=["qa_with_explanation"],
+        ...     )
+        ...     for text in ["VI", "VII", "Other"]
+        ... ]
+        >>> evaluate_results(results)
+        >>> [r.score for r in results]
+        [1.0, 0.0, 0.5]
+
+    :param results: The test case results to evaluate
+    :param runner: The LLMRunner instance
+    """
+    indexes_by_metric: Dict[str, List[int]] = {}
+    for i, result in enumerate(results):
+        for metric_name in result.metrics or []:
+            if metric_name not in METRIC_REGISTRY:
+                raise NotImplementedError(f"Metric {metric_name} not implemented")
+            indexes_by_metric.setdefault(metric_name, []).append(i)
+
+    scores: List[List[float]] = [[] for _ in results]
+    tiers: List[List[str]] = [[] for _ in results]
+
+    for metric_name, indexes in indexes_by_metric.items():
+        evaluator = get_evaluator(metric_name, runner)
         try:
-            score = evaluator.evaluate(
-                actual_output=actual_output,
-                expected_output=expected_output,
-                runner=runner,
-                result=result
-            )
-            scores.append(score)
+            batch_scores = evaluator.evaluate_batch([results[i] for i in indexes], runner=runner)
         except Exception as e:
             logger.error(f"Error evaluating metric {metric_name}: {e}")
             # Optionally fall back to a default score
             # scores.append(0.0)
             # Or re-raise the exception
             raise
-    
-    if scores:
-        result.score = sum(scores) / len(scores)
+        for i, score in zip(indexes, batch_scores):
+            scores[i].append(score)
+            if isinstance(evaluator, CascadeEvaluator):
+                # each cascaded metric sets the tier; the result keeps the most expensive one
+                tiers[i].append(results[i].evaluation_tier)
+
+    for result, result_scores, result_tiers in zip(results, scores, tiers):
+        if result_scores:
+            result.score = sum(result_scores) / len(result_scores)
+        if result_tiers:
+            result.evaluation_tier = LLM_TIER if LLM_TIER in result_tiers else result_tiers[0]
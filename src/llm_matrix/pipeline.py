@@ -0,0 +1,272 @@
+"""
+Staged, multi-threaded execution with bounded queues.
+
+Each stage has its own worker threads and a bounded input queue, so a slow
+stage applies backpressure to the stages before it while all stages work
+concurrently.
+
+A stage can also be split into lanes, e.g. one per model provider: items are
+routed to a queue per lane, and each lane has its own workers, so a slow or
+rate-limited lane does not hold up the others while the stage has room.
+"""
+import logging
+import queue
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 100
+
+_POLL_INTERVAL = 0.1
+
+
+class _EndOfStream:
+    """Sentinel marking the end of a stage's input."""
+
+
+_END = _EndOfStream()
+
+
+@dataclass
+class Stage:
+    """
+    A pipeline stage.
+
+    ``fn`` is called with a list of up to ``batch_size`` items and returns the
+    items to pass downstream. Batches are formed from whatever is already
+    queued, so a stage only waits for a full batch under load.
+
+    If ``lane`` is set, it maps each item to a lane key. Lanes are created as
+    keys are first seen, each with its own queue and ``lane_workers(key)``
+    workers (default ``workers``). At most ``queue_size`` items wait in the
+    lane queues of a stage altogether: routing pauses while they are full, so
+    backpressure reaches the stages before, and a busy lane only holds up the
+    others once it has that many items waiting.
+    """
+    name: str
+    fn: Callable[[List[Any]], Iterable[Any]]
+    workers: int = 1
+    batch_size: int = 1
+    queue_size: int = DEFAULT_QUEUE_SIZE
+    lane: Optional[Callable[[Any], Hashable]] = None
+    lane_workers: Optional[Callable[[Hashable], int]] = None
+
+
+@dataclass
+class Pipeline:
+    """
+    A chain of stages connected by bounded queues.
+
+    Example:
+
+        >>> pipeline = Pipeline([
+        ...     Stage("double", lambda xs: [x * 2 for x in xs], workers=2),
+        ...     Stage("sum", lambda xs: [sum(xs)], batch_size=100),
+        ... ])
+        >>> sum(pipeline.run(range(10)))
+        90
+
+    Items for which ``done`` returns True skip the remaining stages and are
+    emitted directly:
+
+        >>> pipeline = Pipeline(
+        ...     [Stage("negate", lambda xs: [-x for x in xs]), Stage("inc", lambda xs: [x + 1 for x in xs])],
+        ...     done=lambda x: x < 0,
+        ... )
+        >>> sorted(pipeline.run([1, 2]))
+        [-2, -1]
+    """
+    stages: List[Stage]
+    done: Optional[Callable[[Any], bool]] = None
+    _stop: threading.Event = field(default_factory=threading.Event, repr=False)
+    _error: Optional[BaseException] = field(default=None, repr=False)
+    _threads: List[threading.Thread] = field(default_factory=list, repr=False)
+
+    @property
+    def stopping(self) -> bool:
+        """True once the pipeline stops, e.g. after an error, so feeders waiting on it can give up."""
+        return self._stop.is_set()
+
+    def run(self, items: Iterable[Any]) -> Iterator[Any]:
+        """
+        Feed items through the pipeline, yielding outputs of the last stage as they complete.
+
+        An exception raised in any stage stops the pipeline and is re-raised here.
+
+        :param items:
+        :return:
+        """
+        self._stop.clear()
+        self._error = None
+        queues = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        output: queue.Queue = queue.Queue(maxsize=self.stages[-1].queue_size if self.stages else DEFAULT_QUEUE_SIZE)
+        self._threads = []
+        self._start(threading.Thread(target=self._feed, args=(items, queues[0] if queues else output), daemon=True))
+        for i, stage in enumerate(self.stages):
+            next_queue = queues[i + 1] if i + 1 < len(queues) else output
+            lock = threading.Lock()
+            if stage.lane:
+                # the dispatcher counts as a worker until it has routed the end of the stream
+                self._start(
+                    threading.Thread(
+                        target=self._dispatch,
+                        args=(stage, queues[i], next_queue, output, [1], lock),
+                        name=f"{stage.name}-dispatch",
+                        daemon=True,
+                    )
+                )
+                continue
+            remaining = [stage.workers]
+            for n in range(stage.workers):
+                self._start(
+                    threading.Thread(
+                        target=self._work,
+                        args=(stage, queues[i], next_queue, output, remaining, lock),
+                        name=f"{stage.name}-{n}",
+                        daemon=True,
+                    )
+                )
+        try:
+            while True:
+                item = self._get(output)
+                if item is None or item is _END:
+                    break
+                yield item
+        finally:
+            self._stop.set()
+            # lane workers may be started while joining; they are appended after their dispatcher
+            i = 0
+            while i < len(self._threads):
+                self._threads[i].join()
+                i += 1
+        if self._error:
+            raise self._error
+
+    def _start(self, thread: threading.Thread):
+        self._threads.append(thread)
+        thread.start()
+
+    def _feed(self, items: Iterable[Any], q: queue.Queue):
+        try:
+            for item in items:
+                if not self._put(q, item):
+                    return
+        except BaseException as e:
+            self._fail(e)
+            return
+        self._put(q, _END)
+
+    def _work(
+        self,
+        stage: Stage,
+        inq: queue.Queue,
+        outq: queue.Queue,
+        output: queue.Queue,
+        remaining: List[int],
+        lock,
+        slots: Optional[threading.Semaphore] = None,
+    ):
+        finished = False
+        try:
+            while not finished:
+                first = self._get(inq)
+                if first is None:
+                    return
+                if first is _END:
+                    break
+                batch = [first]
+                while len(batch) < stage.batch_size:
+                    try:
+                        item = inq.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _END:
+                        finished = True
+                        break
+                    batch.append(item)
+                if slots:
+                    # taken from a lane queue, making room for the dispatcher
+                    for _ in batch:
+                        slots.release()
+                for out in stage.fn(batch):
+                    target = output if self.done and self.done(out) else outq
+                    if not self._put(target, out):
+                        return
+            # let sibling workers see the end of the stream too
+            self._put(inq, _END)
+        except BaseException as e:
+            logger.error(f"Error in pipeline stage {stage.name}: {e}")
+            self._fail(e)
+            return
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            self._put(outq, _END)
+
+    def _dispatch(self, stage: Stage, inq: queue.Queue, outq: queue.Queue, output: queue.Queue, remaining: List[int], lock):
+        lanes: Dict[Hashable, queue.Queue] = {}
+        # items routed to a lane and not yet taken by its workers, across all lanes
+        slots = threading.Semaphore(stage.queue_size)
+        try:
+            while True:
+                item = self._get(inq)
+                if item is None:
+                    return
+                if item is _END:
+                    break
+                key = stage.lane(item)
+                if key not in lanes:
+                    lanes[key] = queue.Queue()
+                    workers = stage.lane_workers(key) if stage.lane_workers else stage.workers
+                    logger.info(f"Starting lane {key} of stage {stage.name} with {workers} workers")
+                    with lock:
+                        remaining[0] += workers
+                    for n in range(workers):
+                        self._start(
+                            threading.Thread(
+                                target=self._work,
+                                args=(stage, lanes[key], outq, output, remaining, lock, slots),
+                                name=f"{stage.name}-{key}-{n}",
+                                daemon=True,
+                            )
+                        )
+                while not slots.acquire(timeout=_POLL_INTERVAL):
+                    if self._stop.is_set():
+                        return
+                lanes[key].put(item)
+            for lane in lanes.values():
+                lane.put(_END)
+        except BaseException as e:
+            logger.error(f"Error in pipeline stage {stage.name}: {e}")
+            self._fail(e)
+            return
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            self._put(outq, _END)
+
+    def _fail(self, e: BaseException):
+        if not self._error:
+            self._error = e
+        self._stop.set()
+
+    def _put(self, q: queue.Queue, item: Any) -> bool:
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue) -> Any:
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+        return None
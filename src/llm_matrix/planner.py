@@ -0,0 +1,209 @@
+"""
+Dependency-aware planning of suite runs.
+
+Each cell gets a fingerprint of the inputs its result depends on: the
+rendered prompt and system prompt, the resolved model, its parameters and
+plugins (generation inputs), and the metrics and evaluation model
+(evaluation inputs). Planning compares these against the store, so that only
+cells whose inputs changed are regenerated or rescored.
+"""
+import hashlib
+import json
+import logging
+from enum import Enum
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional
+
+import pandas as pd
+
+from llm_matrix.schema import Suite
+from llm_matrix.utils import Cell, iter_cells
+
+if TYPE_CHECKING:
+    from llm_matrix.runner import LLMRunner
+
+logger = logging.getLogger(__name__)
+
+Fingerprint = Dict[str, str]
+
+GENERATION_COMPONENTS = ("prompt", "system", "model", "parameters", "plugins")
+EVALUATION_COMPONENTS = ("metrics", "evaluation_model", "cascade")
+
+
+class Action(str, Enum):
+    """What needs to be done for a cell."""
+    CACHED = "cached"
+    """The stored result is up to date"""
+    REUSE = "reuse"
+    """An up-to-date result exists under another version of the suite; copy it"""
+    RESCORE = "rescore"
+    """The stored response is up to date but the evaluation inputs changed"""
+    GENERATE = "generate"
+    """No stored result, or the generation inputs changed"""
+
+
+def _hash(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+def generation_fingerprint(fingerprint: Fingerprint) -> str:
+    """
+    Combine the generation components of a fingerprint into a single hash.
+
+    Example:
+
+        >>> fp = {"prompt": "a", "system": "b", "model": "c", "parameters": "d", "plugins": "e", "metrics": "f"}
+        >>> generation_fingerprint(fp) == generation_fingerprint({**fp, "metrics": "g"})
+        True
+        >>> generation_fingerprint(fp) == generation_fingerprint({**fp, "prompt": "z"})
+        False
+
+    :param fingerprint:
+    :return:
+    """
+    return _hash([fingerprint.get(k) for k in GENERATION_COMPONENTS])
+
+
+def changed_components(old: Fingerprint, new: Fingerprint, components: Iterable[str]) -> List[str]:
+    """
+    List the components that differ between two fingerprints.
+
+    >>> changed_components({"prompt": "a", "model": "b"}, {"prompt": "a", "model": "c"}, GENERATION_COMPONENTS)
+    ['model']
+    """
+    return [k for k in components if old.get(k) != new.get(k)]
+
+
+def cell_fingerprint(runner: "LLMRunner", cell: Cell) -> Fingerprint:
+    """
+    Compute the fingerprint of a cell without calling any model.
+
+    Prompts are rendered from the template; inputs added at prompt time by
+    plugins (e.g. retrieved abstracts) are represented by the plugin names.
+
+    :param runner:
+    :param cell:
+    :return: mapping of component name to hash
+    """
+    from llm_matrix.metrics import CASCADE_CHECKS, DEFAULT_EVALUATION_MODEL_NAME, METRIC_REGISTRY, LLMBasedEvaluator
+    suite = cell.suite
+    actual_params = runner.resolve_parameters(cell.hyperparameters)
+    model_name = actual_params.get("model")
+    model_info = suite.models.get(model_name) if suite.models and model_name else None
+    parameters = {**actual_params, **(model_info.parameters if model_info else {})}
+    template = runner.get_template(cell.case, suite)
+    if runner.config and runner.config.streaming:
+        stop_patterns = runner.stop_patterns(template)
+        if stop_patterns:
+            # the stored response is only a prefix
+            parameters["_stop"] = sorted(p.pattern for p in stop_patterns)
+    model = runner.get_aimodel(actual_params, suite=suite)
+    prompt, system = model.render(cell.case.input, template=template, case=cell.case)
+    metrics = sorted(template.metrics) if template and template.metrics else []
+    evaluation_model = None
+    if any(isinstance(METRIC_REGISTRY.get(m), LLMBasedEvaluator) for m in metrics):
+        evaluation_model = DEFAULT_EVALUATION_MODEL_NAME
+        if runner.config and runner.config.evaluation_model_name:
+            evaluation_model = runner.config.evaluation_model_name
+    cascade = None
+    if runner.config and runner.config.evaluation_cascade:
+        negatives = bool(runner.config.evaluation_cascade_negatives)
+        cascade = {
+            m: {"checks": [check.__name__ for check in CASCADE_CHECKS[m]], "negatives": negatives}
+            for m in metrics if m in CASCADE_CHECKS
+        }
+    return {
+        "prompt": _hash(prompt),
+        "system": _hash(system),
+        "model": _hash(model_name),
+        "parameters": _hash({k: v for k, v in parameters.items() if k != "model"}),
+        "plugins": _hash(sorted(model_info.plugins or []) if model_info else []),
+        "metrics": _hash(metrics),
+        "evaluation_model": _hash(evaluation_model),
+        # only present with the option, so that existing fingerprints stay up to date without it
+        **({"cascade": _hash(cascade)} if cascade else {}),
+    }
+
+
+def plan_cell(runner: "LLMRunner", cell: Cell) -> Cell:
+    """
+    Decide what needs to be done for a cell, comparing its fingerprint against the store.
+
+    Sets the ``action``, ``reason`` and ``fingerprint`` of the cell, and its
+    ``result`` when a stored result can be used; up-to-date results are
+    loaded as lightweight views (see :mod:`llm_matrix.results`). Results stored before
+    fingerprints were recorded are treated as up to date.
+
+    :param runner:
+    :param cell:
+    :return: the same cell
+    """
+    store = runner._get_store()
+    fingerprint = cell_fingerprint(runner, cell)
+    cell.fingerprint = fingerprint
+    entry = store.get_entry(cell.suite, cell.case, cell.hyperparameters, cell.replicate)
+    if entry:
+        if entry.fingerprint is None:
+            cell.result = entry.view(runner.interner)
+            cell.action, cell.reason = Action.CACHED, "stored without fingerprint"
+            return cell
+        changed = changed_components(entry.fingerprint, fingerprint, GENERATION_COMPONENTS)
+        if changed:
+            cell.action, cell.reason = Action.GENERATE, f"changed: {', '.join(changed)}"
+            return cell
+        changed = changed_components(entry.fingerprint, fingerprint, EVALUATION_COMPONENTS)
+        if changed:
+            # rescoring updates the result, so it needs the full model
+            cell.result = entry.result
+            cell.action, cell.reason = Action.RESCORE, f"changed: {', '.join(changed)}"
+        else:
+            cell.result = entry.view(runner.interner)
+            cell.action, cell.reason = Action.CACHED, "unchanged"
+        return cell
+    entry = store.find_reusable(
+        cell.suite, cell.case, cell.hyperparameters, generation_fingerprint(fingerprint), cell.replicate
+    )
+    if entry:
+        cell.result = entry.result
+        cell.result.case = cell.case
+        changed = changed_components(entry.fingerprint or {}, fingerprint, EVALUATION_COMPONENTS)
+        if changed:
+            cell.action = Action.RESCORE
+            cell.reason = f"reused from {entry.suite_name}; changed: {', '.join(changed)}"
+        else:
+            cell.action, cell.reason = Action.REUSE, f"unchanged in {entry.suite_name}"
+        return cell
+    cell.action, cell.reason = Action.GENERATE, "not in store"
+    return cell
+
+
+def plan_suite(runner: "LLMRunner", suite: Suite, cells: Optional[Iterable[Cell]] = None) -> Iterator[Cell]:
+    """
+    Plan all cells of a suite.
+
+    :param runner:
+    :param suite:
+    :param cells: cells to plan; defaults to all cells of the suite
+    :return:
+    """
+    for cell in cells if cells is not None else iter_cells(suite):
+        yield plan_cell(runner, cell)
+
+
+def plan_to_dataframe(cells: Iterable[Cell]) -> pd.DataFrame:
+    """
+    Tabulate planned cells, one row per cell.
+
+    :param cells:
+    :return:
+    """
+    return pd.DataFrame([
+        {
+            "action": cell.action.value if cell.action else None,
+            "reason": cell.reason,
+            "case_input": cell.case.input,
+            "hyperparameters": "_".join(f"{k}={v}" for k, v in cell.hyperparameters.items()),
+            **{k: str(v) for k, v in cell.hyperparameters.items()},
+            **({"replicate": cell.replicate} if (cell.suite.matrix.replicates or 1) > 1 else {}),
+        }
+        for cell in cells
+    ])
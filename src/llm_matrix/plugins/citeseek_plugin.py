@@ -57,7 +57,8 @@ class CiteseekPlugin(AIModel):
         return super().prompt(user_input,
                               template=template,
                               system_prompt=system_prompt,
-                              extra_system_prompt=extra_system)
+                              extra_system_prompt=extra_system,
+                              **kwargs)
 
 
 
@@ -0,0 +1,267 @@
+"""
+Progress reporting for suite runs.
+
+A :class:`ProgressTracker` counts cells as the runner completes them. A
+:class:`ProgressReporter` thread periodically renders snapshots of the tracker
+to sinks: a status line on the terminal, and/or a stream of JSON lines written
+to a file or a TCP socket, for dashboards. Reporting never blocks the run.
+"""
+import json
+import logging
+import socket
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, TextIO
+
+from llm_matrix.utils import Cell
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REFRESH_INTERVAL = 1.0
+
+Snapshot = Dict[str, Any]
+
+
+@dataclass
+class ProgressTracker:
+    """
+    Thread-safe counters for a run.
+
+    Only generated cells count toward the requests per second of their model;
+    reused cells (copied from another stored suite) and rescored cells (only
+    evaluated again) are counted separately, as they call no model under test.
+
+    Example:
+
+        >>> from llm_matrix.schema import Suite, TestCase
+        >>> from llm_matrix.utils import iter_cells
+        >>> suite = Suite(name="s", cases=[TestCase(input="a"), TestCase(input="b")],
+        ...               matrix={"hyperparameters": {"model": ["m1"]}})
+        >>> tracker = ProgressTracker(total=2)
+        >>> a, b = iter_cells(suite)
+        >>> a.cached = True
+        >>> tracker.update(a)
+        >>> snapshot = tracker.snapshot()
+        >>> snapshot["done"], snapshot["cache_hit_rate"]
+        (1, 1.0)
+    """
+    total: Optional[int] = None
+    done: int = 0
+    cached: int = 0
+    errors: int = 0
+    reused: int = 0
+    rescored: int = 0
+    generated: Dict[str, int] = field(default_factory=dict)
+    model_errors: Dict[str, int] = field(default_factory=dict)
+    hedges: Dict[str, int] = field(default_factory=dict)
+    hedge_wins: Dict[str, int] = field(default_factory=dict)
+    timeouts: Dict[str, int] = field(default_factory=dict)
+    evaluation_tiers: Dict[str, int] = field(default_factory=dict)
+    started: float = field(default_factory=time.monotonic)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def update(self, cell: Cell):
+        """
+        Count a completed cell.
+
+        :param cell:
+        :return:
+        """
+        model = str(cell.hyperparameters.get("model"))
+        with self._lock:
+            self.done += 1
+            if cell.error:
+                self.errors += 1
+                self.model_errors[model] = self.model_errors.get(model, 0) + 1
+            elif cell.cached:
+                self.cached += 1
+            elif cell.action == "reuse":
+                self.reused += 1
+            elif cell.action == "rescore":
+                self.rescored += 1
+            else:
+                self.generated[model] = self.generated.get(model, 0) + 1
+            # only the cells scored in this run (Action is a str enum)
+            scored = cell.action in ("generate", "rescore") and not cell.error
+            tier = cell.result.evaluation_tier if scored and cell.result is not None else None
+            if tier:
+                self.evaluation_tiers[tier] = self.evaluation_tiers.get(tier, 0) + 1
+
+    def count_call(self, model: str, hedged: bool = False, hedge_won: bool = False, timed_out: bool = False):
+        """
+        Count a model call that was hedged or timed out (see :mod:`llm_matrix.hedging`).
+
+        :param model:
+        :param hedged: a duplicate request was sent
+        :param hedge_won: the duplicate request returned first
+        :param timed_out: the call did not return before its deadline
+        :return:
+        """
+        with self._lock:
+            for counts, counted in ((self.hedges, hedged), (self.hedge_wins, hedge_won), (self.timeouts, timed_out)):
+                if counted:
+                    counts[model] = counts.get(model, 0) + 1
+
+    def snapshot(self) -> Snapshot:
+        """
+        The current state of the run, as a JSON-serializable dict.
+
+        :return:
+        """
+        with self._lock:
+            elapsed = time.monotonic() - self.started
+            rate = self.done / elapsed if elapsed > 0 else 0.0
+            remaining = self.total - self.done if self.total is not None else None
+            return {
+                "time": time.time(),
+                "elapsed": elapsed,
+                "done": self.done,
+                "total": self.total,
+                "cached": self.cached,
+                "cache_hit_rate": self.cached / self.done if self.done else None,
+                "errors": self.errors,
+                "reused": self.reused,
+                "rescored": self.rescored,
+                "requests_per_second": {
+                    model: n / elapsed if elapsed > 0 else 0.0 for model, n in self.generated.items()
+                },
+                "model_errors": dict(self.model_errors),
+                "hedges": dict(self.hedges),
+                "hedge_wins": dict(self.hedge_wins),
+                "timeouts": dict(self.timeouts),
+                "evaluation_tiers": dict(self.evaluation_tiers),
+                "eta": remaining / rate if remaining is not None and rate > 0 else None,
+            }
+
+
+def format_snapshot(snapshot: Snapshot) -> str:
+    """
+    Render a snapshot as a single status line.
+
+    Example:
+
+        >>> format_snapshot({"done": 5, "total": 10, "cache_hit_rate": 0.4, "errors": 1,
+        ...                  "rescored": 3, "requests_per_second": {"gpt-4o": 1.5}, "hedges": {"gpt-4o": 2}, "eta": 65})
+        '5/10 cells | cache 40% | errors 1 | rescored 3 | hedges 2 | gpt-4o 1.5/s | eta 1:05'
+
+    :param snapshot:
+    :return:
+    """
+    total = snapshot["total"] if snapshot["total"] is not None else "?"
+    parts = [f"{snapshot['done']}/{total} cells"]
+    if snapshot["cache_hit_rate"] is not None:
+        parts.append(f"cache {snapshot['cache_hit_rate']:.0%}")
+    parts.append(f"errors {snapshot['errors']}")
+    for key in ("reused", "rescored"):
+        if snapshot.get(key):
+            parts.append(f"{key} {snapshot[key]}")
+    for key in ("hedges", "timeouts"):
+        n = sum(snapshot.get(key, {}).values())
+        if n:
+            parts.append(f"{key} {n}")
+    parts.extend(f"{model} {rps:.1f}/s" for model, rps in sorted(snapshot["requests_per_second"].items()))
+    if snapshot["eta"] is not None:
+        minutes, seconds = divmod(int(snapshot["eta"]), 60)
+        parts.append(f"eta {minutes}:{seconds:02d}")
+    return " | ".join(parts)
+
+
+class TerminalSink:
+    """Show the status line on a terminal, redrawing it in place if the stream is a tty."""
+
+    def __init__(self, stream: TextIO = None):
+        self.stream = stream or sys.stderr
+        self.redraw = self.stream.isatty()
+
+    def __call__(self, snapshot: Snapshot):
+        line = format_snapshot(snapshot)
+        if self.redraw:
+            self.stream.write(f"\r\x1b[K{line}")
+        else:
+            self.stream.write(line + "\n")
+        self.stream.flush()
+
+    def close(self):
+        if self.redraw:
+            self.stream.write("\n")
+            self.stream.flush()
+
+
+class JsonLinesSink:
+    """
+    Write each snapshot as a JSON line.
+
+    The target is a file path, or ``tcp://host:port`` to stream to a socket.
+    A socket that goes away is logged once and then ignored, so a dashboard
+    restart never fails a run.
+    """
+
+    def __init__(self, target: str):
+        self.target = target
+        self._socket: Optional[socket.socket] = None
+        self._file: Optional[TextIO] = None
+        if target.startswith("tcp://"):
+            host, port = target[len("tcp://"):].rsplit(":", 1)
+            self._socket = socket.create_connection((host, int(port)))
+        else:
+            self._file = open(target, "a")
+
+    def __call__(self, snapshot: Snapshot):
+        line = json.dumps(snapshot) + "\n"
+        if self._file:
+            self._file.write(line)
+            self._file.flush()
+        elif self._socket:
+            try:
+                self._socket.sendall(line.encode("utf-8"))
+            except OSError as e:
+                logger.warning(f"Progress stream to {self.target} closed: {e}")
+                self._socket = None
+
+    def close(self):
+        if self._file:
+            self._file.close()
+        if self._socket:
+            self._socket.close()
+
+
+@dataclass
+class ProgressReporter:
+    """
+    Periodically send snapshots of a tracker to sinks from a background thread.
+
+    Use as a context manager around a run; a final snapshot is sent on exit.
+    """
+    tracker: ProgressTracker
+    sinks: List[Callable[[Snapshot], None]]
+    interval: float = DEFAULT_REFRESH_INTERVAL
+    _stop: threading.Event = field(default_factory=threading.Event, repr=False)
+    _thread: Optional[threading.Thread] = field(default=None, repr=False)
+
+    def __enter__(self) -> "ProgressReporter":
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._report, name="progress", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+        self._emit()
+        for sink in self.sinks:
+            if hasattr(sink, "close"):
+                sink.close()
+
+    def _report(self):
+        while not self._stop.wait(self.interval):
+            self._emit()
+
+    def _emit(self):
+        snapshot = self.tracker.snapshot()
+        for sink in self.sinks:
+            try:
+                sink(snapshot)
+            except Exception as e:
+                logger.warning(f"Progress sink failed: {e}")
@@ -0,0 +1,368 @@
+"""
+Compact in-memory representation of results.
+
+A :class:`ResultView` holds the same information as a
+:class:`~llm_matrix.schema.TestCaseResult`, in a slotted object that shares
+its case, hyperparameters and metrics with other views through a
+:class:`ResultInterner`. Rendered prompts read from a store are kept as
+references to the store's blobs and only loaded when accessed. Full Pydantic
+models are built on demand with :meth:`ResultView.to_result`.
+
+A :class:`ResultSet` is a list of views with a shared interner, as returned
+by :meth:`LLMRunner.run` and :meth:`Store.load_results`. Views are not
+:class:`~llm_matrix.schema.TestCaseResult` instances; code that needs the
+Pydantic models calls ``to_results()`` on the set.
+"""
+import json
+import threading
+import weakref
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+import pandas as pd
+
+from llm_matrix.schema import Response, TestCase, TestCaseResult
+
+BlobResolver = Callable[[str], str]
+
+RESPONSE_FIELDS = tuple(Response.model_fields)
+
+
+class ResultInterner:
+    """
+    Canonical instances of the parts results share.
+
+    Interning is keyed by content, so views decoded separately from a store
+    share one case object per distinct case, one dict per hyperparameter
+    combination, and one string per distinct prompt.
+    """
+
+    def __init__(self):
+        self.cases: Dict[str, TestCase] = {}
+        self.hyperparameters: Dict[tuple, Dict[str, Any]] = {}
+        self.metrics: Dict[tuple, List[str]] = {}
+        self.strings: Dict[str, str] = {}
+        # by case object, without keeping it alive: entries are dropped when their case is collected
+        self._flat_cases: Dict[int, Tuple[weakref.ref, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def case(self, key: str, build: Callable[[], TestCase]) -> TestCase:
+        """Get the case for a content key, building it the first time."""
+        case = self.cases.get(key)
+        if case is None:
+            with self._lock:
+                case = self.cases.setdefault(key, build())
+        return case
+
+    def params(self, hyperparameters: Dict[str, Any]) -> Dict[str, Any]:
+        key = tuple((k, _hashable(v)) for k, v in hyperparameters.items())
+        return self.hyperparameters.setdefault(key, hyperparameters)
+
+    def metric_list(self, metrics: Optional[List[str]]) -> Optional[List[str]]:
+        if metrics is None:
+            return None
+        return self.metrics.setdefault(tuple(metrics), metrics)
+
+    def string(self, text: Optional[str]) -> Optional[str]:
+        if text is None:
+            return None
+        return self.strings.setdefault(text, text)
+
+    def flat_case(self, case: TestCase) -> Dict[str, Any]:
+        """The flat dict of a case, computed once per case object while it is in use."""
+        key = id(case)
+        entry = self._flat_cases.get(key)
+        # an id is only reused once its case is gone, and the ref then no longer points to it
+        if entry is None or entry[0]() is not case:
+            entry = (weakref.ref(case, lambda ref: self._forget_flat_case(key, ref)), case.as_flat_dict(prefix="case"))
+            self._flat_cases[key] = entry
+        return entry[1]
+
+    def _forget_flat_case(self, key: int, ref: weakref.ref):
+        # no lock: this runs whenever a case is collected, possibly while the lock is held
+        if self._flat_cases.get(key, (None,))[0] is ref:
+            self._flat_cases.pop(key, None)
+
+
+class ResultView:
+    """
+    A lightweight, read-mostly view of a result.
+
+    Example:
+
+        >>> interner = ResultInterner()
+        >>> case = TestCase(input="What is 1+1?", ideal="2")
+        >>> result = TestCaseResult(case=case, response=Response(text="2", prompt="What is 1+1?"),
+        ...                         hyperparameters={"model": "gpt-4o"}, score=1.0)
+        >>> view = ResultView.from_result(result, interner)
+        >>> view.case.input, view.response.text, view.score
+        ('What is 1+1?', '2', 1.0)
+        >>> view.to_result() == result
+        True
+
+    The response is built the first time it is accessed, and kept, so changes
+    to it stick:
+
+        >>> view.response.text = "3"
+        >>> view.response_text, view.to_result().response.text
+        ('3', '3')
+
+    Like :class:`~llm_matrix.schema.TestCaseResult`, views compare by value
+    and are mutable, so they are not hashable.
+    """
+    __slots__ = (
+        "case", "hyperparameters", "metrics", "score", "evaluation_message", "replicate",
+        "evaluation_tier", "_response_text", "_prompt", "_system", "_prompt_ref", "_system_ref", "_response_extra",
+        "_resolve", "_response",
+    )
+
+    def __init__(
+        self,
+        case: TestCase,
+        hyperparameters: Dict[str, Any],
+        response_text: str,
+        metrics: Optional[List[str]] = None,
+        score: Optional[float] = None,
+        evaluation_message: Optional[str] = None,
+        prompt: Optional[str] = None,
+        system: Optional[str] = None,
+        prompt_ref: Optional[str] = None,
+        system_ref: Optional[str] = None,
+        response_extra: Optional[Dict[str, Any]] = None,
+        resolve: Optional[BlobResolver] = None,
+        replicate: Optional[int] = None,
+        evaluation_tier: Optional[str] = None,
+    ):
+        self.case = case
+        self.hyperparameters = hyperparameters
+        self._response_text = response_text
+        self.metrics = metrics
+        self.score = score
+        self.evaluation_message = evaluation_message
+        self.replicate = replicate
+        self.evaluation_tier = evaluation_tier
+        self._prompt = prompt
+        self._system = system
+        self._prompt_ref = prompt_ref
+        self._system_ref = system_ref
+        self._response_extra = response_extra
+        self._resolve = resolve
+        self._response: Optional[Response] = None
+
+    @classmethod
+    def from_result(cls, result: Union[TestCaseResult, "ResultView"], interner: ResultInterner) -> "ResultView":
+        """
+        Make a view of a full result, interning its parts.
+
+        :param result:
+        :param interner:
+        :return:
+        """
+        if isinstance(result, ResultView):
+            return result
+        response = result.response
+        extra = {
+            k: getattr(response, k) for k in RESPONSE_FIELDS
+            if k not in ("text", "prompt", "system") and getattr(response, k) is not None
+        }
+        return cls(
+            case=result.case,
+            hyperparameters=interner.params(result.hyperparameters),
+            response_text=response.text,
+            metrics=interner.metric_list(result.metrics),
+            score=result.score,
+            evaluation_message=result.evaluation_message,
+            prompt=interner.string(response.prompt),
+            system=interner.string(response.system),
+            response_extra=extra or None,
+            replicate=result.replicate,
+            evaluation_tier=result.evaluation_tier,
+        )
+
+    @property
+    def response_text(self) -> str:
+        """The text of the response."""
+        return self._response.text if self._response is not None else self._response_text
+
+    @property
+    def prompt(self) -> Optional[str]:
+        """The rendered prompt, loaded from the store if needed."""
+        if self._response is not None:
+            return self._response.prompt
+        if self._prompt is None and self._prompt_ref and self._resolve:
+            return self._resolve(self._prompt_ref)
+        return self._prompt
+
+    @property
+    def system(self) -> Optional[str]:
+        """The rendered system prompt, loaded from the store if needed."""
+        if self._response is not None:
+            return self._response.system
+        if self._system is None and self._system_ref and self._resolve:
+            return self._resolve(self._system_ref)
+        return self._system
+
+    @property
+    def response(self) -> Response:
+        """The response, built on first access."""
+        if self._response is None:
+            self._response = Response(
+                text=self._response_text, prompt=self.prompt, system=self.system, **(self._response_extra or {})
+            )
+        return self._response
+
+    @response.setter
+    def response(self, response: Response):
+        self._response = response
+
+    def to_result(self) -> TestCaseResult:
+        """Build the full result."""
+        return TestCaseResult(
+            case=self.case,
+            response=self.response,
+            hyperparameters=self.hyperparameters,
+            metrics=self.metrics,
+            score=self.score,
+            evaluation_message=self.evaluation_message,
+            replicate=self.replicate,
+            evaluation_tier=self.evaluation_tier,
+        )
+
+    def model_dump(self, **kwargs) -> Dict[str, Any]:
+        return self.to_result().model_dump(**kwargs)
+
+    def model_dump_json(self, **kwargs) -> str:
+        return self.to_result().model_dump_json(**kwargs)
+
+    def as_flat_dict(self, interner: Optional[ResultInterner] = None) -> Dict[str, Any]:
+        """
+        Flatten as :meth:`TestCaseResult.as_flat_dict` does, without building the full result.
+
+        :param interner: if given, the flat dict of each case is computed only once
+        :return:
+        """
+        hyperparameters = {k: str(v) for k, v in self.hyperparameters.items()}
+        case_dict = interner.flat_case(self.case) if interner else self.case.as_flat_dict(prefix="case")
+        response_dict = {f"response_{k}": None for k in RESPONSE_FIELDS}
+        response_dict.update({
+            "response_text": self.response_text,
+            "response_prompt": self.prompt,
+            "response_system": self.system,
+        })
+        if self._response is not None:
+            response_dict.update({f"response_{k}": v for k, v in self._response.model_dump().items()})
+        else:
+            for k, v in (self._response_extra or {}).items():
+                response_dict[f"response_{k}"] = v
+        return {
+            "hyperparameters": "_".join(f"{k}={v}" for k, v in hyperparameters.items()),
+            "metrics": self.metrics,
+            "score": self.score,
+            "evaluation_message": self.evaluation_message,
+            "replicate": self.replicate,
+            "evaluation_tier": self.evaluation_tier,
+            **case_dict,
+            **response_dict,
+            **hyperparameters,
+        }
+
+    def __eq__(self, other):
+        if isinstance(other, (ResultView, TestCaseResult)):
+            other_result = other.to_result() if isinstance(other, ResultView) else other
+            return self.to_result() == other_result
+        return NotImplemented
+
+    # compared by value, and mutable
+    __hash__ = None
+
+    def __repr__(self):
+        return f"ResultView(case={self.case.input!r}, hyperparameters={self.hyperparameters!r}, score={self.score!r})"
+
+
+class ResultSet(list):
+    """
+    A list of result views sharing one interner.
+
+    Full results appended to the set are converted to views.
+
+    Example:
+
+        >>> results = ResultSet()
+        >>> case = TestCase(input="What is 1+1?", ideal="2")
+        >>> for model in ["m1", "m2"]:
+        ...     results.append(TestCaseResult(case=case, response=Response(text="2", prompt="What is 1+1?"),
+        ...                                   hyperparameters={"model": model}, score=1.0))
+        >>> results[0].case is results[1].case
+        True
+        >>> list(results.to_dataframe()["model"])
+        ['m1', 'm2']
+    """
+
+    def __init__(self, results: Iterable[Union[TestCaseResult, ResultView]] = (), interner: Optional[ResultInterner] = None):
+        super().__init__()
+        self.interner = interner or ResultInterner()
+        self.extend(results)
+
+    def append(self, result: Union[TestCaseResult, ResultView]):
+        super().append(ResultView.from_result(result, self.interner))
+
+    def extend(self, results: Iterable[Union[TestCaseResult, ResultView]]):
+        for result in results:
+            self.append(result)
+
+    def to_results(self) -> List[TestCaseResult]:
+        """Build the full results."""
+        return [view.to_result() for view in self]
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """One row per result, with the same columns as :func:`llm_matrix.schema.results_to_dataframe`."""
+        return pd.DataFrame([view.as_flat_dict(self.interner) for view in self])
+
+
+def decode_view(
+    obj: Dict[str, Any],
+    interner: ResultInterner,
+    case_json: Callable[[str], str],
+    resolve: Optional[BlobResolver] = None,
+) -> ResultView:
+    """
+    Build a view from a stored result object, in either the compact or the inline layout.
+
+    :param obj: parsed result JSON
+    :param interner:
+    :param case_json: gets the JSON of a case by its blob hash
+    :param resolve: gets prompt texts by blob hash, when accessed
+    :return:
+    """
+    response = obj["response"]
+    if "case_ref" in obj:
+        ref = obj["case_ref"]
+        case = interner.case(ref, lambda: TestCase.model_validate_json(case_json(ref)))
+    else:
+        case_obj = obj["case"]
+        case = interner.case(json.dumps(case_obj, sort_keys=True), lambda: TestCase.model_validate(case_obj))
+    extra = {
+        k: response[k] for k in RESPONSE_FIELDS
+        if k not in ("text", "prompt", "system") and response.get(k) is not None
+    }
+    return ResultView(
+        case=case,
+        hyperparameters=interner.params(obj["hyperparameters"]),
+        response_text=response["text"],
+        metrics=interner.metric_list(obj.get("metrics")),
+        score=obj.get("score"),
+        evaluation_message=obj.get("evaluation_message"),
+        prompt=interner.string(response.get("prompt")),
+        system=interner.string(response.get("system")),
+        prompt_ref=response.get("prompt_ref"),
+        system_ref=response.get("system_ref"),
+        response_extra=extra or None,
+        resolve=resolve,
+        replicate=obj.get("replicate"),
+        evaluation_tier=obj.get("evaluation_tier"),
+    )
+
+
+def _hashable(value: Any) -> Any:
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, sort_keys=True)
+    return value
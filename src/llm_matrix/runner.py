@@ -1,20 +1,138 @@
 import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from copy import copy
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from itertools import product
 from pathlib import Path
-from typing import Dict, Any, Optional, Iterator, List
+from typing import Dict, Any, Optional, Iterator, List, Tuple
+
+from pydantic import Field
 
 from llm_matrix import Suite, Matrix, AIModel, Template, TestCase
-from llm_matrix.schema import TestCaseResult, StrictBaseModel
+from llm_matrix.schema import Response, TestCaseResult, StrictBaseModel
+from llm_matrix.pipeline import Pipeline, Stage, DEFAULT_QUEUE_SIZE
+from llm_matrix.estimate import ModelPrice
+from llm_matrix.hedging import DEFAULT_HEDGE_BUDGET, DEFAULT_HEDGE_QUANTILE, RequestHedger
+from llm_matrix.localpool import LOCAL_PROVIDER, LocalModelPool
+from llm_matrix.planner import Action, generation_fingerprint, plan_cell, plan_suite
+from llm_matrix.progress import ProgressTracker
+from llm_matrix.results import ResultInterner, ResultSet, ResultView
 from llm_matrix.store import Store
-from llm_matrix.utils import iter_hyperparameters
+from llm_matrix.utils import iter_cells, Cell, Shard
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_EVALUATION_BATCH_SIZE = 20
+DEFAULT_WRITE_BATCH_SIZE = 100
+
+
 class LLMRunnerConfig(StrictBaseModel):
     model_name_map: Optional[Dict[str, str]] = None
     evaluation_model_name: Optional[str] = None
+    evaluation_batch_size: Optional[int] = Field(
+        None,
+        description="Number of uncached results accumulated before they are scored together"
+    )
+    evaluation_concurrency: Optional[int] = Field(
+        None,
+        description="Maximum number of concurrent evaluation model calls within a batch"
+    )
+    generation_workers: Optional[int] = Field(
+        None,
+        description="Number of worker threads calling the models under test, per provider"
+    )
+    provider_concurrency: Optional[Dict[str, int]] = Field(
+        None,
+        description="Number of worker threads per provider, overriding generation_workers"
+    )
+    model_providers: Optional[Dict[str, str]] = Field(
+        None,
+        description="Map of model names to provider names, for models sharing a rate limit "
+                    "that cannot be told apart automatically"
+    )
+    continue_on_error: Optional[bool] = Field(
+        None,
+        description="Log and count cells that fail to generate or evaluate, instead of stopping the run"
+    )
+    model_prices: Optional[Dict[str, ModelPrice]] = Field(
+        None,
+        description="Price per million input and output tokens, by model name, for cost estimates"
+    )
+    order_by_latency: Optional[bool] = Field(
+        None,
+        description="Run models with the lowest mean latency in the store first"
+    )
+    evaluation_workers: Optional[int] = Field(
+        None,
+        description="Number of worker threads scoring results"
+    )
+    queue_size: Optional[int] = Field(
+        None,
+        description="Maximum number of cells waiting in front of each pipeline stage"
+    )
+    write_batch_size: Optional[int] = Field(
+        None,
+        description="Maximum number of results written to the store in one transaction"
+    )
+    streaming: Optional[bool] = Field(
+        None,
+        description="Stream responses from the models under test, recording time to first token. "
+                    "If all metrics of a template only need a prefix of the response, reading stops early"
+    )
+    stream_stop_pattern: Optional[str] = Field(
+        None,
+        description="Regular expression overriding the metrics' own stop condition when streaming; "
+                    "reading stops once it matches the text received so far"
+    )
+    request_timeout: Optional[float] = Field(
+        None,
+        description="Seconds a call to a model under test may take before the cell fails"
+    )
+    model_timeouts: Optional[Dict[str, float]] = Field(
+        None,
+        description="Seconds a call may take, by model name, overriding request_timeout"
+    )
+    hedge_requests: Optional[bool] = Field(
+        None,
+        description="Send a duplicate request when a call to a model under test takes longer than "
+                    "the model's hedge_quantile latency; the first response wins and the other is cancelled"
+    )
+    hedge_quantile: Optional[float] = Field(
+        None,
+        description="Quantile of a model's observed latency after which a call is hedged (default 0.95)"
+    )
+    hedge_budget: Optional[float] = Field(
+        None,
+        description="Maximum number of duplicate requests, as a fraction of the calls made (default 0.1)"
+    )
+    evaluation_cascade: Optional[bool] = Field(
+        None,
+        description="Score with local checks (exact match, numbers, first token, overlap) before "
+                    "calling the evaluation model, which then only scores the undecided results"
+    )
+    evaluation_cascade_negatives: Optional[bool] = Field(
+        None,
+        description="Let the evaluation_cascade checks also score results 0, e.g. when a response shares "
+                    "no word with the ideal; by default only matches are scored locally, since the "
+                    "evaluation model may give partial credit or accept synonyms"
+    )
+    local_models: Optional[List[str]] = Field(
+        None,
+        description="Models under test run in a pool of worker processes instead of threads, "
+                    "for CPU-bound local models; each worker loads a model once"
+    )
+    local_workers: Optional[int] = Field(
+        None,
+        description="Number of worker processes for local_models (default: the number of cores)"
+    )
+    local_model_imports: Optional[List[str]] = Field(
+        None,
+        description="Modules imported by each worker process before it loads a model, "
+                    "e.g. to register llm plugins that are not installed as packages"
+    )
 
 @dataclass
 class LLMRunner:
@@ -23,55 +141,564 @@ class LLMRunner:
     _aimodels: Optional[Dict[tuple, AIModel]] = None
     _store: Optional[Store] = None
     config: Optional[LLMRunnerConfig] = None
+    shard: Optional[Shard] = None
+    progress: Optional[ProgressTracker] = None
+    interner: ResultInterner = field(default_factory=ResultInterner, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+    _providers: Dict[str, str] = field(default_factory=dict, repr=False)
+    _responses: Dict[str, Response] = field(default_factory=dict, repr=False)
+    _response_locks: Dict[str, threading.Lock] = field(default_factory=dict, repr=False)
+    _active_runs: int = field(default=0, repr=False)
+    _hedger: Optional[RequestHedger] = field(default=None, repr=False)
+    _local_pool: Optional[LocalModelPool] = field(default=None, repr=False)
 
-    def run(self, suite: Suite) -> List[TestCaseResult]:
+    def run(self, suite: Suite) -> ResultSet:
         """
         Run the suite of cases
 
+        Results are lightweight views sharing cases and prompts (see
+        :mod:`llm_matrix.results`); use ``to_result()`` on a view, or
+        ``to_results()`` on the set, for full models. Views have the
+        attributes of a :class:`TestCaseResult`, but are not instances of
+        it, and are not hashable.
+
         :param suite:
         :return:
         """
-        return list(self.run_iter(suite))
+        return ResultSet(self.run_iter(suite), interner=self.interner)
 
-    def run_iter(self, suite: Suite) -> Iterator[TestCaseResult]:
+    def run_iter(self, suite: Suite) -> Iterator[ResultView]:
         """
         Run the suite of cases iterating over the results.
 
+        Cells are processed by a staged pipeline (see :meth:`pipeline`):
+        cache probe, generation, evaluation and persistence each have their own
+        workers, so evaluation calls overlap with generation calls. Generation
+        is interleaved across providers, and stored results are yielded first.
+        Results are yielded as they complete, which is not necessarily suite order.
+
+        If the runner has a ``shard``, only the cells of that shard are run.
+        If it has a ``progress`` tracker, each completed cell is counted there.
+        With ``continue_on_error``, failed cells are counted but not yielded.
+
         :param suite:
         :return:
         """
-        logger.info(f"Running suite {suite.name}")
-        for params in iter_hyperparameters(suite.matrix):
-            logger.info(f"Running {len(suite.cases)} with {params}")
-            for n, case in enumerate(suite.cases):
-                logger.debug(f"Running case {n+1}/{len(suite.cases)}")
-                result = self.run_case(case, params, suite)
-                yield result
+        for _, view in self.run_suites_iter([suite]):
+            yield view
+
+    def run_suites(self, suites: List[Suite]) -> List[ResultSet]:
+        """
+        Run several suites together.
+
+        :param suites:
+        :return: the results of each suite, in the order of the suites
+        """
+        results = {id(suite): ResultSet(interner=self.interner) for suite in suites}
+        for suite, view in self.run_suites_iter(suites):
+            results[id(suite)].append(view)
+        return [results[id(suite)] for suite in suites]
+
+    def run_suites_iter(self, suites: List[Suite]) -> Iterator[Tuple[Suite, ResultView]]:
+        """
+        Run several suites through one pipeline, iterating over the results with their suite.
+
+        The cells of the suites are interleaved and share the runner's models,
+        store and per-provider workers, so running many small suites together
+        takes about as long as one suite with all of their cells. Cells with
+        the same generation inputs (see :func:`llm_matrix.planner.generation_fingerprint`),
+        e.g. the same prompt and model in two suites, are generated once.
+
+        :param suites:
+        :return:
+        """
+        for suite in suites:
+            logger.info(f"Running suite {suite.name}")
+        # open the store before any worker threads need it
+        self._get_store()
+        if self.progress and self.progress.total is None:
+            self.progress.total = sum(1 for suite in suites for _ in self._iter_cells(suite))
+        with self.active_run():
+            for cell in self.pipeline().run(_interleave([self._iter_cells(suite) for suite in suites])):
+                if self.progress:
+                    self.progress.update(cell)
+                if cell.error:
+                    continue
+                yield cell.suite, ResultView.from_result(cell.result, self.interner)
+
+    @contextmanager
+    def active_run(self) -> Iterator["LLMRunner"]:
+        """
+        Mark the runner as running cells, e.g. around a pipeline run.
+
+        Runs may overlap; when the last one ends, the responses shared between
+        cells (which are in the store by then) are dropped, and the worker
+        processes of ``local_models`` are stopped.
+
+        Example:
+
+            >>> runner = LLMRunner()
+            >>> with runner.active_run():
+            ...     runner._active_runs
+            1
+            >>> runner._active_runs
+            0
+
+        :return:
+        """
+        with self._lock:
+            self._active_runs += 1
+        try:
+            yield self
+        finally:
+            local_pool = None
+            with self._lock:
+                self._active_runs -= 1
+                if not self._active_runs:
+                    self._responses.clear()
+                    self._response_locks.clear()
+                    local_pool, self._local_pool = self._local_pool, None
+            if local_pool:
+                local_pool.close()
+
+    def _iter_cells(self, suite: Suite) -> Iterator[Cell]:
+        cells = iter_cells(suite)
+        if self.shard:
+            logger.info(f"Selecting shard {self.shard.index}/{self.shard.count}")
+            cells = (cell for cell in cells if self.shard.contains(cell))
+        if self.config and self.config.order_by_latency:
+            cells = iter(self._order_by_latency(list(cells)))
+        return cells
+
+    def _order_by_latency(self, cells: List[Cell]) -> List[Cell]:
+        latencies = self._get_store().model_latencies()
+        logger.info(f"Ordering cells by past model latency: {latencies}")
+        # models without telemetry go last; the sort is stable, so case order is kept
+        return sorted(
+            cells,
+            key=lambda cell: latencies.get(str(cell.hyperparameters.get("model")), float("inf")),
+        )
+
+    def provider(self, cell: Cell) -> Optional[str]:
+        """
+        The provider a cell is generated by, or None if it needs no generation.
+
+        Providers come from the ``model_providers`` config, falling back to
+        :attr:`AIModel.provider`; ``local_models`` share the ``local`` provider,
+        and are not loaded in this process.
+
+        :param cell:
+        :return:
+        """
+        if cell.action != Action.GENERATE:
+            return None
+        if self.is_local(cell.hyperparameters):
+            return LOCAL_PROVIDER
+        model_name = self.resolve_parameters(cell.hyperparameters).get("model")
+        if self.config and self.config.model_providers and model_name in self.config.model_providers:
+            return self.config.model_providers[model_name]
+        key = str(model_name)
+        if key not in self._providers:
+            try:
+                model = self.get_aimodel(self.resolve_parameters(cell.hyperparameters), suite=cell.suite)
+                self._providers[key] = model.provider
+            except Exception as e:
+                if not self._continue_on_error:
+                    raise
+                # the cell fails when it is generated, and is counted there
+                logger.error(f"Cannot load model {model_name}: {e}")
+                self._providers[key] = key
+        return self._providers[key]
+
+    def _provider_workers(self, provider: Optional[str]) -> int:
+        config = self.config or LLMRunnerConfig()
+        if provider is None:
+            return 1
+        if config.provider_concurrency and provider in config.provider_concurrency:
+            return config.provider_concurrency[provider]
+        if provider == LOCAL_PROVIDER:
+            # enough threads to keep every worker process busy
+            return self.local_pool().size
+        return config.generation_workers or 1
+
+    def pipeline(self) -> Pipeline:
+        """
+        Build the staged pipeline used to run cells.
+
+        The stages are:
+
+        - ``probe``: plan the cell against the store (see :func:`llm_matrix.planner.plan_cell`);
+          up-to-date results skip the remaining stages
+        - ``generate``: prompt the model under test, for cells that are not in the store or
+          whose generation inputs changed; each provider has its own queue and
+          ``provider_concurrency`` (default ``generation_workers``) threads, so
+          providers are called concurrently, up to the limit of each; ``local_models``
+          are prompted in worker processes (see :mod:`llm_matrix.localpool`)
+        - ``evaluate``: score batches of up to ``evaluation_batch_size`` new or rescored results
+          (``evaluation_workers`` threads)
+        - ``persist``: write batches of up to ``write_batch_size`` results to the store
+
+        :return:
+        """
+        config = self.config or LLMRunnerConfig()
+        queue_size = config.queue_size or DEFAULT_QUEUE_SIZE
+        return Pipeline(
+            [
+                Stage("probe", self._probe_cells, queue_size=queue_size),
+                Stage("generate", self._generate_cells, queue_size=queue_size,
+                      lane=self.provider, lane_workers=self._provider_workers),
+                Stage("evaluate", self._evaluate_cells, workers=config.evaluation_workers or 1,
+                      batch_size=config.evaluation_batch_size or DEFAULT_EVALUATION_BATCH_SIZE,
+                      queue_size=queue_size),
+                Stage("persist", self._persist_cells,
+                      batch_size=config.write_batch_size or DEFAULT_WRITE_BATCH_SIZE,
+                      queue_size=queue_size),
+            ],
+            done=lambda cell: cell.cached or cell.error is not None,
+        )
+
+    def _probe_cells(self, cells: List[Cell]) -> List[Cell]:
+        for cell in cells:
+            plan_cell(self, cell)
+            cell.cached = cell.action == Action.CACHED
+            if cell.result is not None and _replicated(cell):
+                # e.g. a result stored before the suite had replicates is the first one
+                cell.result.replicate = cell.replicate
+            if cell.action != Action.GENERATE:
+                logger.debug(f"{cell.action.value}: {cell.case.input} with {cell.hyperparameters} ({cell.reason})")
+        return cells
+
+    def _generate_cells(self, cells: List[Cell]) -> List[Cell]:
+        for cell in cells:
+            if cell.action != Action.GENERATE:
+                continue
+            logger.debug(f"Generating {cell.case.input} with {cell.hyperparameters} ({cell.reason})")
+            try:
+                cell.result = self._generate_shared(cell)
+            except Exception as e:
+                if not self._continue_on_error:
+                    raise
+                logger.error(f"Failed to generate {cell.case.input} with {cell.hyperparameters}: {e}")
+                cell.error = str(e)
+        return cells
+
+    def _evaluate_cells(self, cells: List[Cell]) -> List[Cell]:
+        from llm_matrix.metrics import evaluate_results
+        to_evaluate = [cell for cell in cells if cell.action in (Action.GENERATE, Action.RESCORE)]
+        for cell in to_evaluate:
+            if cell.action == Action.RESCORE:
+                template = self.get_template(cell.case, cell.suite)
+                cell.result.metrics = template.metrics if template else None
+                cell.result.score = None
+                cell.result.evaluation_message = None
+                cell.result.evaluation_tier = None
+        try:
+            evaluate_results([cell.result for cell in to_evaluate], runner=self)
+        except Exception as e:
+            if not self._continue_on_error:
+                raise
+            # the batch is scored together, so all of its cells are failed
+            logger.error(f"Failed to evaluate a batch of {len(to_evaluate)} results: {e}")
+            for cell in to_evaluate:
+                cell.error = str(e)
+        return cells
+
+    def _generate_shared(self, cell: Cell) -> TestCaseResult:
+        """
+        Generate the result of a cell, reusing the response of an earlier cell with the same generation inputs.
+
+        Replicates have the same generation inputs, so their responses are
+        shared by index: the first replicate to be generated samples the
+        completions of all replicates of the cell that need generating, in
+        one request where the model supports it.
+        """
+        replicate = cell.replicate if _replicated(cell) else None
+        if not cell.fingerprint:
+            return self._with_replicate(self.generate(cell.case, cell.hyperparameters, cell.suite), replicate)
+        key = generation_fingerprint(cell.fingerprint)
+        with self._lock:
+            lock = self._response_locks.setdefault(key, threading.Lock())
+        response_key = key if replicate is None else f"{key}:{replicate}"
+        # a cell with the same inputs being generated by another worker is waited for
+        with lock:
+            response = self._responses.get(response_key)
+            if response is None and replicate is None:
+                result = self.generate(cell.case, cell.hyperparameters, cell.suite)
+                self._responses[key] = result.response
+                return result
+            if response is None:
+                indices = sorted([replicate, *self._replicates_to_generate(cell, key)])
+                results = self.generate_samples(cell.case, cell.hyperparameters, cell.suite, len(indices))
+                for i, result in zip(indices, results):
+                    self._responses[f"{key}:{i}"] = result.response
+                return self._with_replicate(results[indices.index(replicate)], replicate)
+        logger.debug(f"Sharing the response for {cell.case.input} with {cell.hyperparameters}")
+        template = self.get_template(cell.case, cell.suite)
+        return TestCaseResult(
+            case=cell.case,
+            response=response.model_copy(),
+            hyperparameters=cell.hyperparameters,
+            metrics=template.metrics if template else None,
+            **({"replicate": replicate} if replicate is not None else {}),
+        )
+
+    def _replicates_to_generate(self, cell: Cell, key: str) -> List[int]:
+        """The other replicates of a cell (in the runner's shard) that need generating, by planning them."""
+        indices = []
+        for i in range(cell.suite.matrix.replicates):
+            if i == cell.replicate or f"{key}:{i}" in self._responses:
+                continue
+            sibling = Cell(suite=cell.suite, case=cell.case, hyperparameters=cell.hyperparameters, replicate=i)
+            if self.shard and not self.shard.contains(sibling):
+                continue
+            plan_cell(self, sibling)
+            if sibling.action == Action.GENERATE and generation_fingerprint(sibling.fingerprint) == key:
+                indices.append(i)
+        return indices
+
+    @staticmethod
+    def _with_replicate(result: TestCaseResult, replicate: Optional[int]) -> TestCaseResult:
+        if replicate is not None:
+            result.replicate = replicate
+        return result
+
+    @property
+    def _continue_on_error(self) -> bool:
+        return bool(self.config and self.config.continue_on_error)
+
+    def _persist_cells(self, cells: List[Cell]) -> List[Cell]:
+        store = self._get_store()
+        by_suite: Dict[int, List[Cell]] = {}
+        for cell in cells:
+            if cell.error:
+                continue
+            by_suite.setdefault(id(cell.suite), []).append(cell)
+        for suite_cells in by_suite.values():
+            store.add_results(
+                suite_cells[0].suite,
+                [cell.result for cell in suite_cells],
+                fingerprints=[cell.fingerprint for cell in suite_cells],
+            )
+        return cells
 
     def run_case(self, case: TestCase, params: Dict[str, Any], suite: Suite) -> TestCaseResult:
         logger.info(f"Running case {case.input} with {params}")
-        store = self._get_store()
-        cached = store.get_result(suite, case, params)
-        if cached:
-            return cached
-        actual_params = copy(params)
-        if self.config and "model" in params:
-            model_logical_name = params["model"]
-            actual_params["model"] = self.config.model_name_map.get(model_logical_name, model_logical_name)
-            logger.info(f"Mapping model {model_logical_name} to {actual_params['model']}")
-        model = self.get_aimodel(actual_params, suite=suite)
+        cells = [Cell(suite=suite, case=case, hyperparameters=params)]
+        with self.active_run():
+            self._probe_cells(cells)
+            if not cells[0].cached:
+                for stage in (self._generate_cells, self._evaluate_cells, self._persist_cells):
+                    stage(cells)
+        result = cells[0].result
+        return result.to_result() if isinstance(result, ResultView) else result
+
+    def plan(self, suite: Suite) -> List[Cell]:
+        """
+        Plan the suite without running it.
+
+        Each cell is compared against the store (see :mod:`llm_matrix.planner`)
+        and gets an ``action`` (cached, reuse, rescore or generate) and a
+        ``reason``.
+
+        :param suite:
+        :return:
+        """
+        return list(plan_suite(self, suite, self._iter_cells(suite)))
+
+    def generate(self, case: TestCase, params: Dict[str, Any], suite: Suite) -> TestCaseResult:
+        """
+        Generate an (unscored) result for a case, bypassing the store.
+
+        :param case:
+        :param params:
+        :param suite:
+        :return:
+        """
+        actual_params = self.resolve_parameters(params)
         template = self.get_template(case, suite)
-        response = model.prompt(case.input, template=template, case=case)
-        result = TestCaseResult(
+        streaming = bool(self.config and self.config.streaming)
+        stop_patterns = self.stop_patterns(template) if streaming else []
+        if self.is_local(params):
+            model_info = suite.models.get(actual_params.get("model")) if suite and suite.models else None
+            if model_info and model_info.plugins:
+                # workers build plain models; a plugin would be silently skipped
+                raise ValueError(
+                    f"Model {actual_params.get('model')} uses plugins {model_info.plugins}, "
+                    f"which local_models do not support"
+                )
+            parameters = {**actual_params, **(model_info.parameters if model_info else {})}
+            with self.active_run():
+                response = self.request_hedger().call(
+                    str(params.get("model")),
+                    lambda cancel: self.local_pool().prompt(
+                        parameters,
+                        case.input,
+                        template=template,
+                        case=case,
+                        stream=streaming,
+                        stop_patterns=stop_patterns,
+                        cancel=cancel,
+                    ),
+                    tracker=self.progress,
+                )
+        else:
+            model = self.get_aimodel(actual_params, suite=suite)
+            response = self.request_hedger().call(
+                str(params.get("model")),
+                lambda cancel: model.prompt(
+                    case.input,
+                    template=template,
+                    case=case,
+                    stream=streaming,
+                    stop=(lambda text: all(p.search(text) for p in stop_patterns)) if stop_patterns else None,
+                    cancel=cancel,
+                ),
+                tracker=self.progress,
+            )
+        return TestCaseResult(
             case=case,
             response=response,
             hyperparameters=params,
             metrics=template.metrics if template else None,
         )
-        from llm_matrix.metrics import evaluate_result
-        evaluate_result(result, runner=self)
-        store.add_result(suite, result)
-        return result
+
+    def request_hedger(self) -> RequestHedger:
+        """
+        The deadlines and hedging applied to calls to the models under test.
+
+        With ``hedge_requests``, calls are hedged from the start of a run, using
+        the latency quantiles of past results in the store until enough calls
+        have been made in this run.
+
+        :return:
+        """
+        with self._lock:
+            if self._hedger is None:
+                config = self.config or LLMRunnerConfig()
+                quantile = config.hedge_quantile or DEFAULT_HEDGE_QUANTILE
+                self._hedger = RequestHedger(
+                    timeout=config.request_timeout,
+                    model_timeouts=config.model_timeouts or {},
+                    hedge=bool(config.hedge_requests),
+                    quantile=quantile,
+                    budget=config.hedge_budget if config.hedge_budget is not None else DEFAULT_HEDGE_BUDGET,
+                    baseline=self._get_store().model_latency_quantiles(quantile) if config.hedge_requests else {},
+                )
+            return self._hedger
+
+    def generate_samples(self, case: TestCase, params: Dict[str, Any], suite: Suite, n: int) -> List[TestCaseResult]:
+        """
+        Generate n (unscored) results for a case, bypassing the store.
+
+        Models that can sample several completions in one request (see
+        :attr:`AIModel.supports_samples`) are prompted once, within the
+        model's deadline; other models, and all models when ``streaming``
+        (which reads one completion per request), are prompted n times concurrently.
+
+        :param case:
+        :param params:
+        :param suite:
+        :param n:
+        :return:
+        """
+        if n == 1:
+            return [self.generate(case, params, suite)]
+        streaming = bool(self.config and self.config.streaming)
+        model = None if self.is_local(params) else self.get_aimodel(self.resolve_parameters(params), suite=suite)
+        if model is None or streaming or not model.supports_samples:
+            # one run around the calls, so local models keep their worker processes
+            with self.active_run(), ThreadPoolExecutor(n, thread_name_prefix="sample") as pool:
+                return list(pool.map(lambda _: self.generate(case, params, suite), range(n)))
+        template = self.get_template(case, suite)
+        responses = self.request_hedger().call(
+            str(params.get("model")),
+            lambda cancel: model.prompt_samples(case.input, n, template=template, case=case, cancel=cancel),
+            tracker=self.progress,
+        )
+        return [
+            TestCaseResult(
+                case=case,
+                response=response,
+                hyperparameters=params,
+                metrics=template.metrics if template else None,
+            )
+            for response in responses
+        ]
+
+    def is_local(self, params: Dict[str, Any]) -> bool:
+        """
+        True if the model of a cell is run in the pool of worker processes.
+
+        >>> runner = LLMRunner(config=LLMRunnerConfig(local_models=["llama-3"]))
+        >>> runner.is_local({"model": "llama-3"}), runner.is_local({"model": "gpt-4o"})
+        (True, False)
+
+        :param params: hyperparameters, before or after ``model_name_map``
+        :return:
+        """
+        if not (self.config and self.config.local_models):
+            return False
+        model_name = params.get("model")
+        return model_name in self.config.local_models or \
+            self.resolve_parameters(params).get("model") in self.config.local_models
+
+    def local_pool(self) -> LocalModelPool:
+        """
+        The worker processes running ``local_models``.
+
+        Models are loaded in the workers, never in this process; the pool
+        is stopped when the last run of the runner finishes (see
+        :meth:`active_run`). Outside a run, e.g. when calling :meth:`generate`
+        directly, it is started and stopped for each call.
+
+        :return:
+        """
+        with self._lock:
+            if self._local_pool is None:
+                config = self.config or LLMRunnerConfig()
+                self._local_pool = LocalModelPool(
+                    workers=config.local_workers,
+                    imports=config.local_model_imports or [],
+                )
+            return self._local_pool
+
+    def stop_patterns(self, template: Optional[Template]) -> List[re.Pattern]:
+        """
+        The patterns that must all match before a streamed response can be cut short.
+
+        Early termination only applies if every metric of the template declares
+        a ``prefix_pattern``; the ``stream_stop_pattern`` of the config, if set,
+        replaces the metrics' own patterns.
+
+        :param template:
+        :return: empty if the full response is needed
+        """
+        from llm_matrix.metrics import METRIC_REGISTRY
+        metrics = template.metrics if template else None
+        if not metrics:
+            return []
+        patterns = [getattr(METRIC_REGISTRY.get(m), "prefix_pattern", None) for m in metrics]
+        if not all(patterns):
+            return []
+        if self.config and self.config.stream_stop_pattern:
+            return [re.compile(self.config.stream_stop_pattern)]
+        return list({p.pattern: p for p in patterns}.values())
+
+    def resolve_parameters(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Map logical hyperparameters to the parameters passed to the model.
+
+        This applies the ``model_name_map`` of the runner config.
+
+        :param params:
+        :return:
+        """
+        actual_params = copy(params)
+        if self.config and self.config.model_name_map and "model" in params:
+            model_logical_name = params["model"]
+            actual_params["model"] = self.config.model_name_map.get(model_logical_name, model_logical_name)
+            logger.info(f"Mapping model {model_logical_name} to {actual_params['model']}")
+        return actual_params
 
     def get_template(self, case, suite: Suite) -> Optional[Template]:
         tn = case.template
@@ -82,9 +709,15 @@ class LLMRunner:
         return suite.templates[tn]
 
     def get_aimodel(self, params: Dict[str, Any], suite: Suite=None) -> AIModel:
+        with self._lock:
+            return self._get_aimodel(params, suite=suite)
+
+    def _get_aimodel(self, params: Dict[str, Any], suite: Suite=None) -> AIModel:
         if not self._aimodels:
             self._aimodels = {}
-        key = tuple(sorted(params.items()))
+        model_info = suite.models.get(params.get("model")) if suite and suite.models else None
+        # suites may configure a model of the same name differently
+        key = (tuple(sorted(params.items())), model_info.model_dump_json() if model_info else None)
         if key not in self._aimodels:
             if suite and suite.models:
                 bespoke_models = suite.models
@@ -110,3 +743,23 @@ class LLMRunner:
             self._store = Store(self.store_path)
         return self._store
 
+
+def _replicated(cell: Cell) -> bool:
+    """True if the cell is one of several replicates."""
+    return (cell.suite.matrix.replicates or 1) > 1
+
+
+def _interleave(iterators: List[Iterator[Cell]]) -> Iterator[Cell]:
+    """
+    Take items from each iterator in turn until all are exhausted.
+
+    >>> list(_interleave([iter("ab"), iter("xyz")]))
+    ['a', 'x', 'b', 'y', 'z']
+    """
+    iterators = list(iterators)
+    while iterators:
+        for it in list(iterators):
+            try:
+                yield next(it)
+            except StopIteration:
+                iterators.remove(it)
@@ -1,7 +1,7 @@
 import logging
 from enum import Enum
 from pathlib import Path
-from typing import Optional, List, Dict, Any, Union, TextIO
+from typing import Optional, List, Dict, Any, Union, TextIO, Tuple
 
 import pandas as pd
 import yaml
@@ -54,6 +54,8 @@ class MetricEnum(Enum):
     SIMPLE_QUESTION = "simple_question"
     LIST_MEMBERSHIP = "list_membership"
     RANKED_LIST = "ranked_list"
+    LIST_MEMBERSHIP_LOCAL = "list_membership_local"
+    RANKED_LIST_LOCAL = "ranked_list_local"
     NARRATIVE_SIMILARITY = "narrative_similarity"
     REVIEW = "review"
     BLEU = "bleu"
@@ -67,6 +69,15 @@ class Response(StrictBaseModel):
     text : str = Field(..., description="The text of the response from the AI model")
     prompt: Optional[str] = Field(None, description="The prompt used to generate the response")
     system: Optional[str] = Field(None, description="The system prompt used to generate the response")
+    latency: Optional[float] = Field(None, description="Seconds taken to generate the response")
+    time_to_first_token: Optional[float] = Field(
+        None,
+        description="Seconds until the first chunk of a streamed response arrived"
+    )
+    truncated: Optional[bool] = Field(
+        None,
+        description="True if reading a streamed response stopped early, once the needed prefix had arrived"
+    )
 
 
 class Template(StrictBaseModel):
@@ -83,6 +94,12 @@ class Matrix(StrictBaseModel):
     """
     hyperparameters: Dict[Hyperparameter, List[Any]] = Field(..., description="Hyperparameters to be evaluated")
     exclude: Optional["Matrix"] = Field(None, description="Hyperparameters to be excluded")
+    replicates: Optional[int] = Field(
+        None,
+        description="Number of completions sampled for each case and hyperparameter combination, "
+                    "e.g. to measure the stability of answers at a non-zero temperature",
+        ge=1,
+    )
 
 class TestCase(StrictBaseModel):
     """
@@ -117,6 +134,15 @@ class TestCaseResult(StrictBaseModel):
     metrics: Optional[List[Metric]] = Field(None, description="Metrics to be evaluated")
     score: Optional[float] = Field(None, description="Score for the test case", ge=0, le=1)
     evaluation_message: Optional[str] = Field(None, description="Message from the evaluation")
+    replicate: Optional[int] = Field(
+        None,
+        description="Index of the sampled completion, for suites with several replicates",
+        ge=0,
+    )
+    evaluation_tier: Optional[str] = Field(
+        None,
+        description="Tier of the evaluation cascade that produced the score, e.g. exact_match or llm",
+    )
 
     def as_flat_dict(self, **kwargs) -> Dict[str, Any]:
         top_dict = super().as_flat_dict(**kwargs)
@@ -153,7 +179,42 @@ def load_suite(input_path: Union[str, Path, TextIO], syntax="yaml") -> Suite:
     logger.info(f"Loaded suite from {input_path}")
     return Suite(**obj)
 
+def load_suites(input_paths: List[Union[str, Path]]) -> List[Tuple[Path, Suite]]:
+    """
+    Load suites from suite files and manifests.
+
+    A manifest is a YAML file listing suite files, relative to the manifest:
+
+    .. code-block:: yaml
+
+        suites:
+          - genes/suite.yaml
+          - diseases/suite.yaml
+
+    :param input_paths: suite files or manifests
+    :return: the path and suite of each suite file, in order
+    """
+    suites = []
+    for input_path in input_paths:
+        input_path = Path(input_path)
+        with input_path.open() as f:
+            obj = yaml.safe_load(f)
+        if isinstance(obj, dict) and "suites" in obj and "cases" not in obj:
+            logger.info(f"Loaded manifest from {input_path}")
+            suites.extend(load_suites([input_path.parent / p for p in obj["suites"]]))
+        else:
+            logger.info(f"Loaded suite from {input_path}")
+            suites.append((input_path, Suite(**obj)))
+    return suites
+
 def results_to_dataframe(results: List[TestCaseResult]) -> pd.DataFrame:
+    """
+    One row per result.
+
+    Also accepts a :class:`llm_matrix.results.ResultSet`, which flattens its views without building full models.
+    """
+    if hasattr(results, "to_dataframe"):
+        return results.to_dataframe()
     flat_results = [r.as_flat_dict() for r in results]
     return pd.DataFrame(flat_results)
 
@@ -0,0 +1,246 @@
+"""
+A long-running evaluation server, and a client to submit jobs to it.
+
+The server keeps one :class:`LLMRunner` for its lifetime, so the store
+connection, loaded models and imports are paid for once rather than on
+every invocation. Jobs are suites, posted as YAML or JSON; a small
+evaluation is a suite with a few cases. Results are streamed back as JSON
+lines as they complete.
+
+The API is local only: the server listens on a loopback TCP port, or on a
+Unix socket.
+
+- ``GET /health``: the store path, uptime, and number of jobs served
+- ``POST /run``: run the posted suite; the response is a stream of JSON
+  lines, each an event with a ``type``: ``result`` (with the ``result``),
+  then a final ``summary`` (number of results and seconds taken), or
+  ``error`` (with a ``message``) if the job failed
+
+Concurrent jobs run concurrently, each with its own pipeline, sharing the
+runner's models and store.
+"""
+import http.client
+import json
+import logging
+import socket
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Union
+from urllib.parse import urlparse
+
+import yaml
+
+from llm_matrix.runner import LLMRunner
+from llm_matrix.schema import Suite, TestCaseResult
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_SERVER_URL = f"http://{DEFAULT_HOST}:{DEFAULT_PORT}"
+
+Event = Dict[str, Any]
+
+
+class JobHandler(BaseHTTPRequestHandler):
+    """Handle job API requests, using the runner of the server."""
+
+    server: Union["EvaluationServer", "UnixEvaluationServer"]
+
+    def do_GET(self):
+        if self.path != "/health":
+            self.send_error(404, f"No such endpoint: {self.path}")
+            return
+        body = json.dumps({
+            "status": "ok",
+            "store": str(self.server.runner.store_path),
+            "uptime": time.monotonic() - self.server.started,
+            "jobs": self.server.jobs,
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if self.path != "/run":
+            self.send_error(404, f"No such endpoint: {self.path}")
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            suite = Suite(**yaml.safe_load(self.rfile.read(length)))
+        except Exception as e:
+            self.send_error(400, f"Invalid suite: {e}")
+            return
+        job = self.server.next_job()
+        logger.info(f"Job {job}: suite {suite.name} with {len(suite.cases)} cases")
+        # no content length: the stream ends when the connection closes
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        start = time.monotonic()
+        n = 0
+        results = self.server.runner.run_iter(suite)
+        try:
+            for view in results:
+                self._send_event({"type": "result", "result": view.model_dump(mode="json")})
+                n += 1
+        except (BrokenPipeError, ConnectionResetError):
+            logger.warning(f"Client went away during suite {suite.name}")
+            return
+        except Exception as e:
+            logger.exception(f"Job for suite {suite.name} failed")
+            self._send_event({"type": "error", "message": str(e)})
+            return
+        finally:
+            # stops the pipeline if the job did not finish
+            results.close()
+        self._send_event({"type": "summary", "results": n, "seconds": time.monotonic() - start})
+
+    def _send_event(self, event: Event):
+        self.wfile.write((json.dumps(event) + "\n").encode("utf-8"))
+        self.wfile.flush()
+
+    def address_string(self) -> str:
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else "local"
+
+    def log_message(self, format: str, *args):
+        logger.info(f"{self.address_string()} {format % args}")
+
+
+class _JobServerMixin:
+    """State shared by the handlers of a server."""
+    daemon_threads = True
+
+    def _init_jobs(self, runner: LLMRunner):
+        self.runner = runner
+        self.started = time.monotonic()
+        self.jobs = 0
+        self._jobs_lock = threading.Lock()
+
+    def next_job(self) -> int:
+        with self._jobs_lock:
+            self.jobs += 1
+            return self.jobs
+
+
+class EvaluationServer(_JobServerMixin, ThreadingHTTPServer):
+    """An HTTP server on a TCP port, holding a runner."""
+
+    def __init__(self, address, runner: LLMRunner):
+        super().__init__(address, JobHandler)
+        self._init_jobs(runner)
+
+
+class UnixEvaluationServer(_JobServerMixin, socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """An HTTP server on a Unix socket, holding a runner."""
+
+    def __init__(self, path: Union[str, Path], runner: LLMRunner):
+        super().__init__(str(path), JobHandler)
+        self._init_jobs(runner)
+
+
+def make_server(
+    runner: LLMRunner,
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    socket_path: Optional[Union[str, Path]] = None,
+) -> Union[EvaluationServer, UnixEvaluationServer]:
+    """
+    Create a server for a runner, opening its store.
+
+    :param runner:
+    :param host: TCP host, used if no socket path is given
+    :param port: TCP port; 0 picks a free port
+    :param socket_path: listen on this Unix socket instead of a TCP port
+    :return: a server; call ``serve_forever`` to start handling jobs
+    """
+    runner._get_store()
+    if socket_path:
+        socket_path = Path(socket_path)
+        if socket_path.exists():
+            socket_path.unlink()
+        return UnixEvaluationServer(socket_path, runner)
+    return EvaluationServer((host, port), runner)
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: Optional[float] = None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def _connect(server_url: str, timeout: Optional[float] = None) -> http.client.HTTPConnection:
+    """Connect to ``http://host:port`` or ``unix:///path/to/socket``."""
+    url = urlparse(server_url)
+    if url.scheme == "unix":
+        return _UnixHTTPConnection(url.path, timeout=timeout)
+    if url.scheme == "http":
+        return http.client.HTTPConnection(url.hostname, url.port or DEFAULT_PORT, timeout=timeout)
+    raise ValueError(f"Unsupported server URL {server_url}; use http://host:port or unix:///path")
+
+
+def server_health(server_url: str = DEFAULT_SERVER_URL, timeout: float = 5.0) -> Dict[str, Any]:
+    """
+    Get the health of a server.
+
+    :param server_url:
+    :param timeout:
+    :return:
+    """
+    conn = _connect(server_url, timeout=timeout)
+    try:
+        conn.request("GET", "/health")
+        response = conn.getresponse()
+        if response.status != 200:
+            raise ConnectionError(f"Server returned {response.status} {response.reason}")
+        return json.loads(response.read())
+    finally:
+        conn.close()
+
+
+def submit_suite(suite: Union[Suite, str], server_url: str = DEFAULT_SERVER_URL) -> Iterator[Event]:
+    """
+    Submit a suite to a server, iterating over the events it streams back.
+
+    :param suite: a suite, or the YAML or JSON text of one
+    :param server_url: ``http://host:port`` or ``unix:///path/to/socket``
+    :return: events, as described in this module
+    """
+    body = suite.model_dump_json(exclude_unset=True) if isinstance(suite, Suite) else suite
+    conn = _connect(server_url)
+    try:
+        conn.request("POST", "/run", body=body.encode("utf-8"), headers={"Content-Type": "application/yaml"})
+        response = conn.getresponse()
+        if response.status != 200:
+            raise ValueError(f"Server rejected the job: {response.status} {response.read().decode('utf-8', 'replace')}")
+        for line in response:
+            if line.strip():
+                yield json.loads(line)
+    finally:
+        conn.close()
+
+
+def submit_results(suite: Union[Suite, str], server_url: str = DEFAULT_SERVER_URL) -> Iterator[TestCaseResult]:
+    """
+    Submit a suite to a server, iterating over the results as they complete.
+
+    :param suite: a suite, or the YAML or JSON text of one
+    :param server_url:
+    :return:
+    """
+    for event in submit_suite(suite, server_url):
+        if event["type"] == "result":
+            yield TestCaseResult.model_validate(event["result"])
+        elif event["type"] == "error":
+            raise RuntimeError(f"Job failed on the server: {event['message']}")
@@ -1,18 +1,57 @@
+import hashlib
+import json
 import logging
-from dataclasses import dataclass
-from typing import Optional
+import os
+import threading
+import zlib
+from dataclasses import dataclass, field
+from functools import cached_property
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional, List, Union, Dict, Any, Tuple, Iterable, Iterator
 import duckdb
+import pandas as pd
 
 from llm_matrix import TestCase
+from llm_matrix.results import ResultInterner, ResultSet, ResultView, decode_view
 from llm_matrix.schema import TestCaseResult, Response, Suite
 
 logger = logging.getLogger(__name__)
 
+SCHEMA_VERSION = 4
+
+# columns derived from the result JSON on insert, for filtering and aggregation
+TYPED_COLUMNS = {
+    "model": "VARCHAR",
+    "score": "DOUBLE",
+    "response_text": "VARCHAR",
+    "evaluation_message": "VARCHAR",
+    "tags": "VARCHAR[]",
+    "hyperparameter_values": "MAP(VARCHAR, VARCHAR)",
+}
+
+# fingerprints of the inputs a result was computed from (see llm_matrix.planner)
+FINGERPRINT_COLUMNS = {
+    "fingerprint": "JSON",
+    "generation_fingerprint": "VARCHAR",
+}
+
+# texts at least this long are compressed in the blobs table
+COMPRESSION_THRESHOLD = 256
+BLOB_CACHE_SIZE = 10000
+FETCH_BATCH_SIZE = 1000
+INSERT_BATCH_SIZE = 200
+
+def suite_key(suite: Suite) -> str:
+    """The name a suite's results are stored under, including its version."""
+    if suite.version:
+        return f"{suite.name}--{suite.version}"
+    return suite.name
+
+
 def unique_key(suite: Suite, case: TestCase, hyperparameters: dict) -> tuple:
     """Generate a unique key for a test result."""
-    suite_name = suite.name
-    if suite.version:
-        suite_name += f"--{suite.version}"
+    suite_name = suite_key(suite)
 
     def empty(v):
         return v is None or (isinstance(v, (str, list, dict)) and not v)
@@ -20,6 +59,27 @@ def unique_key(suite: Suite, case: TestCase, hyperparameters: dict) -> tuple:
 
 
 
+@dataclass
+class StoreEntry:
+    """
+    A stored result together with the fingerprint of the inputs it was computed from.
+
+    The result is only decoded when accessed, either as a full model
+    (``result``) or as a lightweight view (:meth:`view`).
+    """
+    encoded: str
+    store: "Store" = field(repr=False)
+    fingerprint: Optional[Dict[str, str]] = None
+    suite_name: Optional[str] = None
+
+    @cached_property
+    def result(self) -> TestCaseResult:
+        return self.store._decode(self.encoded)
+
+    def view(self, interner: Optional[ResultInterner] = None) -> ResultView:
+        return self.store._decode_view(self.encoded, interner or ResultInterner())
+
+
 @dataclass
 class Store:
     """A persistent store using DuckDB to cache test results with JSON support for Pydantic models.
@@ -37,68 +97,861 @@ class Store:
 
     To use an in-memory database, pass `None` as the `db_path`:
 
-        >>> store = Store(None)
+        >>> in_memory_store = Store(None)
+
+    A store can be shared between threads; each thread gets its own cursor
+    on the same database.
+
+    Cases, rendered prompts and system prompts are interned in a
+    content-addressed ``blobs`` table (compressed when large), and each row of
+    ``results`` refers to them by hash, so e.g. a long system prompt shared by
+    every model is stored once. Rows written in the older layout, with the full
+    result inline, are still read; :func:`compact_store` rewrites them.
+
+    The model, score, response text, evaluation message, case tags and
+    hyperparameter values (as strings) are also written as typed, indexed
+    columns, so queries need not decode the result JSON:
+
+        >>> store.query("SELECT model, score, hyperparameter_values['model'] AS m FROM results")
+           model  score      m
+        0  gpt-4    NaN  gpt-4
+
+    Results are keyed by suite (and version), case input and ideal,
+    hyperparameters, and replicate index (0 unless the suite samples several
+    completions per cell).
+
+    The layout is versioned; stores written by older versions are migrated
+    when opened.
 
     """
     db_path: Optional[str] = None
     _conn: Optional[duckdb.DuckDBPyConnection] = None
+    _local: threading.local = field(default_factory=threading.local, repr=False)
+    _blob_cache: Dict[str, str] = field(default_factory=dict, repr=False)
+    _blob_cache_lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+    _write_lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
 
     def __post_init__(self):
-        """Initialize the database connection and create the table if it doesn't exist."""
+        """Initialize the database connection, creating or migrating the tables."""
         self._conn = duckdb.connect(str(self.db_path) if self.db_path else ":memory:")
-        # Using JSON type for storing Pydantic models and hyperparameters
+        is_new = not self._has_table("results")
         self._conn.execute("""
-            CREATE TABLE IF NOT EXISTS results (
+            CREATE TABLE IF NOT EXISTS store_info (
+                key VARCHAR PRIMARY KEY,
+                value VARCHAR
+            )
+        """)
+        self._create_results_table("results")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                hash VARCHAR PRIMARY KEY,
+                codec VARCHAR,
+                data BLOB
+            )
+        """)
+        if is_new:
+            self._create_indexes()
+            self._set_schema_version(SCHEMA_VERSION)
+        else:
+            self._migrate()
+
+    @property
+    def schema_version(self) -> int:
+        """The layout version of the store; stores written before versioning are version 1."""
+        row = self._cursor().execute("SELECT value FROM store_info WHERE key = 'schema_version'").fetchone()
+        return int(row[0]) if row else 1
+
+    def _set_schema_version(self, version: int):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO store_info (key, value) VALUES ('schema_version', ?)", (str(version),)
+        )
+
+    def _has_table(self, name: str) -> bool:
+        return self._conn.execute(
+            "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ? AND table_schema = 'main'",
+            (name,)
+        ).fetchone()[0] > 0
+
+    def _create_results_table(self, name: str):
+        typed_columns = "".join(
+            f"{column} {sql_type},\n" for column, sql_type in {**TYPED_COLUMNS, **FINGERPRINT_COLUMNS}.items()
+        )
+        # Using JSON type for storing Pydantic models and hyperparameters
+        self._conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {name} (
                 suite_name VARCHAR,
                 test_case VARCHAR,
                 ideal VARCHAR,
                 hyperparameters JSON,
+                replicate INTEGER NOT NULL DEFAULT 0,
                 result JSON,
-                PRIMARY KEY (suite_name, test_case, ideal, hyperparameters)
+                created_at TIMESTAMP,
+                {typed_columns}
+                PRIMARY KEY (suite_name, test_case, ideal, hyperparameters, replicate)
             )
         """)
 
+    def _create_indexes(self):
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_model_idx ON results (suite_name, model)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_score_idx ON results (suite_name, score)")
+
+    def _migrate(self):
+        """Bring a store written by an older version up to the current layout."""
+        migrations = {
+            2: self._add_typed_columns,
+            3: self._add_fingerprint_columns,
+            4: self._add_replicate_key,
+        }
+        version = self.schema_version
+        if version > SCHEMA_VERSION:
+            raise ValueError(f"Store {self.db_path} has layout version {version}, newer than {SCHEMA_VERSION}")
+        for target_version in range(version + 1, SCHEMA_VERSION + 1):
+            logger.info(f"Migrating store {self.db_path} to layout version {target_version}")
+            migrations[target_version]()
+            self._set_schema_version(target_version)
+
+    def _add_typed_columns(self):
+        """Migration to version 2: add and backfill the typed columns."""
+        # stores created before results were timestamped
+        self._conn.execute("ALTER TABLE results ADD COLUMN IF NOT EXISTS created_at TIMESTAMP")
+        for name, sql_type in TYPED_COLUMNS.items():
+            self._conn.execute(f"ALTER TABLE results ADD COLUMN IF NOT EXISTS {name} {sql_type}")
+        max_rowid = self._conn.execute("SELECT max(rowid) FROM results").fetchone()[0]
+        for start in range(0, (max_rowid or 0) + 1, FETCH_BATCH_SIZE):
+            rows = self._conn.execute(
+                "SELECT rowid, result FROM results WHERE rowid >= ? AND rowid < ?",
+                (start, start + FETCH_BATCH_SIZE)
+            ).fetchall()
+            if not rows:
+                continue
+            records = [(rowid, *_typed_values(self._decode(result))) for rowid, result in rows]
+            backfill = pd.DataFrame.from_records(
+                records,
+                columns=[
+                    "row_id", "model", "score", "response_text", "evaluation_message", "tags",
+                    "hyperparameter_names", "hyperparameter_values",
+                ],
+            ).astype({"score": object})
+            self._conn.register("typed_backfill", backfill)
+            try:
+                self._conn.execute("""
+                    UPDATE results SET
+                        model = b.model,
+                        score = b.score,
+                        response_text = b.response_text,
+                        evaluation_message = b.evaluation_message,
+                        tags = b.tags,
+                        hyperparameter_values = MAP(b.hyperparameter_names, b.hyperparameter_values)
+                    FROM typed_backfill b
+                    WHERE results.rowid = b.row_id
+                """)
+            finally:
+                self._conn.unregister("typed_backfill")
+        self._create_indexes()
+
+    def _add_fingerprint_columns(self):
+        """Migration to version 3: add the fingerprint columns; existing results have none."""
+        for name, sql_type in FINGERPRINT_COLUMNS.items():
+            self._conn.execute(f"ALTER TABLE results ADD COLUMN IF NOT EXISTS {name} {sql_type}")
+
+    def _add_replicate_key(self):
+        """Migration to version 4: add the replicate index to the key; existing results are replicate 0."""
+        # the primary key of a table cannot be altered, so the table is rebuilt
+        self._create_results_table("results_v4")
+        self._conn.execute("INSERT INTO results_v4 BY NAME SELECT * FROM results")
+        self._conn.execute("DROP TABLE results")
+        self._conn.execute("ALTER TABLE results_v4 RENAME TO results")
+        self._create_indexes()
+
     def add_result(self, suite: Suite, result: TestCaseResult):
         """Add a result to the store."""
-        self._conn.execute("""
-            INSERT OR REPLACE INTO results 
-            (suite_name, test_case, ideal, hyperparameters, result)
-            VALUES (?, ?, ?, ?, ?)
-        """, (
-            *unique_key(suite, result.case, result.hyperparameters),
-            result.model_dump_json(exclude_unset=True),
-        ))
-        logger.debug(f"Added result for {suite.name} {result.case} {result.hyperparameters}")
-        self._conn.commit()
+        self.add_results(suite, [result])
+
+    def add_results(
+        self,
+        suite: Suite,
+        results: List[TestCaseResult],
+        fingerprints: Optional[List[Optional[Dict[str, str]]]] = None
+    ):
+        """
+        Add a batch of results to the store in a single transaction.
 
-    def get_result(self, suite: Suite, case: TestCase, hyperparameters: dict) -> Optional[TestCaseResult]:
+        :param suite:
+        :param results:
+        :param fingerprints: optional fingerprint of each result (see :mod:`llm_matrix.planner`)
+        """
+        if not results:
+            return
+        now = _utcnow()
+        self._insert_rows(
+            (unique_key(suite, result.case, result.hyperparameters), result, now, fingerprint)
+            for result, fingerprint in zip(results, fingerprints or [None] * len(results))
+        )
+        for result in results:
+            logger.debug(f"Added result for {suite.name} {result.case} {result.hyperparameters}")
+
+    def get_result(
+        self, suite: Suite, case: TestCase, hyperparameters: dict, replicate: int = 0
+    ) -> Optional[TestCaseResult]:
         """Get a result from the store."""
-        result = self._conn.execute("""
-            SELECT result
+        entry = self.get_entry(suite, case, hyperparameters, replicate)
+        return entry.result if entry else None
+
+    def get_entry(
+        self, suite: Suite, case: TestCase, hyperparameters: dict, replicate: int = 0
+    ) -> Optional["StoreEntry"]:
+        """Get a result from the store, together with the fingerprint it was stored with."""
+        row = self._cursor().execute("""
+            SELECT result, fingerprint, suite_name
             FROM results
             WHERE suite_name = ?
             AND test_case = ?
             AND ideal = ?
             AND hyperparameters = ?
+            AND replicate = ?
         """, (
             *unique_key(suite, case, hyperparameters),
+            replicate,
         )).fetchone()
 
-        logger.debug(f"Present: {result is not None} when looking up {suite.name} {case} {hyperparameters}")
+        logger.debug(f"Present: {row is not None} when looking up {suite.name} {case} {hyperparameters}")
 
-        if result:
-            return TestCaseResult.model_validate_json(result[0])
+        if row:
+            return self._entry(*row)
         return None
 
+    def find_reusable(
+        self,
+        suite: Suite,
+        case: TestCase,
+        hyperparameters: dict,
+        generation_fingerprint: str,
+        replicate: int = 0,
+    ) -> Optional["StoreEntry"]:
+        """
+        Find the newest result for a case computed from the same generation inputs
+        under any version of the suite.
+
+        :param suite:
+        :param case:
+        :param hyperparameters:
+        :param generation_fingerprint:
+        :param replicate:
+        :return:
+        """
+        _, test_case, ideal, params = unique_key(suite, case, hyperparameters)
+        escaped_name = suite.name.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        row = self._cursor().execute("""
+            SELECT result, fingerprint, suite_name
+            FROM results
+            WHERE (suite_name = ? OR suite_name LIKE ? ESCAPE '\\')
+            AND test_case = ?
+            AND ideal = ?
+            AND hyperparameters = ?
+            AND replicate = ?
+            AND generation_fingerprint = ?
+            ORDER BY created_at DESC NULLS LAST
+            LIMIT 1
+        """, (suite.name, f"{escaped_name}--%", test_case, ideal, params, replicate, generation_fingerprint)).fetchone()
+        if row:
+            return self._entry(*row)
+        return None
+
+    def _entry(self, result: str, fingerprint: Optional[str], suite_name: str) -> "StoreEntry":
+        return StoreEntry(
+            encoded=result,
+            store=self,
+            fingerprint=json.loads(fingerprint) if fingerprint else None,
+            suite_name=suite_name,
+        )
+
+    def load_results(self, suite: Optional[Suite] = None, interner: Optional[ResultInterner] = None) -> ResultSet:
+        """
+        Load stored results as lightweight views.
+
+        Cases are decoded once per distinct case, and rendered prompts are
+        only loaded from the store when accessed.
+
+        :param suite: only load the results of this suite (and version)
+        :param interner: share interned parts with other result sets
+        :return:
+        """
+        results = ResultSet(interner=interner)
+        for batch in self.iter_results(suite, interner=results.interner):
+            results.extend(batch)
+        return results
+
+    def iter_results(
+        self,
+        suite: Optional[Union[Suite, str]] = None,
+        hyperparameters: Optional[Dict[str, Any]] = None,
+        tags: Optional[List[str]] = None,
+        score_range: Optional[Tuple[Optional[float], Optional[float]]] = None,
+        batch_size: int = FETCH_BATCH_SIZE,
+        as_arrow: bool = False,
+        interner: Optional[ResultInterner] = None,
+    ) -> Iterator[Any]:
+        """
+        Stream the stored results matching some filters, in batches.
+
+        The filters are applied in the query, on the typed columns, so only
+        matching rows are read and decoded, and at most one batch is held in
+        memory at a time.
+
+            >>> store = Store(None)
+            >>> suite = Suite(name="test", cases=[TestCase(input="1+1", ideal="2", tags=["math"])],
+            ...               matrix={"hyperparameters": {}})
+            >>> for model, score in [("m1", 1.0), ("m2", 0.0)]:
+            ...     store.add_result(suite, TestCaseResult(case=suite.cases[0], response=Response(text="2"),
+            ...                                            hyperparameters={"model": model}, score=score))
+            >>> [[r.hyperparameters["model"] for r in batch] for batch in store.iter_results(batch_size=1)]
+            [['m1'], ['m2']]
+            >>> [len(batch) for batch in store.iter_results(suite, tags=["math"], score_range=(0.5, None))]
+            [1]
+
+        :param suite: a suite (and version), or the name results are stored under
+        :param hyperparameters: required values, by name; a list allows any of its values
+        :param tags: case tags that must all be present
+        :param score_range: minimum and maximum score, inclusive; either may be None
+        :param batch_size: results per batch
+        :param as_arrow: yield pyarrow record batches of the typed columns instead of decoded results
+        :param interner: shared by the batches, which are :class:`ResultSet` objects
+        :return:
+        """
+        where, parameters = _result_filter(suite, hyperparameters, tags, score_range)
+        if as_arrow:
+            yield from self._iter_arrow(where, parameters, batch_size)
+            return
+        interner = interner or ResultInterner()
+        for objs, blobs in self._iter_batches(("case_ref",), where, parameters, batch_size):
+            yield ResultSet(
+                (decode_view(obj, interner, case_json=blobs.__getitem__, resolve=self._get_blob) for obj in objs),
+                interner=interner,
+            )
+
+    def _iter_arrow(self, where: str, parameters: list, batch_size: int) -> Iterator[Any]:
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError("Arrow record batches require pyarrow (pip install pyarrow)")
+        cursor = self._conn.cursor()
+        try:
+            cursor.execute(
+                f"""
+                SELECT suite_name, test_case, ideal, replicate, created_at,
+                       {", ".join(TYPED_COLUMNS)}
+                FROM results {where}
+                """,
+                parameters,
+            )
+            yield from cursor.fetch_record_batch(batch_size)
+        finally:
+            cursor.close()
+
+    def read_results(self, suite: Optional[Suite] = None) -> List[TestCaseResult]:
+        """
+        Bulk-load stored results as full models, e.g. to replay a run.
+
+        Rows are read in batches, the cases and prompts of each batch are
+        fetched in one query, and each distinct case is decoded and validated
+        only once; results of the same case share the case object, as they
+        do after a run.
+
+        :param suite: only load the results of this suite (and version)
+        :return:
+        """
+        results = []
+        cases: Dict[str, TestCase] = {}
+        where, parameters = _result_filter(suite)
+        for objs, blobs in self._iter_batches(("case_ref", "prompt_ref", "system_ref"), where, parameters):
+            for obj in objs:
+                ref = obj.pop("case_ref", None)
+                if ref:
+                    if ref not in cases:
+                        cases[ref] = TestCase.model_validate_json(blobs[ref])
+                    obj["case"] = cases[ref]
+                response = obj["response"]
+                for k in ("prompt", "system"):
+                    h = response.pop(f"{k}_ref", None)
+                    if h:
+                        response[k] = blobs[h]
+                results.append(TestCaseResult.model_validate(obj))
+        return results
+
+    def _iter_batches(
+        self,
+        refs: Tuple[str, ...],
+        where: str = "",
+        parameters: Optional[list] = None,
+        batch_size: int = FETCH_BATCH_SIZE,
+    ) -> Iterator[Tuple[List[Dict[str, Any]], Dict[str, str]]]:
+        """
+        Read parsed result objects in batches, together with the blobs of the given references of each batch.
+
+        The blobs of a batch are returned rather than read back from the
+        cache, which may not hold a whole batch.
+        """
+        # a cursor of its own, as blob lookups between batches would reset a shared one
+        cursor = self._conn.cursor()
+        try:
+            cursor.execute(f"SELECT result FROM results {where}", parameters or [])
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                objs = [json.loads(encoded) for (encoded,) in rows]
+                hashes = [obj["case_ref"] for obj in objs if "case_ref" in refs and "case_ref" in obj]
+                for k in refs:
+                    if k != "case_ref":
+                        hashes.extend(obj["response"][k] for obj in objs if k in obj["response"])
+                yield objs, self._get_blobs(hashes)
+        finally:
+            cursor.close()
+
+    def _insert_rows(self, rows: Iterable[Tuple[tuple, TestCaseResult, Optional[datetime], Optional[Dict[str, str]]]]):
+        """
+        Insert results under explicit keys, timestamps and fingerprints, in a single transaction.
+
+        :param rows: tuples of (key, result, created_at, fingerprint), where key is a
+                     (suite_name, test_case, ideal, hyperparameters) tuple; the replicate
+                     index comes from the result
+        """
+        from llm_matrix.planner import generation_fingerprint
+        records = {}
+        blobs: Dict[str, str] = {}
+        for key, result, created_at, fingerprint in rows:
+            encoded, result_blobs = self._encode(result)
+            blobs.update(result_blobs)
+            # a key written twice in one batch keeps the last result, as separate inserts would
+            replicate = result.replicate or 0
+            dedup_key = (*key[:3], json.dumps(key[3], sort_keys=True, default=str), replicate)
+            records[dedup_key] = ((
+                *key,
+                replicate,
+                encoded,
+                created_at,
+                *_typed_values(result),
+                json.dumps(fingerprint) if fingerprint else None,
+                generation_fingerprint(fingerprint) if fingerprint else None,
+            ))
+        # only a hint: a blob missing from the cache is written again, and ignored
+        new_blobs = [
+            (h, *_compress(text)) for h, text in blobs.items() if h not in self._blob_cache
+        ]
+        cursor = self._cursor()
+        # concurrent transactions writing the same blob or key conflict on commit, so writes take turns
+        with self._write_lock:
+            cursor.begin()
+            try:
+                _insert_values(cursor, "INSERT OR IGNORE INTO blobs (hash, codec, data)", "(?, ?, ?)", new_blobs)
+                _insert_values(
+                    cursor,
+                    f"""
+                    INSERT OR REPLACE INTO results
+                    (suite_name, test_case, ideal, hyperparameters, replicate, result, created_at,
+                     {", ".join(TYPED_COLUMNS)}, {", ".join(FINGERPRINT_COLUMNS)})
+                    """,
+                    "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, MAP(?, ?), ?, ?)",
+                    list(records.values()),
+                )
+                cursor.commit()
+            except Exception:
+                cursor.rollback()
+                raise
+        for h, text in blobs.items():
+            self._cache_blob(h, text)
+
+    def _encode(self, result: TestCaseResult) -> Tuple[str, Dict[str, str]]:
+        """
+        Encode a result as compact JSON, replacing the case and rendered prompts with blob references.
+
+        :param result:
+        :return: the JSON text and the blobs it refers to, by hash
+        """
+        obj = result.model_dump(exclude_unset=True)
+        blobs = {}
+        case_json = result.case.model_dump_json(exclude_unset=True)
+        obj.pop("case")
+        obj["case_ref"] = _content_hash(case_json)
+        blobs[obj["case_ref"]] = case_json
+        response = obj["response"]
+        for k in ("prompt", "system"):
+            text = response.get(k)
+            if text is not None:
+                h = _content_hash(text)
+                blobs[h] = text
+                del response[k]
+                response[f"{k}_ref"] = h
+        return json.dumps(obj), blobs
+
+    def _decode(self, encoded: str) -> TestCaseResult:
+        """
+        Decode a result row, in either the compact or the original inline layout.
+
+        :param encoded:
+        :return:
+        """
+        obj = json.loads(encoded)
+        if "case_ref" not in obj:
+            return TestCaseResult.model_validate(obj)
+        response = obj["response"]
+        refs = {k: response.pop(f"{k}_ref") for k in ("prompt", "system") if f"{k}_ref" in response}
+        blobs = self._get_blobs([obj["case_ref"], *refs.values()])
+        obj["case"] = json.loads(blobs[obj.pop("case_ref")])
+        for k, h in refs.items():
+            response[k] = blobs[h]
+        return TestCaseResult.model_validate(obj)
+
+    def _decode_view(self, encoded: str, interner: ResultInterner) -> ResultView:
+        """
+        Decode a result row as a view, without building Pydantic models except for new cases.
+
+        :param encoded:
+        :param interner:
+        :return:
+        """
+        return decode_view(json.loads(encoded), interner, case_json=self._get_blob, resolve=self._get_blob)
+
+    def _get_blob(self, h: str) -> str:
+        return self._get_blobs([h])[h]
+
+    def _get_blobs(self, hashes: List[str]) -> Dict[str, str]:
+        """Get blob texts by hash, from the cache where possible."""
+        # worker threads share the cache, and one of them may clear it
+        with self._blob_cache_lock:
+            found = {h: text for h in hashes if (text := self._blob_cache.get(h)) is not None}
+        missing = [h for h in set(hashes) if h not in found]
+        if missing:
+            rows = self._cursor().execute(
+                "SELECT hash, codec, data FROM blobs WHERE hash IN (SELECT unnest(?))", (missing,)
+            ).fetchall()
+            # the cache may be cleared while filling it, so the result is collected separately
+            for h, codec, data in rows:
+                found[h] = _decompress(codec, data)
+                self._cache_blob(h, found[h])
+        return {h: found[h] for h in hashes}
+
+    def _cache_blob(self, h: str, text: str):
+        with self._blob_cache_lock:
+            if len(self._blob_cache) >= BLOB_CACHE_SIZE:
+                self._blob_cache.clear()
+            self._blob_cache[h] = text
+
+    def merge(self, other_path: Union[str, Path]):
+        """
+        Merge the results of another store file into this store.
+
+        Results with the same key are de-duplicated, keeping the newest
+        result; results without a timestamp count as oldest, and on a tie the
+        other store wins.
+
+        Example:
+
+            >>> a = Store(None)
+            >>> case = TestCase(input="1+1", ideal="2")
+            >>> suite = Suite(name="test", cases=[case], matrix={"hyperparameters": {}})
+            >>> a.add_result(suite, TestCaseResult(case=case, response=Response(text="3"), hyperparameters={}))
+            >>> _ = Path("test-merge.db").unlink(missing_ok=True)
+            >>> other = Store("test-merge.db")
+            >>> other.add_result(suite, TestCaseResult(case=case, response=Response(text="2"), hyperparameters={}))
+            >>> other.close()
+            >>> a.merge("test-merge.db")
+            >>> a.get_result(suite, case, {}).response.text
+            '2'
+
+        :param other_path: path to the store to merge in
+        """
+        if self.db_path and Path(self.db_path).resolve() == Path(other_path).resolve():
+            raise ValueError(f"Cannot merge store {other_path} into itself")
+        # opening brings the other store up to the current layout
+        Store(other_path).close()
+        escaped_path = str(other_path).replace("'", "''")
+        self._conn.execute(f"ATTACH '{escaped_path}' AS merge_source (READ_ONLY)")
+        try:
+            updates = ", ".join(
+                f"{name} = excluded.{name}"
+                for name in ["result", "created_at", *TYPED_COLUMNS, *FINGERPRINT_COLUMNS]
+            )
+            self._conn.execute(f"""
+                INSERT INTO results BY NAME
+                SELECT * FROM merge_source.results
+                ON CONFLICT DO UPDATE SET {updates}
+                WHERE coalesce(excluded.created_at, '-infinity'::TIMESTAMP)
+                   >= coalesce(results.created_at, '-infinity'::TIMESTAMP)
+            """)
+            self._conn.execute("INSERT OR IGNORE INTO blobs SELECT * FROM merge_source.blobs")
+        finally:
+            self._conn.execute("DETACH merge_source")
+        logger.info(f"Merged {other_path} into {self.db_path}")
+
+    def query(self, sql: str, parameters: Optional[Union[list, tuple]] = None) -> pd.DataFrame:
+        """
+        Run a SQL query against the store, returning a DataFrame.
+
+        :param sql: query, typically over the typed columns of ``results``
+        :param parameters: values for ``?`` placeholders
+        :return:
+        """
+        return self._cursor().execute(sql, parameters).df()
+
+    def model_latencies(self) -> Dict[str, float]:
+        """
+        Mean latency of past generations per model, across all suites.
+
+        Only results that recorded a latency are counted.
+
+        :return: mapping of model to mean seconds per response
+        """
+        rows = self._cursor().execute(
+            """
+            SELECT model, AVG(TRY_CAST(json_extract_string(result, '$.response.latency') AS DOUBLE)) AS latency
+            FROM results
+            WHERE model IS NOT NULL
+            GROUP BY model
+            HAVING latency IS NOT NULL
+            """
+        ).fetchall()
+        return {model: latency for model, latency in rows}
+
+    def model_latency_quantiles(self, q: float) -> Dict[str, float]:
+        """
+        Quantile of the latency of past generations per model, across all suites.
+
+        :param q: e.g. 0.95 for the 95th percentile
+        :return: mapping of model to seconds
+        """
+        rows = self._cursor().execute(
+            """
+            SELECT model, quantile_cont(TRY_CAST(json_extract_string(result, '$.response.latency') AS DOUBLE), ?) AS latency
+            FROM results
+            WHERE model IS NOT NULL
+            GROUP BY model
+            HAVING latency IS NOT NULL
+            """,
+            [q],
+        ).fetchall()
+        return {model: latency for model, latency in rows}
+
+    def model_response_lengths(self) -> Dict[str, float]:
+        """
+        Mean length in characters of stored responses per model, across all suites.
+
+        :return:
+        """
+        rows = self._cursor().execute(
+            """
+            SELECT model, AVG(LENGTH(response_text)) FROM results
+            WHERE model IS NOT NULL AND response_text IS NOT NULL
+            GROUP BY model
+            """
+        ).fetchall()
+        return {model: length for model, length in rows}
+
+    def model_responses(self, model: str, suite_name: Optional[str] = None, limit: int = 1000) -> List[Tuple[str, str]]:
+        """
+        Stored responses of a model, with the ideal answer of their case.
+
+        :param model:
+        :param suite_name: only of this stored suite (see :func:`suite_key`)
+        :param limit: at most this many, the most recent first
+        :return: pairs of response text and ideal, for cases with an ideal
+        """
+        suite_filter = "AND suite_name = ?" if suite_name is not None else ""
+        rows = self._cursor().execute(
+            f"""
+            SELECT response_text, ideal FROM results
+            WHERE model = ? {suite_filter} AND response_text IS NOT NULL AND ideal IS NOT NULL AND ideal <> ''
+            ORDER BY created_at DESC NULLS LAST
+            LIMIT ?
+            """,
+            [model, *([suite_name] if suite_name is not None else []), limit],
+        ).fetchall()
+        return [(text, ideal) for text, ideal in rows]
+
+    def close(self):
+        """Close the database connection."""
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+
     @property
     def size(self) -> int:
         """Get the number of results in the store."""
-        return self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        return self._cursor().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def _cursor(self) -> duckdb.DuckDBPyConnection:
+        """Get a cursor for the current thread."""
+        if threading.current_thread() is threading.main_thread():
+            return self._conn
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is None:
+            cursor = self._conn.cursor()
+            self._local.cursor = cursor
+        return cursor
 
     def __del__(self):
         """Close the database connection when the object is destroyed."""
-        if self._conn:
-            self._conn.close()
+        self.close()
+
+
+def compact_store(source_path: Union[str, Path], target_path: Optional[Union[str, Path]] = None) -> Store:
+    """
+    Rewrite a store in the compact layout.
+
+    Rows in the original layout, with the full result inline, are re-encoded
+    with interned cases and prompts. The rewritten store is written to a new
+    file, so space held by the old layout is released; if no target path is
+    given, the rewritten store replaces the source.
+
+    :param source_path: store to compact
+    :param target_path: path for the compacted store; defaults to replacing the source, as does the source path
+    :return: the compacted store
+    """
+    source_path = Path(source_path)
+    # compacting a store onto itself also replaces it, never deleting it before it is read
+    replace = target_path is None or Path(target_path).resolve() == source_path.resolve()
+    if replace:
+        target_path = source_path.with_name(source_path.name + ".compact-tmp")
+    target_path = Path(target_path)
+    target_path.unlink(missing_ok=True)
+    source = Store(source_path)
+    target = Store(target_path)
+    cursor = source._conn.execute("""
+        SELECT suite_name, test_case, ideal, hyperparameters, result, created_at, fingerprint FROM results
+    """)
+    n = 0
+    while True:
+        rows = cursor.fetchmany(FETCH_BATCH_SIZE)
+        if not rows:
+            break
+        target._insert_rows(
+            (
+                (suite_name, test_case, ideal, hyperparameters),
+                source._decode(result),
+                created_at,
+                json.loads(fingerprint) if fingerprint else None,
+            )
+            for suite_name, test_case, ideal, hyperparameters, result, created_at, fingerprint in rows
+        )
+        n += len(rows)
+    source.close()
+    target.close()
+    if replace:
+        os.replace(target_path, source_path)
+        target_path = source_path
+    logger.info(f"Compacted {n} results from {source_path} into {target_path}")
+    return Store(target_path)
+
+
+def merge_stores(source_paths: List[Union[str, Path]], target_path: Union[str, Path]) -> Store:
+    """
+    Merge several store files (e.g. the stores of a sharded run) into one.
+
+    :param source_paths: stores to merge, in increasing order of precedence on ties
+    :param target_path: store to merge into; created if it does not exist
+    :return: the target store
+    """
+    target = Store(target_path)
+    for source_path in source_paths:
+        target.merge(source_path)
+    return target
+
+
+def _insert_values(cursor: duckdb.DuckDBPyConnection, insert: str, placeholders: str, rows: List[tuple]):
+    """
+    Insert rows with multi-row VALUES statements.
+
+    This is much faster than ``executemany``, which runs one statement per row.
+    """
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        chunk = rows[start:start + INSERT_BATCH_SIZE]
+        cursor.execute(
+            f"{insert} VALUES {', '.join([placeholders] * len(chunk))}",
+            [value for row in chunk for value in row],
+        )
+
+
+def _typed_values(result: TestCaseResult) -> tuple:
+    """
+    Values of the typed columns for a result.
+
+    The hyperparameter values are returned as a list of names followed by a
+    list of (string) values, which are combined into a MAP on insert.
+    """
+    model = result.hyperparameters.get("model")
+    return (
+        str(model) if model is not None else None,
+        result.score,
+        result.response.text,
+        result.evaluation_message,
+        result.case.tags,
+        list(result.hyperparameters.keys()),
+        [str(v) for v in result.hyperparameters.values()],
+    )
+
+
+def _result_filter(
+    suite: Optional[Union[Suite, str]] = None,
+    hyperparameters: Optional[Dict[str, Any]] = None,
+    tags: Optional[List[str]] = None,
+    score_range: Optional[Tuple[Optional[float], Optional[float]]] = None,
+) -> Tuple[str, list]:
+    """
+    Build the WHERE clause selecting results, over the typed columns.
+
+    >>> _result_filter("s", {"model": ["m1", "m2"], "temperature": 0.5}, score_range=(None, 0.5))
+    ('WHERE suite_name = ? AND model IN (?, ?) AND hyperparameter_values[?] = ? AND score <= ?', ['s', 'm1', 'm2', 'temperature', '0.5', 0.5])
+    """
+    conditions, parameters = [], []
+    if suite is not None:
+        conditions.append("suite_name = ?")
+        parameters.append(suite if isinstance(suite, str) else suite_key(suite))
+    for name, value in (hyperparameters or {}).items():
+        # values are stored as strings, as in TestCaseResult.as_flat_dict
+        values = [str(v) for v in value] if isinstance(value, (list, tuple, set)) else [str(value)]
+        placeholders = "?" if len(values) == 1 else f"({', '.join('?' * len(values))})"
+        operator = "=" if len(values) == 1 else "IN"
+        if name == "model":
+            # the indexed column
+            conditions.append(f"model {operator} {placeholders}")
+        else:
+            conditions.append(f"hyperparameter_values[?] {operator} {placeholders}")
+            parameters.append(name)
+        parameters.extend(values)
+    if tags:
+        conditions.append("list_has_all(tags, ?)")
+        parameters.append(list(tags))
+    low, high = score_range or (None, None)
+    if low is not None:
+        conditions.append("score >= ?")
+        parameters.append(low)
+    if high is not None:
+        conditions.append("score <= ?")
+        parameters.append(high)
+    return ("WHERE " + " AND ".join(conditions) if conditions else ""), parameters
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def _compress(text: str) -> Tuple[str, bytes]:
+    data = text.encode("utf-8")
+    if len(data) >= COMPRESSION_THRESHOLD:
+        return "zlib", zlib.compress(data)
+    return "raw", data
+
+
+def _decompress(codec: str, data: bytes) -> str:
+    if codec == "zlib":
+        data = zlib.decompress(data)
+    elif codec != "raw":
+        raise ValueError(f"Unknown blob codec {codec}")
+    return data.decode("utf-8")
 
 
 # Example usage with context manager
@@ -40,3 +40,76 @@ def summary_by(df: pd.DataFrame, source_keys: set, group_by="case_input"):
     score_agg.columns = [f"{col[1]}" for col in score_agg.columns]
     group_by = pd.concat([score_agg, text_pivot, score_pivot, other_cols], axis=1)
     return group_by
+
+
+CELL_KEYS = ["hyperparameters", "case_input", "case_ideal"]
+
+
+def _modal_fraction(df: pd.DataFrame, keys: list, column: str) -> pd.Series:
+    """Per group of keys, the fraction of rows with the most common value of a column."""
+    counts = df.groupby(keys + [column], dropna=False).size()
+    return counts.groupby(level=list(range(len(keys))), dropna=False).max() / df.groupby(keys, dropna=False).size()
+
+
+def replicate_summary(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Aggregate the replicates of each cell (a case under a hyperparameter combination).
+
+    Agreement is the fraction of replicates with the most common score, or
+    the most common response (ignoring case and surrounding whitespace).
+
+    Example:
+
+        >>> df = pd.DataFrame({
+        ...     "hyperparameters": ["model=m1"] * 4,
+        ...     "case_input": ["a", "a", "a", "b"],
+        ...     "case_ideal": ["YES", "YES", "YES", "NO"],
+        ...     "replicate": [0, 1, 2, 0],
+        ...     "score": [1.0, 1.0, 0.0, 1.0],
+        ...     "response_text": ["Yes", "yes ", "No", "NO"],
+        ... })
+        >>> replicate_summary(df)[["case_input", "replicates", "score_mean", "score_agreement", "response_agreement"]]
+          case_input  replicates  score_mean  score_agreement  response_agreement
+        0          a           3    0.666667         0.666667            0.666667
+        1          b           1    1.000000         1.000000            1.000000
+
+    :param df: results, as flattened by :func:`llm_matrix.schema.results_to_dataframe`
+    :return: one row per cell
+    """
+    df = df.assign(_response=df["response_text"].fillna("").str.strip().str.lower(), _score=df["score"].fillna(-1))
+    grouped = df.groupby(CELL_KEYS, dropna=False)
+    summary = pd.DataFrame({
+        "replicates": grouped.size(),
+        "score_mean": grouped["score"].mean(),
+        "score_std": grouped["score"].std(),
+        "score_min": grouped["score"].min(),
+        "score_max": grouped["score"].max(),
+        "score_agreement": _modal_fraction(df, CELL_KEYS, "_score"),
+        "response_agreement": _modal_fraction(df, CELL_KEYS, "_response"),
+    })
+    return summary.reset_index()
+
+
+def agreement_by_config(cells: pd.DataFrame) -> pd.DataFrame:
+    """
+    Summarize the stability of each hyperparameter combination across replicates.
+
+    Example:
+
+        >>> cells = pd.DataFrame({
+        ...     "hyperparameters": ["model=m1", "model=m1"],
+        ...     "score_mean": [0.5, 1.0], "score_std": [0.5, 0.0],
+        ...     "score_agreement": [0.5, 1.0], "response_agreement": [0.5, 1.0],
+        ... })
+        >>> agreement_by_config(cells).iloc[0].to_dict()
+        {'hyperparameters': 'model=m1', 'cells': 2, 'score_mean': 0.75, 'score_std': 0.25, 'score_agreement': 0.75, 'response_agreement': 0.75, 'unanimous': 0.5}
+
+    :param cells: as returned by :func:`replicate_summary`
+    :return: one row per hyperparameter combination, with the mean over its cells,
+             and the fraction of cells whose replicates all got the same score
+    """
+    grouped = cells.groupby("hyperparameters")
+    summary = grouped[["score_mean", "score_std", "score_agreement", "response_agreement"]].mean()
+    summary.insert(0, "cells", grouped.size())
+    summary["unanimous"] = grouped["score_agreement"].apply(lambda a: (a == 1.0).mean())
+    return summary.reset_index()
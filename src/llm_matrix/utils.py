@@ -1,6 +1,13 @@
+import hashlib
+import json
+import random
+from dataclasses import dataclass, field
 from itertools import product
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
 
 from llm_matrix import Matrix
+from llm_matrix.results import ResultView
+from llm_matrix.schema import Suite, TestCase, TestCaseResult
 
 
 def iter_hyperparameters(matrix: Matrix):
@@ -13,6 +20,16 @@ def iter_hyperparameters(matrix: Matrix):
         >>> list(iter_hyperparameters(matrix))
         [{'a': 1, 'b': 3}, {'a': 1, 'b': 4}, {'a': 2, 'b': 3}, {'a': 2, 'b': 4}]
 
+    Combinations matching the ``exclude`` matrix are skipped; the exclude
+    matrix may name only some of the hyperparameters:
+
+        >>> matrix = Matrix(hyperparameters={"a": [1, 2], "b": [3, 4]}, exclude={"hyperparameters": {"a": [2], "b": [4]}})
+        >>> list(iter_hyperparameters(matrix))
+        [{'a': 1, 'b': 3}, {'a': 1, 'b': 4}, {'a': 2, 'b': 3}]
+        >>> matrix = Matrix(hyperparameters={"a": [1, 2], "b": [3, 4]}, exclude={"hyperparameters": {"a": [2]}})
+        >>> list(iter_hyperparameters(matrix))
+        [{'a': 1, 'b': 3}, {'a': 1, 'b': 4}]
+
     :param matrix:
     :return:
     """
@@ -28,5 +45,284 @@ def iter_hyperparameters(matrix: Matrix):
         dict(zip(param_names, combo))
         for combo in combinations
     ]
+    if matrix.exclude:
+        excluded = list(iter_hyperparameters(matrix.exclude))
+        param_dicts = [
+            d for d in param_dicts
+            if not any(all(d.get(k) == v for k, v in x.items()) for x in excluded)
+        ]
 
     yield from param_dicts
+
+
+@dataclass
+class Cell:
+    """
+    A single unit of work in a suite run: one case under one hyperparameter combination.
+    """
+    suite: Suite
+    case: TestCase
+    hyperparameters: Dict[str, Any]
+    result: Optional[Union[TestCaseResult, ResultView]] = None
+    """The result; a view when it was taken unchanged from the store"""
+    cached: bool = False
+    action: Optional[str] = None
+    """What needs to be done for the cell, see :class:`llm_matrix.planner.Action`"""
+    reason: Optional[str] = None
+    fingerprint: Optional[Dict[str, str]] = None
+    error: Optional[str] = None
+    """Set if the cell failed and the runner continues on errors"""
+    replicate: int = 0
+    """Index of the sampled completion, see :attr:`llm_matrix.schema.Matrix.replicates`"""
+
+
+def iter_cells(suite: Suite) -> Iterator[Cell]:
+    """
+    Generate all cells of a suite, hyperparameter combinations outermost.
+
+    Example:
+
+        >>> suite = Suite(name="s", cases=[TestCase(input="a"), TestCase(input="b")],
+        ...               matrix=Matrix(hyperparameters={"model": ["m1", "m2"]}))
+        >>> [(c.case.input, c.hyperparameters["model"]) for c in iter_cells(suite)]
+        [('a', 'm1'), ('b', 'm1'), ('a', 'm2'), ('b', 'm2')]
+
+    Replicates of a cell are adjacent:
+
+        >>> suite.matrix.replicates = 2
+        >>> [(c.case.input, c.hyperparameters["model"], c.replicate) for c in iter_cells(suite)][:3]
+        [('a', 'm1', 0), ('a', 'm1', 1), ('b', 'm1', 0)]
+
+    :param suite:
+    :return:
+    """
+    replicates = suite.matrix.replicates or 1
+    for params in iter_hyperparameters(suite.matrix):
+        for case in suite.cases:
+            for replicate in range(replicates):
+                yield Cell(suite=suite, case=case, hyperparameters=params, replicate=replicate)
+
+
+@dataclass
+class Shard:
+    """
+    One of N deterministic partitions of the cell space of a suite.
+
+    Cells are assigned by hashing their store key, so the assignment does not
+    depend on the order of cases or hyperparameters, and every cell belongs to
+    exactly one shard.
+
+    Example:
+
+        >>> shard = Shard.parse("2/3")
+        >>> shard
+        Shard(index=2, count=3)
+        >>> suite = Suite(name="s", cases=[TestCase(input=str(i)) for i in range(30)],
+        ...               matrix=Matrix(hyperparameters={"model": ["m1", "m2"]}))
+        >>> shards = [Shard(i, 3) for i in range(1, 4)]
+        >>> all(sum(s.contains(c) for s in shards) == 1 for c in iter_cells(suite))
+        True
+    """
+    index: int
+    count: int
+
+    def __post_init__(self):
+        if self.count < 1 or not 1 <= self.index <= self.count:
+            raise ValueError(f"Invalid shard {self.index}/{self.count}")
+
+    @classmethod
+    def parse(cls, spec: str) -> "Shard":
+        """
+        Parse a shard specification of the form ``i/N``, with 1 <= i <= N.
+
+        :param spec:
+        :return:
+        """
+        try:
+            index, count = (int(part) for part in spec.split("/"))
+        except ValueError:
+            raise ValueError(f"Invalid shard specification {spec}, expected i/N")
+        return cls(index, count)
+
+    def contains(self, cell: Cell) -> bool:
+        """
+        True if the cell belongs to this shard.
+
+        :param cell:
+        :return:
+        """
+        from llm_matrix.store import unique_key
+        key = unique_key(cell.suite, cell.case, cell.hyperparameters)
+        if cell.replicate:
+            # the first replicate stays in the shard of the unreplicated cell
+            key = (*key, cell.replicate)
+        key = json.dumps(key, sort_keys=True, default=str)
+        digest = hashlib.sha256(key.encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "big") % self.count == self.index - 1
+
+    @property
+    def suffix(self) -> str:
+        """A file name suffix for this shard, e.g. ``shard-2-of-3``."""
+        return f"shard-{self.index}-of-{self.count}"
+
+
+STRATA = ("tag", "ideal")
+
+
+@dataclass
+class CaseIndex:
+    """
+    Positions of the cases of a suite by tag and by ideal, for selecting and sampling cases.
+
+    The index is built once, in a single pass over the cases; selections
+    only touch the positions of the tags they name.
+
+    Example:
+
+        >>> cases = [TestCase(input=str(i), ideal=["YES", "NO"][i % 2], tags=[f"t{i % 3}"]) for i in range(12)]
+        >>> index = CaseIndex.from_cases(cases)
+        >>> index.select(tags=["t0", "t1"], exclude_tags=["t1"])
+        [0, 3, 6, 9]
+        >>> sample = index.sample(6, stratify_by="tag", seed=1)
+        >>> sorted({cases[i].tags[0] for i in sample})
+        ['t0', 't1', 't2']
+    """
+    size: int
+    by_tag: Dict[str, List[int]] = field(default_factory=dict)
+    first_tags: List[Optional[str]] = field(default_factory=list)
+    ideals: List[Optional[str]] = field(default_factory=list)
+
+    @classmethod
+    def from_cases(cls, cases: List[TestCase]) -> "CaseIndex":
+        """
+        Index cases by position.
+
+        :param cases:
+        :return:
+        """
+        index = cls(size=len(cases))
+        for i, case in enumerate(cases):
+            for tag in dict.fromkeys(case.tags or []):
+                index.by_tag.setdefault(tag, []).append(i)
+            index.first_tags.append(case.tags[0] if case.tags else None)
+            index.ideals.append(case.ideal)
+        return index
+
+    def select(self, tags: Optional[Iterable[str]] = None, exclude_tags: Optional[Iterable[str]] = None) -> List[int]:
+        """
+        Positions of the cases with any of the tags (or of all cases), and none of the excluded tags.
+
+        :param tags:
+        :param exclude_tags:
+        :return: positions, in order
+        """
+        if tags:
+            selected = set()
+            for tag in tags:
+                selected.update(self.by_tag.get(tag, []))
+        else:
+            selected = None
+        excluded = set()
+        for tag in exclude_tags or []:
+            excluded.update(self.by_tag.get(tag, []))
+        if selected is None:
+            return [i for i in range(self.size) if i not in excluded]
+        return sorted(selected - excluded)
+
+    def sample(
+        self,
+        n: int,
+        positions: Optional[List[int]] = None,
+        stratify_by: Optional[str] = None,
+        seed: Optional[int] = None,
+    ) -> List[int]:
+        """
+        Sample positions of cases, optionally stratified.
+
+        With ``stratify_by``, cases are grouped by their first tag or by their
+        ideal, and each group gets a share of the sample proportional to its
+        size, and at least one case if the sample is large enough.
+
+        :param n: sample size; all positions are returned if there are no more than n
+        :param positions: positions to sample from; defaults to all
+        :param stratify_by: ``tag`` or ``ideal``
+        :param seed: the same seed gives the same sample
+        :return: positions, in order
+        """
+        positions = list(range(self.size)) if positions is None else positions
+        if n >= len(positions):
+            return sorted(positions)
+        rng = random.Random(seed)
+        if not stratify_by:
+            return sorted(rng.sample(positions, n))
+        if stratify_by not in STRATA:
+            raise ValueError(f"Cannot stratify by {stratify_by}, expected one of {', '.join(STRATA)}")
+        keys = self.first_tags if stratify_by == "tag" else self.ideals
+        strata: Dict[Optional[str], List[int]] = {}
+        for i in positions:
+            strata.setdefault(keys[i], []).append(i)
+        ordered = sorted(strata, key=lambda k: (k is None, str(k)))
+        sizes = _allocate([len(strata[k]) for k in ordered], n)
+        return sorted(i for k, size in zip(ordered, sizes) for i in rng.sample(strata[k], size))
+
+
+def _allocate(sizes: List[int], n: int) -> List[int]:
+    """
+    Split a sample of n between strata in proportion to their sizes, by largest remainder.
+
+    Each stratum gets at least one if n allows.
+
+    >>> _allocate([90, 9, 1], 10)
+    [8, 1, 1]
+    >>> _allocate([5, 5], 3)
+    [2, 1]
+    """
+    total = sum(sizes)
+    quotas = [n * size / total for size in sizes]
+    allocation = [int(q) for q in quotas]
+    by_remainder = sorted(range(len(sizes)), key=lambda i: (-(quotas[i] - allocation[i]), i))
+    for i in by_remainder[:n - sum(allocation)]:
+        allocation[i] += 1
+    if n >= len(sizes):
+        for i in range(len(sizes)):
+            if allocation[i] == 0:
+                largest = max(range(len(sizes)), key=lambda j: allocation[j])
+                allocation[largest] -= 1
+                allocation[i] = 1
+    return allocation
+
+
+def select_cases(
+    suite: Suite,
+    index: Optional[CaseIndex] = None,
+    tags: Optional[List[str]] = None,
+    exclude_tags: Optional[List[str]] = None,
+    sample: Optional[int] = None,
+    stratify_by: Optional[str] = None,
+    seed: Optional[int] = None,
+) -> Suite:
+    """
+    A copy of a suite with only some of its cases.
+
+    The copy has the name and version of the suite, so its results are stored
+    under the same keys as those of a full run, and are reused by it.
+
+    >>> suite = Suite(name="s", cases=[TestCase(input=str(i), tags=["a" if i < 5 else "b"]) for i in range(10)],
+    ...               matrix=Matrix(hyperparameters={"model": ["m1"]}))
+    >>> [c.input for c in select_cases(suite, exclude_tags=["a"], sample=2, seed=0).cases]
+    ['8', '9']
+
+    :param suite:
+    :param index: index of the cases of the suite; built if not given
+    :param tags: keep cases with any of these tags
+    :param exclude_tags: drop cases with any of these tags
+    :param sample: then sample this many cases
+    :param stratify_by: ``tag`` or ``ideal``, see :meth:`CaseIndex.sample`
+    :param seed:
+    :return:
+    """
+    index = index or CaseIndex.from_cases(suite.cases)
+    positions = index.select(tags, exclude_tags)
+    if sample is not None:
+        positions = index.sample(sample, positions, stratify_by=stratify_by, seed=seed)
+    return suite.model_copy(update={"cases": [suite.cases[i] for i in positions]})
@@ -0,0 +1,403 @@
+"""
+A durable work queue, so that several worker processes can share the cells of a run.
+
+The queue is a SQLite file, e.g. on storage shared by the nodes of a
+cluster. Adding a suite expands its cells (hyperparameter combinations ×
+cases, after ``matrix.exclude``) into the queue. Workers claim cells in small
+batches with a time-limited lease, which a background thread renews while
+the worker is alive. If a worker dies, its leases expire and other workers
+pick up its cells, so the run balances itself across workers of any speed.
+
+DuckDB allows only one writing process per store, so each worker writes to a
+store of its own, registered in the queue; :meth:`WorkQueue.collect` merges
+them when the run is done.
+
+Leases compare wall-clock times of different nodes, so their clocks should
+be reasonably in sync (well within the lease duration).
+"""
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+from llm_matrix.schema import Suite
+from llm_matrix.store import Store, merge_stores, suite_key
+from llm_matrix.utils import Cell, iter_hyperparameters
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEASE_SECONDS = 300.0
+DEFAULT_CLAIM_SIZE = 10
+DEFAULT_MAX_ATTEMPTS = 3
+CLAIMS_AHEAD = 2
+"""Number of claims a worker holds at most: it only claims more once cells it holds are finished"""
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+def default_worker_name() -> str:
+    """A worker name unique across nodes: host name and process id."""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+@dataclass
+class WorkQueue:
+    """
+    Cells of one or more suites, claimed by workers under leases.
+
+    Example:
+
+        >>> from llm_matrix.schema import TestCase
+        >>> queue = WorkQueue()
+        >>> suite = Suite(name="s", cases=[TestCase(input="a"), TestCase(input="b")],
+        ...               matrix={"hyperparameters": {"model": ["m1", "m2"]}})
+        >>> queue.add_suite(suite)
+        4
+        >>> [(c.case.input, c.hyperparameters["model"]) for _, c in queue.claim("w1", 3)]
+        [('a', 'm1'), ('b', 'm1'), ('a', 'm2')]
+        >>> queue.counts()
+        {'pending': 1, 'leased': 3, 'done': 0, 'failed': 0}
+
+    :param path: SQLite file; in memory if not given
+    :param lease_seconds: how long a claim lasts without being renewed
+    """
+    path: Optional[Union[str, Path]] = None
+    lease_seconds: float = DEFAULT_LEASE_SECONDS
+    _conn: Optional[sqlite3.Connection] = field(default=None, repr=False)
+    _suites: Dict[int, Suite] = field(default_factory=dict, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def __post_init__(self):
+        # transactions are explicit; the timeout waits for other processes holding the write lock
+        self._conn = sqlite3.connect(
+            str(self.path) if self.path else ":memory:", timeout=60, isolation_level=None, check_same_thread=False
+        )
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS suites (
+                id INTEGER PRIMARY KEY,
+                suite_key TEXT UNIQUE NOT NULL,
+                suite TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS cells (
+                id INTEGER PRIMARY KEY,
+                suite_id INTEGER NOT NULL REFERENCES suites (id),
+                case_index INTEGER NOT NULL,
+                hyperparameters TEXT NOT NULL,
+                replicate INTEGER NOT NULL DEFAULT 0,
+                state TEXT NOT NULL DEFAULT 'pending',
+                owner TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS cells_state ON cells (state, lease_expires);
+            CREATE TABLE IF NOT EXISTS workers (
+                name TEXT PRIMARY KEY,
+                store_path TEXT NOT NULL,
+                last_seen REAL NOT NULL
+            );
+        """)
+
+    def close(self):
+        self._conn.close()
+
+    def add_suite(self, suite: Suite) -> int:
+        """
+        Add the cells of a suite to the queue.
+
+        :param suite:
+        :return: number of cells added
+        """
+        key = suite_key(suite)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self._conn.execute("SELECT 1 FROM suites WHERE suite_key = ?", (key,)).fetchone():
+                    raise ValueError(f"Suite {key} is already in the queue")
+                suite_id = self._conn.execute(
+                    "INSERT INTO suites (suite_key, suite) VALUES (?, ?)", (key, suite.model_dump_json())
+                ).lastrowid
+                rows = [
+                    (suite_id, i, json.dumps(params), replicate)
+                    for params in iter_hyperparameters(suite.matrix)
+                    for i in range(len(suite.cases))
+                    for replicate in range(suite.matrix.replicates or 1)
+                ]
+                self._conn.executemany(
+                    "INSERT INTO cells (suite_id, case_index, hyperparameters, replicate) VALUES (?, ?, ?, ?)", rows
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        logger.info(f"Queued {len(rows)} cells of {key}")
+        return len(rows)
+
+    def claim(self, owner: str, n: int = DEFAULT_CLAIM_SIZE) -> List[Tuple[int, Cell]]:
+        """
+        Claim up to n cells that are pending, or whose lease has expired.
+
+        :param owner: worker name
+        :param n:
+        :return: (cell id, cell) pairs, in queue order
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    """
+                    SELECT id, suite_id, case_index, hyperparameters, replicate, owner FROM cells
+                    WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ?)
+                    ORDER BY id LIMIT ?
+                    """,
+                    (now, n),
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE cells SET state = 'leased', owner = ?, lease_expires = ?, attempts = attempts + 1 WHERE id = ?",
+                    [(owner, now + self.lease_seconds, row[0]) for row in rows],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        for row in rows:
+            if row[5] and row[5] != owner:
+                logger.warning(f"Reclaimed cell {row[0]} from {row[5]}, whose lease expired")
+        return [
+            (cell_id, self._cell(suite_id, case_index, json.loads(params), replicate))
+            for cell_id, suite_id, case_index, params, replicate, _ in rows
+        ]
+
+    def _cell(self, suite_id: int, case_index: int, hyperparameters: Dict, replicate: int = 0) -> Cell:
+        # cells of a suite share one suite object, as when running the suite directly
+        suite = self._suites.get(suite_id)
+        if suite is None:
+            with self._lock:
+                (suite_json,) = self._conn.execute("SELECT suite FROM suites WHERE id = ?", (suite_id,)).fetchone()
+            suite = self._suites.setdefault(suite_id, Suite.model_validate_json(suite_json))
+        return Cell(suite=suite, case=suite.cases[case_index], hyperparameters=hyperparameters, replicate=replicate)
+
+    def renew(self, owner: str) -> int:
+        """
+        Extend the leases of all cells held by a worker.
+
+        :param owner:
+        :return: number of leases renewed
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("UPDATE workers SET last_seen = ? WHERE name = ?", (now, owner))
+            return self._conn.execute(
+                "UPDATE cells SET lease_expires = ? WHERE owner = ? AND state = 'leased'",
+                (now + self.lease_seconds, owner),
+            ).rowcount
+
+    def complete(self, cell_id: int, owner: str) -> bool:
+        """
+        Mark a cell as done.
+
+        :param cell_id:
+        :param owner:
+        :return: False if the worker had lost its lease, and another worker may also do the cell
+        """
+        with self._lock:
+            updated = self._conn.execute(
+                "UPDATE cells SET state = 'done', lease_expires = NULL WHERE id = ? AND owner = ?",
+                (cell_id, owner),
+            ).rowcount
+        if not updated:
+            logger.warning(f"Completed cell {cell_id} after losing its lease")
+        return bool(updated)
+
+    def fail(self, cell_id: int, owner: str, error: str, max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        """
+        Record a failed attempt at a cell; it is retried until it has failed max_attempts times.
+
+        :param cell_id:
+        :param owner:
+        :param error:
+        :param max_attempts:
+        """
+        with self._lock:
+            self._conn.execute(
+                """
+                UPDATE cells SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                                 owner = NULL, lease_expires = NULL, error = ?
+                WHERE id = ? AND owner = ?
+                """,
+                (max_attempts, error, cell_id, owner),
+            )
+
+    def release(self, owner: str) -> int:
+        """
+        Return the cells a worker holds to the queue, e.g. when it stops early.
+
+        :param owner:
+        :return: number of cells released
+        """
+        with self._lock:
+            return self._conn.execute(
+                """
+                UPDATE cells SET state = 'pending', owner = NULL, lease_expires = NULL, attempts = attempts - 1
+                WHERE owner = ? AND state = 'leased'
+                """,
+                (owner,),
+            ).rowcount
+
+    def held_by_others(self, owner: str) -> int:
+        """Number of cells leased by workers other than the given one."""
+        with self._lock:
+            (n,) = self._conn.execute(
+                "SELECT COUNT(*) FROM cells WHERE state = 'leased' AND owner != ?", (owner,)
+            ).fetchone()
+        return n
+
+    def register_worker(self, name: str, store_path: Union[str, Path]):
+        """Record the store a worker writes to, so that its results can be collected."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO workers (name, store_path, last_seen) VALUES (?, ?, ?)",
+                (name, str(Path(store_path).absolute()), time.time()),
+            )
+
+    def worker_stores(self) -> List[Path]:
+        with self._lock:
+            return [Path(p) for (p,) in self._conn.execute("SELECT store_path FROM workers ORDER BY last_seen")]
+
+    def counts(self) -> Dict[str, int]:
+        """Number of cells in each state."""
+        with self._lock:
+            rows = dict(self._conn.execute("SELECT state, COUNT(*) FROM cells GROUP BY state").fetchall())
+        return {state: rows.get(state, 0) for state in (PENDING, LEASED, DONE, FAILED)}
+
+    def errors(self) -> List[Tuple[str, Dict, str]]:
+        """The suite key, hyperparameters and last error of each failed cell."""
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT suites.suite_key, cells.hyperparameters, cells.error
+                FROM cells JOIN suites ON cells.suite_id = suites.id
+                WHERE state = 'failed' ORDER BY cells.id
+            """).fetchall()
+        return [(key, json.loads(params), error) for key, params, error in rows]
+
+    def collect(self, target_path: Union[str, Path]) -> Store:
+        """
+        Merge the stores of all workers into one.
+
+        :param target_path:
+        :return: the merged store
+        """
+        paths = [p for p in self.worker_stores() if p.exists()]
+        logger.info(f"Collecting results from {len(paths)} worker stores")
+        return merge_stores(paths, target_path)
+
+
+@dataclass
+class Heartbeat:
+    """Renew a worker's leases from a background thread while in use as a context manager."""
+    queue: WorkQueue
+    owner: str
+    _stop: threading.Event = field(default_factory=threading.Event, repr=False)
+    _thread: Optional[threading.Thread] = field(default=None, repr=False)
+
+    def __enter__(self) -> "Heartbeat":
+        self._thread = threading.Thread(target=self._beat, name="heartbeat", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+
+    def _beat(self):
+        while not self._stop.wait(self.queue.lease_seconds / 3):
+            try:
+                self.queue.renew(self.owner)
+            except sqlite3.Error as e:
+                logger.warning(f"Cannot renew leases of {self.owner}: {e}")
+
+
+def run_worker(
+    queue: WorkQueue,
+    runner,
+    owner: Optional[str] = None,
+    claim_size: int = DEFAULT_CLAIM_SIZE,
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    wait: bool = True,
+    poll_interval: Optional[float] = None,
+) -> int:
+    """
+    Process cells from the queue with a runner until none are left.
+
+    Cells are claimed as the runner's pipeline has room for them, and
+    completed as the pipeline finishes them. A worker holds at most
+    ``CLAIMS_AHEAD * claim_size`` unfinished cells, so the others find cells
+    to claim while it works. Failed cells (with ``continue_on_error``) are
+    returned to the queue, up to ``max_attempts`` times.
+
+    :param queue:
+    :param runner: an :class:`LLMRunner`, writing to this worker's own store
+    :param owner: worker name; defaults to host name and process id
+    :param claim_size: number of cells claimed at a time
+    :param max_attempts:
+    :param wait: when nothing can be claimed, wait for cells leased by other workers, in case
+                 their leases expire, instead of stopping
+    :param poll_interval: seconds between claims while waiting; defaults to a tenth of the lease
+    :return: number of cells completed by this worker
+    """
+    owner = owner or default_worker_name()
+    queue.register_worker(owner, runner._get_store().db_path)
+    poll_interval = poll_interval or queue.lease_seconds / 10
+    tickets: Dict[int, int] = {}
+    finished = threading.Condition()
+    pipeline = runner.pipeline()
+
+    def claims():
+        while True:
+            with finished:
+                # the pipeline has room for more cells than this worker should hold
+                while len(tickets) + claim_size > CLAIMS_AHEAD * claim_size:
+                    if pipeline.stopping:
+                        return
+                    finished.wait(poll_interval)
+            claimed = queue.claim(owner, claim_size)
+            if not claimed:
+                if wait and queue.held_by_others(owner):
+                    time.sleep(poll_interval)
+                    continue
+                return
+            with finished:
+                for cell_id, cell in claimed:
+                    tickets[id(cell)] = cell_id
+            yield from (cell for _, cell in claimed)
+
+    n = 0
+    logger.info(f"Worker {owner} started")
+    with Heartbeat(queue, owner), runner.active_run():
+        try:
+            for cell in pipeline.run(claims()):
+                with finished:
+                    cell_id = tickets.pop(id(cell))
+                    finished.notify()
+                if cell.error:
+                    queue.fail(cell_id, owner, cell.error, max_attempts=max_attempts)
+                    continue
+                queue.complete(cell_id, owner)
+                n += 1
+        finally:
+            # cells still held were not finished; they go back to the queue at once
+            released = queue.release(owner)
+            if released:
+                logger.warning(f"Worker {owner} released {released} unfinished cells")
+    logger.info(f"Worker {owner} completed {n} cells")
+    return n
@@ -1,5 +1,86 @@
+import os
+import time
 from pathlib import Path
+from typing import Optional
+
+import llm
 
 THIS_DIR = Path(__file__).parent
 INPUT_DIR = THIS_DIR / 'input'
-STORE_PATH = THIS_DIR / "results" / "cache.db"
\ No newline at end of file
+STORE_PATH = THIS_DIR / "results" / "cache.db"
+
+
+class FakeModel(llm.Model):
+    """
+    Offline model used in tests.
+
+    ``fake-echo`` answers with the prompt text; ``fake-judge`` answers
+    like an evaluation model, always with a perfect score; ``fake-stream``
+    streams the prompt text word by word; ``fake-cpu`` is a local model
+    answering with the prompt text and the id of the process it runs in.
+    The ``delay`` option simulates a slow provider, or for ``fake-cpu``,
+    the seconds of CPU time a call burns.
+    """
+    can_stream = True
+    calls = 0
+    chunks = 0
+
+    class Options(llm.Options):
+        temperature: Optional[float] = None
+        delay: Optional[float] = None
+
+    def __init__(self, model_id: str):
+        self.model_id = model_id
+
+    def execute(self, prompt, stream, response, conversation):
+        FakeModel.calls += 1
+        if self.model_id == "fake-cpu":
+            end = time.process_time() + (prompt.options.delay or 0)
+            while time.process_time() < end:
+                pass
+            yield f"{prompt.prompt} (pid {os.getpid()})"
+            return
+        if prompt.options.delay:
+            time.sleep(prompt.options.delay)
+        if self.model_id == "fake-judge":
+            yield "1.0 looks right"
+        elif self.model_id == "fake-stream":
+            for word in prompt.prompt.split(" "):
+                FakeModel.chunks += 1
+                yield word + " "
+        else:
+            yield prompt.prompt
+
+
+class FakeSamplingModel(FakeModel):
+    """
+    Offline model sampling several completions in one request.
+
+    ``fake-sample`` answers with the prompt text and the index of the
+    completion, returning ``n`` completions as OpenAI-style choices.
+    """
+
+    class Options(FakeModel.Options):
+        n: Optional[int] = None
+
+    def execute(self, prompt, stream, response, conversation):
+        FakeModel.calls += 1
+        if prompt.options.delay:
+            time.sleep(prompt.options.delay)
+        texts = [f"{prompt.prompt} #{i}" for i in range(prompt.options.n or 1)]
+        response.response_json = {"choices": [{"message": {"content": text}} for text in texts]}
+        yield texts[0]
+
+
+class FakeModelsPlugin:
+    @llm.hookimpl
+    def register_models(self, register):
+        register(FakeModel("fake-echo"))
+        register(FakeModel("fake-judge"))
+        register(FakeModel("fake-stream"))
+        register(FakeModel("fake-cpu"))
+        register(FakeSamplingModel("fake-sample"))
+
+
+if not llm.pm.has_plugin("llm-matrix-test-fakes"):
+    llm.pm.register(FakeModelsPlugin(), name="llm-matrix-test-fakes")
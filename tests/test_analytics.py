@@ -0,0 +1,106 @@
+import time
+
+import numpy as np
+import pytest
+
+from llm_matrix.analytics import ScoreMatrix, compare_configs, confidence_intervals
+from llm_matrix.schema import Response, Suite, TestCase, TestCaseResult, results_to_dataframe
+from llm_matrix.store import Store
+
+
+def make_results(suite_name: str = "test-analytics", n_cases: int = 200, seed: int = 0):
+    """Scores of three models; m2 is better than m1, m3 is as good as m1 with a few differences."""
+    rng = np.random.default_rng(seed)
+    cases = [TestCase(input=f"gene {i}", ideal="YES") for i in range(n_cases)]
+    suite = Suite(name=suite_name, cases=cases, matrix={"hyperparameters": {"model": ["m1", "m2", "m3"]}})
+    m1 = rng.binomial(1, 0.6, n_cases)
+    scores = {
+        "m1": m1,
+        "m2": np.maximum(m1, rng.binomial(1, 0.5, n_cases)),
+        "m3": m1.copy(),
+    }
+    # as many cases scored better as worse, all among the cases m3 has
+    kept = np.arange(n_cases) % 10 != 0
+    flips = np.concatenate([np.flatnonzero(kept & (m1 == 1))[:5], np.flatnonzero(kept & (m1 == 0))[:5]])
+    scores["m3"][flips] = 1 - m1[flips]
+    results = [
+        TestCaseResult(
+            case=case,
+            response=Response(text="YES"),
+            hyperparameters={"model": model, "temperature": 0.0},
+            score=float(scores[model][i]),
+        )
+        for model in scores for i, case in enumerate(cases)
+        # m3 is missing some cases
+        if not (model == "m3" and i % 10 == 0)
+    ]
+    return suite, results
+
+
+def test_score_matrix_from_store():
+    suite, results = make_results()
+    store = Store(None)
+    store.add_results(suite, results)
+    matrix = ScoreMatrix.from_store(store, suite)
+    expected = ScoreMatrix.from_dataframe(results_to_dataframe(results))
+    assert matrix.configs == expected.configs == [
+        "model=m1_temperature=0.0", "model=m2_temperature=0.0", "model=m3_temperature=0.0"
+    ]
+    assert matrix.cases == expected.cases
+    np.testing.assert_array_equal(matrix.values, expected.values)
+    assert np.isnan(matrix.values[:, 2]).sum() == 20
+    # other suites are other cases
+    other, other_results = make_results("test-analytics-2", n_cases=10)
+    store.add_results(other, other_results)
+    assert ScoreMatrix.from_store(store, suite).values.shape == (200, 3)
+    assert ScoreMatrix.from_store(store).values.shape == (210, 3)
+
+
+def test_compare_configs():
+    suite, results = make_results()
+    matrix = ScoreMatrix.from_dataframe(results_to_dataframe(results))
+    by_config = confidence_intervals(matrix, n_resamples=500, seed=1)
+    assert by_config["n"].tolist() == [200, 200, 180]
+    assert (by_config["ci_low"] <= by_config["mean"]).all()
+    assert (by_config["mean"] <= by_config["ci_high"]).all()
+    df = compare_configs(matrix, n_resamples=500, seed=1).set_index(["config_a", "config_b"])
+    m1, m2, m3 = matrix.configs
+    better = df.loc[(m1, m2)]
+    assert better["diff"] < 0 and better["ci_high"] < 0
+    assert better["p_value"] < 0.01 and better["p_adjusted"] < 0.05
+    # paired on the 180 cases m3 has
+    same = df.loc[(m1, m3)]
+    assert same["n"] == 180
+    paired = ~np.isnan(matrix.values[:, 2])
+    assert same["diff"] == pytest.approx(np.mean(matrix.values[paired, 0] - matrix.values[paired, 2])) == 0
+    assert same["ci_low"] < 0 < same["ci_high"]
+    assert same["p_value"] > 0.05
+    # the same seed gives the same intervals and p-values
+    again = compare_configs(matrix, n_resamples=500, seed=1).set_index(["config_a", "config_b"])
+    assert again.equals(df)
+
+
+def test_compare_configs_scales():
+    """Pairwise comparisons are vectorized over the score matrix."""
+    rng = np.random.default_rng(0)
+    values = rng.binomial(1, np.linspace(0.5, 0.7, 10), size=(20_000, 10)).astype(float)
+    start = time.monotonic()
+    df = compare_configs(ScoreMatrix(values, [], [f"c{i}" for i in range(10)]), n_resamples=200, seed=1)
+    assert len(df) == 45
+    assert time.monotonic() - start < 10
+
+
+@pytest.mark.benchmark
+def test_analytics_benchmark():
+    """Time intervals and comparisons of 100k cases x 20 configurations; run with ``pytest -m benchmark -s``."""
+    rng = np.random.default_rng(0)
+    values = rng.binomial(1, np.linspace(0.5, 0.7, 20), size=(100_000, 20)).astype(float)
+    matrix = ScoreMatrix(values, [], [f"c{i}" for i in range(20)])
+    start = time.monotonic()
+    confidence_intervals(matrix, seed=1)
+    compare_configs(matrix, seed=1)
+    print(f"complete: {time.monotonic() - start:.1f}s")
+    values[rng.random(values.shape) < 0.01] = np.nan
+    start = time.monotonic()
+    compare_configs(matrix, seed=1)
+    print(f"1% missing: {time.monotonic() - start:.1f}s")
@@ -0,0 +1,65 @@
+import gzip
+import io
+import json
+from pathlib import Path
+
+import duckdb
+import pytest
+
+from llm_matrix import load_suite
+from llm_matrix.converter import convert, convert_files, iter_rows
+
+HEADER = {"name": "test-convert", "matrix": {"hyperparameters": {"model": ["fake-echo"]}}}
+
+
+@pytest.fixture
+def csv_path(tmp_path: Path) -> Path:
+    path = tmp_path / "genes.csv"
+    path.write_text(
+        "gene,question,answer,score\n"
+        "00123,Is 00123 a kinase?,YES,0.9\n"
+        'BRCA1,"Is BRCA1, a tumor suppressor?",YES,\n'
+        "TP53,,NO,0.1\n"
+        "MYC,Is MYC a kinase?,NO,0.2\n"
+    )
+    return path
+
+
+def test_convert_csv(csv_path: Path):
+    out = io.StringIO()
+    n = convert([csv_path], out, "question", "answer", header=HEADER, chunk_size=2)
+    # the row without a question is skipped
+    assert n == 3
+    suite = load_suite(io.StringIO(out.getvalue()))
+    assert suite.name == "test-convert"
+    assert [c.input for c in suite.cases] == ["Is 00123 a kinase?", "Is BRCA1, a tumor suppressor?", "Is MYC a kinase?"]
+    assert [c.ideal for c in suite.cases] == ["YES", "YES", "NO"]
+    # text is kept as written, and empty cells are left out
+    assert suite.cases[0].original_input == {"gene": "00123", "score": "0.9"}
+    assert suite.cases[1].original_input == {"gene": "BRCA1"}
+
+
+def test_convert_tsv_gz_and_parquet(tmp_path: Path):
+    tsv_path = tmp_path / "cases.tsv.gz"
+    with gzip.open(tsv_path, "wt") as f:
+        f.write("q\ta\nfirst, with comma\t1\nsecond\t2\n")
+    parquet_path = tmp_path / "cases.parquet"
+    duckdb.sql(f"COPY (SELECT 'third' AS q, 3 AS a, DATE '2024-01-02' AS d) TO '{parquet_path}' (FORMAT PARQUET)")
+    out = io.StringIO()
+    assert convert([tsv_path, parquet_path], out, "q", "a", syntax="jsonl") == 3
+    cases = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [(c["input"], c["ideal"]) for c in cases] == [("first, with comma", "1"), ("second", "2"), ("third", "3")]
+    assert cases[2]["original_input"] == {"d": "2024-01-02"}
+
+
+def test_convert_is_lazy(tmp_path: Path):
+    path = tmp_path / "big.csv"
+    duckdb.sql(f"COPY (SELECT range AS i, 'q' || range AS q FROM range(50000)) TO '{path}' (HEADER)")
+    cases = convert_files([path], "q", chunk_size=1000)
+    assert next(cases).input == "q0"
+    assert sum(1 for _ in iter_rows(path, chunk_size=1000)) == 50000
+
+
+def test_convert_missing_column(csv_path: Path):
+    with pytest.raises(ValueError, match="Target column"):
+        convert([csv_path], io.StringIO(), "question", "ideal")
@@ -0,0 +1,75 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from llm_matrix.diff import ALL_MODELS, RunDiff
+from llm_matrix.schema import Response, Suite, TestCase, TestCaseResult
+from llm_matrix.store import Store
+
+
+def make_run(store: Store, version: str, scores: dict, suite_name: str = "test-diff"):
+    cases = [TestCase(input=f"gene {i}", ideal="YES") for i in range(len(next(iter(scores.values()))))]
+    suite = Suite(name=suite_name, version=version, cases=cases, matrix={"hyperparameters": {"model": list(scores)}})
+    store.add_results(suite, [
+        TestCaseResult(
+            case=case,
+            response=Response(text=f"{model} {score}"),
+            hyperparameters={"model": model},
+            score=float(score),
+        )
+        for model, model_scores in scores.items()
+        for case, score in zip(cases, model_scores)
+    ])
+    return suite
+
+
+def test_diff_stores(tmp_path: Path):
+    rng = np.random.default_rng(0)
+    before = rng.binomial(1, 0.5, 100)
+    # m1 gets better on 12 cases, m2 stays the same but for one case
+    m1_after = before.copy()
+    m1_after[np.flatnonzero(before == 0)[:12]] = 1
+    m2_after = before.copy()
+    m2_after[0] = 1 - before[0]
+    store_a, store_b = Store(tmp_path / "a.db"), Store(tmp_path / "b.db")
+    make_run(store_a, "1", {"m1": before, "m2": before})
+    make_run(store_b, "1", {"m1": m1_after, "m2": m2_after})
+    store_b.close()
+    with RunDiff(store_a, tmp_path / "b.db") as diff:
+        df = diff.by_model().set_index("model")
+        assert df.index.tolist() == ["m1", "m2", ALL_MODELS]
+        assert df["n"].tolist() == [100, 100, 200]
+        assert df.loc["m1", "improved"] == 12 and df.loc["m1", "regressed"] == 0
+        assert df.loc["m1", "delta"] == pytest.approx(0.12)
+        assert df.loc["m1", "ci_low"] > 0
+        assert df.loc["m1", "p_adjusted"] < 0.01
+        assert df.loc["m2", "p_value"] == 1.0
+        assert df.loc["m2", "responses_changed"] == 1
+        changed = diff.changed_cases(limit=5)
+        assert len(changed) == 5
+        assert (changed["delta"].abs() == 1).all()
+        assert len(diff.changed_cases()) == 13
+        diff.write_changed_cases(tmp_path / "changed.tsv")
+    written = pd.read_csv(tmp_path / "changed.tsv", sep="\t")
+    assert len(written) == 13
+    assert set(written["model"]) == {"m1", "m2"}
+    # detached again
+    assert store_a.query("SELECT count(*) AS n FROM results")["n"][0] == 200
+
+
+def test_diff_versions():
+    store = Store(None)
+    make_run(store, "1", {"m1": [1, 0, 1, 0]})
+    make_run(store, "2", {"m1": [1, 1, 1], "m2": [1, 1, 1]})
+    diff = RunDiff(store, suite_a="test-diff--1", suite_b="test-diff--2")
+    df = diff.by_model().set_index("model")
+    assert df.loc["m1", "n"] == 3
+    assert df.loc["m1", "removed"] == 1
+    assert df.loc["m2", "added"] == 3 and df.loc["m2", "n"] == 0
+    assert np.isnan(df.loc["m2", "delta"])
+    assert diff.changed_cases()["test_case"].tolist() == ["gene 1"]
+    # the results of other suites are not compared
+    make_run(store, "1", {"m1": [0, 0]}, suite_name="other")
+    assert diff.by_model().set_index("model").loc[ALL_MODELS, "n"] == 3
@@ -0,0 +1,86 @@
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from llm_matrix import LLMRunner, Suite, TestCase
+from llm_matrix.estimate import ModelPrice, count_actions, estimate_calls, estimate_wall_clock, summarize_calls
+from llm_matrix.runner import LLMRunnerConfig
+from tests.conftest import FakeModel
+
+
+def make_suite() -> Suite:
+    return Suite(
+        name="test-estimate",
+        template="qa",
+        templates={"qa": {"prompt": "Answer: {input}", "metrics": ["simple_question"]}},
+        cases=[TestCase(input=f"question {i}", ideal="YES") for i in range(4)],
+        matrix={
+            "hyperparameters": {"model": ["fake-echo", "fake-stream"], "temperature": [0.0, 0.5]},
+            "exclude": {"hyperparameters": {"model": ["fake-stream"], "temperature": [0.5]}},
+        },
+    )
+
+
+@pytest.fixture
+def runner(tmp_path: Path) -> LLMRunner:
+    config = LLMRunnerConfig(
+        evaluation_model_name="fake-judge",
+        model_prices={
+            "fake-echo": ModelPrice(input=1.0, output=2.0),
+            "fake-judge": ModelPrice(input=0.5, output=0.5),
+        },
+    )
+    return LLMRunner(store_path=tmp_path / "cache.db", config=config)
+
+
+def test_estimate_without_calling_models(runner):
+    calls_before = FakeModel.calls
+    cells = runner.plan(make_suite())
+    counts = count_actions(cells).set_index("model")
+    # the excluded combination is not counted
+    assert counts.loc["fake-echo", "generate"] == 8
+    assert counts.loc["fake-stream", "generate"] == 4
+    calls = estimate_calls(runner, cells)
+    summary = summarize_calls(calls).set_index(["kind", "model"])
+    assert summary.loc[("generate", "fake-echo"), "calls"] == 8
+    assert summary.loc[("judge", "fake-judge"), "calls"] == 12
+    # "Answer: question 0" is 18 characters
+    assert summary.loc[("generate", "fake-echo"), "input_tokens"] == 8 * 5
+    assert summary.loc[("generate", "fake-echo"), "cost"] > 0
+    # no price for fake-stream
+    assert pd.isna(summary.loc[("generate", "fake-stream"), "cost"])
+    assert estimate_wall_clock(runner, calls) is None
+    assert FakeModel.calls == calls_before
+
+
+def test_estimate_uses_store_telemetry(runner):
+    suite = make_suite()
+    runner.run(suite)
+    suite.cases.append(TestCase(input="a new question", ideal="YES"))
+    cells = runner.plan(suite)
+    counts = count_actions(cells).set_index("model")
+    assert counts.loc["fake-echo", "cached"] == 8
+    assert counts.loc["fake-echo", "generate"] == 2
+    calls = estimate_calls(runner, cells)
+    generate = calls[calls["kind"] == "generate"]
+    assert len(generate) == 3
+    # output tokens come from the stored responses, which echo the prompt
+    assert set(generate["output_tokens"]) == {5}
+    assert generate["seconds"].notna().all()
+
+
+def test_estimate_cascade_from_stored_responses(runner):
+    runner.config.evaluation_cascade = True
+    suite = make_suite()
+    suite.templates["qa"].prompt = "{input}"
+    # echoed back, "YES i" is decided by its first token, "maybe i" needs the judge
+    for i, case in enumerate(suite.cases):
+        case.input = f"YES {i}" if i % 2 else f"maybe {i}"
+    runner.run(suite)
+    suite.cases.append(TestCase(input="a new question", ideal="YES"))
+    calls = estimate_calls(runner, runner.plan(suite))
+    judge = calls[calls["kind"] == "judge"].set_index("hyperparameters")["calls"]
+    # half of the stored responses of each model are settled without the judge
+    assert judge.to_dict() == {"model=fake-echo_temperature=0.0": 0.5, "model=fake-echo_temperature=0.5": 0.5,
+                               "model=fake-stream_temperature=0.0": 0.5}
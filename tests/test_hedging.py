@@ -0,0 +1,130 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from llm_matrix import LLMRunner, Suite, TestCase
+from llm_matrix.hedging import DeadlineExceeded, RequestHedger, latency_quantile
+from llm_matrix.progress import ProgressTracker
+from llm_matrix.runner import LLMRunnerConfig
+from tests.conftest import FakeModel
+
+
+class SimulatedBackend:
+    """A provider that usually answers in 5-15ms, but gets stuck for a second on 3% of calls."""
+
+    def __init__(self, seed: int = 0, stuck_rate: float = 0.03):
+        self.random = random.Random(seed)
+        self.stuck_rate = stuck_rate
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, cancel: threading.Event) -> str:
+        with self._lock:
+            self.requests += 1
+            latency = 1.0 if self.random.random() < self.stuck_rate else self.random.uniform(0.005, 0.015)
+        # a streamed response, read until it is done or no longer needed
+        if cancel.wait(latency):
+            return "cancelled"
+        return "ok"
+
+
+def timed_calls(hedger: RequestHedger, backend: SimulatedBackend, n: int, tracker=None) -> List[float]:
+    def timed(_):
+        start = time.monotonic()
+        assert hedger.call("m", backend, tracker=tracker) == "ok"
+        return time.monotonic() - start
+
+    with ThreadPoolExecutor(16) as pool:
+        return list(pool.map(timed, range(n)))
+
+
+def test_hedging_cuts_tail_latency():
+    n = 500
+    unhedged = timed_calls(RequestHedger(), SimulatedBackend(), n)
+    tracker = ProgressTracker()
+    backend = SimulatedBackend()
+    hedger = RequestHedger(hedge=True, budget=0.1)
+    hedged = timed_calls(hedger, backend, n, tracker=tracker)
+    p99_before, p99_after = latency_quantile(unhedged, 0.99), latency_quantile(hedged, 0.99)
+    print(f"p99 {p99_before:.3f}s -> {p99_after:.3f}s with {hedger.hedges} hedges")
+    assert p99_before > 0.9
+    assert p99_after < 0.3
+    # the extra requests stay within the budget
+    assert 0 < hedger.hedges <= 0.1 * n
+    assert backend.requests == n + hedger.hedges
+    assert sum(tracker.hedges.values()) == hedger.hedges
+    assert 0 < tracker.hedge_wins["m"] <= hedger.hedges
+
+
+def test_hedges_are_capped():
+    hedger = RequestHedger(hedge=True, budget=0.0, baseline={"m": 0.01})
+    assert hedger.call("m", lambda cancel: time.sleep(0.05) or "ok") == "ok"
+    assert hedger.hedges == 0
+
+
+def test_failed_attempt_waits_for_hedge():
+    attempts = []
+
+    def flaky(cancel):
+        attempts.append(1)
+        if len(attempts) == 1:
+            time.sleep(0.05)
+            raise ConnectionError("reset")
+        return "ok"
+
+    hedger = RequestHedger(hedge=True, budget=1.0, baseline={"m": 0.01})
+    assert hedger.call("m", flaky) == "ok"
+    # without a hedge in flight, the error is raised
+    attempts.clear()
+    with pytest.raises(ConnectionError):
+        RequestHedger(timeout=1.0).call("m", flaky)
+
+
+def test_runner_deadlines(tmp_path: Path):
+    suite = Suite(
+        name="test-deadlines",
+        cases=[TestCase(input=f"case {i}") for i in range(3)],
+        matrix={"hyperparameters": {"model": ["fake-echo", "fake-stream"], "delay": [0.5]}},
+    )
+    runner = LLMRunner(
+        store_path=tmp_path / "cache.db",
+        config=LLMRunnerConfig(
+            request_timeout=0.1,
+            model_timeouts={"fake-stream": 2.0},
+            continue_on_error=True,
+            generation_workers=3,
+        ),
+        progress=ProgressTracker(),
+    )
+    start = time.monotonic()
+    results = runner.run(suite)
+    assert {r.hyperparameters["model"] for r in results} == {"fake-stream"}
+    assert runner.progress.timeouts == {"fake-echo": 3}
+    assert runner.progress.snapshot()["timeouts"] == {"fake-echo": 3}
+    assert time.monotonic() - start < 2.0
+    with pytest.raises(DeadlineExceeded):
+        LLMRunner(store_path=tmp_path / "other.db", config=LLMRunnerConfig(request_timeout=0.1)).run(suite)
+
+
+def test_runner_hedges(tmp_path: Path):
+    suite = Suite(
+        name="test-hedges",
+        cases=[TestCase(input=f"case {i}") for i in range(4)],
+        matrix={"hyperparameters": {"model": ["fake-stream"], "delay": [0.1]}},
+    )
+    runner = LLMRunner(
+        store_path=tmp_path / "cache.db",
+        config=LLMRunnerConfig(hedge_requests=True, hedge_budget=1.0),
+        progress=ProgressTracker(),
+    )
+    runner.request_hedger().baseline["fake-stream"] = 0.01
+    calls = FakeModel.calls
+    results = runner.run(suite)
+    assert sorted(r.response.text for r in results) == [f"case {i} " for i in range(4)]
+    assert FakeModel.calls - calls == 4 + sum(runner.progress.hedges.values())
+    assert runner.progress.hedges == {"fake-stream": 4}
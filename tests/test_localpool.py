@@ -0,0 +1,98 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Tuple
+
+import pytest
+
+from llm_matrix import LLMRunner, Suite, TestCase
+from llm_matrix.localpool import LOCAL_PROVIDER, LocalModelPool
+from llm_matrix.planner import Action
+from llm_matrix.results import ResultSet
+from llm_matrix.runner import LLMRunnerConfig
+from llm_matrix.schema import ModelInfo
+from llm_matrix.utils import iter_cells
+
+FAKES = "tests.conftest"
+
+
+def pids(texts):
+    return {int(text.rsplit("pid ", 1)[1].rstrip(")")) for text in texts}
+
+
+def test_local_pool():
+    pool = LocalModelPool(workers=2, imports=[FAKES])
+    try:
+        with ThreadPoolExecutor(4) as threads:
+            responses = list(threads.map(
+                lambda i: pool.prompt({"model": "fake-cpu", "delay": 0.05}, f"case {i}"),
+                range(8),
+            ))
+    finally:
+        pool.close()
+    assert [r.text.split(" (")[0] for r in responses] == [f"case {i}" for i in range(8)]
+    workers = pids(r.text for r in responses)
+    assert os.getpid() not in workers
+    assert 1 <= len(workers) <= 2
+
+
+def make_suite(n: int, delay: float) -> Suite:
+    return Suite(
+        name="test-local-models",
+        cases=[TestCase(input=f"case {i}") for i in range(n)],
+        matrix={"hyperparameters": {"model": ["fake-cpu", "fake-echo"], "delay": [delay]}},
+    )
+
+
+def run_local(store_path: Path, suite: Suite, workers: int) -> Tuple[LLMRunner, ResultSet]:
+    runner = LLMRunner(
+        store_path=store_path,
+        config=LLMRunnerConfig(local_models=["fake-cpu"], local_workers=workers, local_model_imports=[FAKES]),
+    )
+    return runner, runner.run(suite)
+
+
+def test_runner_local_models(tmp_path: Path):
+    suite = make_suite(6, 0.02)
+    runner, results = run_local(tmp_path / "cache.db", suite, workers=2)
+    texts = {r.response.text for r in results if r.hyperparameters["model"] == "fake-cpu"}
+    assert len(texts) == 6
+    assert os.getpid() not in pids(texts)
+    # only the other models are loaded in this process
+    loaded = {m.parameters["model"] for m in runner._aimodels.values() if m.llm_model is not None}
+    assert loaded == {"fake-echo"}
+    cell = next(cell for cell in iter_cells(suite) if cell.hyperparameters["model"] == "fake-cpu")
+    cell.action = Action.GENERATE
+    assert runner.provider(cell) == LOCAL_PROVIDER
+    # the workers are stopped with the run
+    assert runner._local_pool is None
+
+
+@pytest.mark.benchmark
+@pytest.mark.skipif((os.cpu_count() or 1) < 4, reason="needs at least 4 cores")
+def test_local_models_scale(tmp_path: Path):
+    """CPU-bound calls scale with the worker processes; run with ``pytest -m benchmark -s``."""
+    suite = make_suite(16, 0.25)
+    timings = {}
+    for workers in (1, 4):
+        start = time.monotonic()
+        run_local(tmp_path / f"cache-{workers}.db", suite, workers)
+        timings[workers] = time.monotonic() - start
+    print(f"1 worker: {timings[1]:.1f}s, 4 workers: {timings[4]:.1f}s")
+    assert timings[4] < timings[1] / 2
+
+
+def test_local_models_outside_runs(tmp_path: Path):
+    suite = make_suite(1, 0.0)
+    runner = LLMRunner(
+        store_path=tmp_path / "cache.db",
+        config=LLMRunnerConfig(local_models=["fake-cpu"], local_workers=1, local_model_imports=[FAKES]),
+    )
+    result = runner.run_case(suite.cases[0], {"model": "fake-cpu"}, suite)
+    assert result.response.text.startswith("case 0 (pid ")
+    assert runner._local_pool is None
+    # plugins are not loaded by the workers
+    suite.models = {"fake-cpu": ModelInfo(plugins=["citeseek"])}
+    with pytest.raises(ValueError, match="plugins"):
+        runner.generate(suite.cases[0], {"model": "fake-cpu"}, suite)
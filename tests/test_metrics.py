@@ -0,0 +1,173 @@
+from typing import List
+
+import pytest
+
+from llm_matrix import LLMRunner, TestCase
+from llm_matrix.metrics import (
+    MetricEvaluator,
+    QAWithExplanationEvaluator,
+    evaluate_results,
+    get_evaluator,
+    extract_list_items,
+    register_metric_evaluator,
+    METRIC_REGISTRY,
+)
+from llm_matrix.runner import LLMRunnerConfig
+from llm_matrix.schema import TestCaseResult, Response
+from tests.conftest import FakeModel
+
+
+def make_result(text: str, ideal: str, metrics: List[str]) -> TestCaseResult:
+    return TestCaseResult(
+        case=TestCase(input="q", ideal=ideal),
+        response=Response(text=text),
+        hyperparameters={"model": "fake-echo"},
+        metrics=metrics,
+    )
+
+
+class LengthEvaluator(MetricEvaluator):
+    """Scores by whether the response is at least as long as the ideal; only implements evaluate."""
+
+    def evaluate(self, actual_output, expected_output, runner=None, result=None) -> float:
+        return 1.0 if len(actual_output) >= len(expected_output) else 0.0
+
+
+@pytest.fixture
+def length_metric():
+    register_metric_evaluator("test_length", LengthEvaluator())
+    yield "test_length"
+    del METRIC_REGISTRY["test_length"]
+
+
+def test_evaluate_batch_falls_back_to_evaluate(length_metric):
+    results = [make_result(text, "abc", [length_metric]) for text in ["abcd", "a"]]
+    assert METRIC_REGISTRY[length_metric].evaluate_batch(results) == [1.0, 0.0]
+
+
+@pytest.mark.parametrize("text,ideal,expected", [
+    ("YES. Because", "YES", 1.0),
+    ("no", "YES", 0.0),
+    ("", "NO", 0.5),
+    ("OTHER", "YES", 0.5),
+])
+def test_qa_batch_matches_single(text, ideal, expected):
+    evaluator = QAWithExplanationEvaluator()
+    result = make_result(text, ideal, ["qa_with_explanation"])
+    assert evaluator.evaluate(text, ideal) == expected
+    assert evaluator.evaluate_batch([result, result]) == [expected, expected]
+
+
+def test_evaluate_results_averages_metrics(length_metric):
+    results = [
+        make_result("YES, it is", "YES", ["qa_with_explanation", length_metric]),
+        make_result("NO", "YES", ["qa_with_explanation", length_metric]),
+        make_result("NO", "YES", []),
+    ]
+    evaluate_results(results)
+    assert [r.score for r in results] == [1.0, 0.0, None]
+
+
+def test_evaluate_results_unknown_metric():
+    with pytest.raises(NotImplementedError):
+        evaluate_results([make_result("YES", "YES", ["no_such_metric"])])
+
+
+def test_llm_evaluator_batch():
+    runner = LLMRunner(config=LLMRunnerConfig(evaluation_model_name="fake-judge", evaluation_concurrency=3))
+    results = [make_result(f"answer {i}", "answer", ["simple_question"]) for i in range(5)]
+    evaluate_results(results, runner=runner)
+    assert all(r.score == 1.0 for r in results)
+    assert all(r.evaluation_message == "1.0 looks right" for r in results)
+
+
+@pytest.mark.parametrize("text,ideal,metric,score,tier", [
+    ("Paris.", "paris", "simple_question", 1.0, "exact_match"),
+    ("42, after counting", "42", "simple_question", 1.0, "numeric_match"),
+    ("41", "42", "simple_question", 0.0, "numeric_match"),
+    ("Yes, because it binds DNA", "YES", "simple_question", 1.0, "first_token_match"),
+    ("NO", "YES", "simple_question", 0.0, "first_token_match"),
+    ("Lyon", "Paris", "simple_question", 0.0, "no_overlap"),
+    ("It is probably Paris", "Paris, France", "simple_question", 1.0, "llm"),
+    ("TP53; BRCA1 and EGFR", "BRCA1, TP53", "list_membership", 1.0, "set_overlap"),
+    ("KRAS", "BRCA1, TP53", "list_membership", 0.0, "set_overlap"),
+    ("BRCA1 only", "BRCA1, TP53", "list_membership", 1.0, "llm"),
+])
+@pytest.mark.parametrize("negatives", [True, False])
+def test_evaluation_cascade(text, ideal, metric, score, tier, negatives):
+    runner = LLMRunner(config=LLMRunnerConfig(
+        evaluation_model_name="fake-judge", evaluation_cascade=True, evaluation_cascade_negatives=negatives,
+    ))
+    if not negatives and score < 1.0:
+        # only matches are scored locally; the fake judge gives everything else full marks
+        score, tier = 1.0, "llm"
+    result = make_result(text, ideal, [metric])
+    calls = FakeModel.calls
+    evaluate_results([result], runner=runner)
+    assert (result.score, result.evaluation_tier) == (score, tier)
+    assert FakeModel.calls - calls == (1 if tier == "llm" else 0)
+    # the single-result path agrees
+    assert get_evaluator(metric, runner).evaluate(text, ideal, runner=runner) == score
+
+
+def test_evaluation_cascade_tier_of_several_metrics():
+    runner = LLMRunner(config=LLMRunnerConfig(evaluation_model_name="fake-judge", evaluation_cascade=True))
+    matched = make_result("TP53, BRCA1", "TP53, BRCA1", ["list_membership", "simple_question"])
+    judged = make_result("TP53, BRCA1 and EGFR", "TP53, BRCA1", ["simple_question", "list_membership"])
+    evaluate_results([matched, judged], runner=runner)
+    assert matched.evaluation_tier == "exact_match"
+    # one of the metrics needed the judge
+    assert judged.evaluation_tier == "llm"
+
+
+def test_evaluation_cascade_is_optional():
+    runner = LLMRunner(config=LLMRunnerConfig(evaluation_model_name="fake-judge"))
+    result = make_result("Lyon", "Paris", ["simple_question"])
+    evaluate_results([result], runner=runner)
+    assert (result.score, result.evaluation_tier) == (1.0, None)
+
+
+@pytest.mark.parametrize("text,items", [
+    ("- TP53\n- BRCA1", ["TP53", "BRCA1"]),
+    ("Here are the genes:\n1) TP53 - tumor suppressor\n2) BRCA1", ["TP53", "BRCA1"]),
+    ("TP53; BRCA1; EGFR", ["TP53", "BRCA1", "EGFR"]),
+    ("TP53", ["TP53"]),
+    ("", []),
+])
+def test_extract_list_items(text, items):
+    assert extract_list_items(text) == items
+
+
+@pytest.mark.parametrize("text,ideal,metric,score", [
+    ("TP53, BRCA1 and EGFR", "BRCA1, TP53", "list_membership_local", 1.0),
+    ("1. **TP-53**: p53\n2. KRAS", "TP53, BRCA1", "list_membership_local", 0.5),
+    ("MYC", "TP53, BRCA1", "list_membership_local", 0.0),
+    ("1. TP53\n2. EGFR", "TP53", "ranked_list_local", 1.0),
+    ("1. EGFR\n2. KRAS\n3. tp53 gene", "TP53", "ranked_list_local", 0.25),
+    ("1. EGFR\n2. KRAS", "TP53", "ranked_list_local", 0.0),
+])
+def test_local_list_evaluators(text, ideal, metric, score):
+    result = make_result(text, ideal, [metric])
+    calls = FakeModel.calls
+    evaluate_results([result])
+    assert result.score == score
+    assert result.evaluation_message
+    assert FakeModel.calls == calls
+    assert METRIC_REGISTRY[metric].evaluate(text, ideal) == score
+
+
+def test_local_list_batch_matches_single():
+    genes = ["TP53", "BRCA1", "BRCA2", "EGFR", "KRAS", "MYC", "PTEN", "APC"]
+    results = [
+        make_result(
+            "\n".join(f"{j + 1}. {genes[(i + j) % len(genes)]}" for j in range(i % 5)),
+            ", ".join(genes[(i * 3 + j) % len(genes)] for j in range(1 + i % 3)),
+            ["ranked_list_local"],
+        )
+        for i in range(200)
+    ]
+    for metric in ("list_membership_local", "ranked_list_local"):
+        evaluator = METRIC_REGISTRY[metric]
+        batch = evaluator.evaluate_batch(results)
+        assert batch == [evaluator.evaluate(r.response.text, r.case.ideal) for r in results]
+        assert 0 < sum(batch) < len(batch)
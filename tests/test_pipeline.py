@@ -0,0 +1,113 @@
+import threading
+import time
+
+import pytest
+
+from llm_matrix.pipeline import Pipeline, Stage
+
+
+def test_pipeline_preserves_all_items():
+    pipeline = Pipeline([
+        Stage("square", lambda xs: [x * x for x in xs], workers=4),
+        Stage("batch", lambda xs: xs, batch_size=7),
+    ])
+    assert sorted(pipeline.run(range(100))) == [x * x for x in range(100)]
+
+
+def test_pipeline_overlaps_stages():
+    """Two equally slow stages should take about as long as one, not both."""
+    def slow(xs):
+        time.sleep(0.02 * len(xs))
+        return xs
+
+    pipeline = Pipeline([Stage("a", slow), Stage("b", slow)])
+    start = time.monotonic()
+    assert len(list(pipeline.run(range(20)))) == 20
+    elapsed = time.monotonic() - start
+    assert elapsed < 0.02 * 20 * 1.5
+
+
+@pytest.mark.parametrize("lane", [None, lambda x: x % 2])
+def test_pipeline_backpressure(lane):
+    """A slow consumer stage bounds how far the feeder can get ahead, with or without lanes."""
+    fed = []
+
+    def source():
+        for i in range(50):
+            fed.append(i)
+            yield i
+
+    started = threading.Event()
+
+    def slow(xs):
+        started.set()
+        time.sleep(0.01)
+        return xs
+
+    pipeline = Pipeline([Stage("slow", slow, queue_size=2, lane=lane)])
+    it = pipeline.run(source())
+    next(it)
+    assert started.is_set()
+    time.sleep(0.1)
+    # the input, lane and output queues, the workers, and the items held by the feeder and dispatcher
+    assert len(fed) < 12
+    it.close()
+
+
+def test_pipeline_error_propagates():
+    def fail(xs):
+        if 3 in xs:
+            raise ValueError("boom")
+        return xs
+
+    pipeline = Pipeline([Stage("fail", fail, workers=2)])
+    with pytest.raises(ValueError, match="boom"):
+        list(pipeline.run(range(10)))
+
+
+def test_pipeline_lanes_run_concurrently():
+    """A slow lane does not hold up the other lane, and each lane has its own workers."""
+    def work(xs):
+        if xs[0] % 2:
+            time.sleep(0.02)
+        return xs
+
+    pipeline = Pipeline([
+        Stage("work", work, lane=lambda x: x % 2, lane_workers=lambda lane: 2 if lane else 1),
+    ])
+    start = time.monotonic()
+    out = list(pipeline.run(range(20)))
+    elapsed = time.monotonic() - start
+    assert sorted(out) == list(range(20))
+    # the fast lane finishes first
+    assert all(x % 2 == 0 for x in out[:5])
+    # 10 slow items on 2 workers
+    assert elapsed < 0.02 * 10
+
+
+
+def test_pipeline_lanes_bounded_ahead_of_consumer():
+    """However fast the feeder, routing to lanes only gets a bounded number of items ahead."""
+    queue_size, workers = 5, 2
+    fed = []
+
+    def source():
+        for i in range(500):
+            fed.append(i)
+            yield i
+
+    def slow(xs):
+        time.sleep(0.005)
+        return xs
+
+    stage = Stage("slow", slow, queue_size=queue_size, lane=lambda x: x % 2, lane_workers=lambda lane: workers)
+    consumed = 0
+    ahead = 0
+    for _ in Pipeline([stage]).run(source()):
+        consumed += 1
+        time.sleep(0.002)
+        ahead = max(ahead, len(fed) - consumed)
+    assert consumed == 500
+    # the input, lane and output queues, the items in the lane workers,
+    # and one item each held by the feeder and the dispatcher
+    assert ahead <= 3 * queue_size + 2 * workers + 2
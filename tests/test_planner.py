@@ -0,0 +1,104 @@
+from pathlib import Path
+
+import pytest
+
+from llm_matrix import LLMRunner, Suite, TestCase
+from llm_matrix.planner import Action, plan_to_dataframe
+from llm_matrix.runner import LLMRunnerConfig
+from tests.conftest import FakeModel
+
+
+def make_suite(**kwargs) -> Suite:
+    args = dict(
+        name="test-planner",
+        template="qa",
+        templates={
+            "qa": {"prompt": "{input}", "metrics": ["qa_with_explanation"]},
+            "other": {"prompt": "Q: {input}", "metrics": ["qa_with_explanation"]},
+        },
+        cases=[TestCase(input=f"YES {i}", ideal="YES") for i in range(3)],
+        matrix={"hyperparameters": {"model": ["fake-echo"], "temperature": [0.0, 0.5]}},
+    )
+    return Suite(**{**args, **kwargs})
+
+
+@pytest.fixture
+def runner(tmp_path: Path) -> LLMRunner:
+    return LLMRunner(store_path=tmp_path / "cache.db", config=LLMRunnerConfig(evaluation_model_name="fake-judge"))
+
+
+def actions(runner: LLMRunner, suite: Suite):
+    return [cell.action for cell in runner.plan(suite)]
+
+
+def test_plan_fresh_and_cached(runner):
+    suite = make_suite()
+    assert actions(runner, suite) == [Action.GENERATE] * 6
+    assert {c.reason for c in runner.plan(suite)} == {"not in store"}
+    runner.run(suite)
+    assert actions(runner, suite) == [Action.CACHED] * 6
+    df = plan_to_dataframe(runner.plan(suite))
+    assert list(df.columns[:4]) == ["action", "reason", "case_input", "hyperparameters"]
+    assert set(df["temperature"]) == {"0.0", "0.5"}
+
+
+def test_changed_template_regenerates(runner):
+    suite = make_suite()
+    runner.run(suite)
+    suite.cases[0].template = "other"
+    plan = runner.plan(suite)
+    assert [c.action for c in plan] == [Action.GENERATE, Action.CACHED, Action.CACHED] * 2
+    assert plan[0].reason == "changed: prompt"
+    calls = FakeModel.calls
+    results = runner.run(suite)
+    assert FakeModel.calls == calls + 2
+    assert {r.response.text for r in results if r.case.input == "YES 0"} == {"Q: YES 0"}
+    assert actions(runner, suite) == [Action.CACHED] * 6
+
+
+def test_changed_metrics_rescores(runner):
+    suite = make_suite()
+    runner.run(suite)
+    suite.templates["qa"].metrics = ["qa_with_explanation", "simple_question"]
+    plan = runner.plan(suite)
+    assert [c.action for c in plan] == [Action.RESCORE] * 6
+    assert plan[0].reason == "changed: metrics, evaluation_model"
+    calls = FakeModel.calls
+    results = runner.run(suite)
+    # only the judge is called, once per result
+    assert FakeModel.calls == calls + 6
+    assert all(r.metrics == ["qa_with_explanation", "simple_question"] for r in results)
+    assert all(r.evaluation_message == "1.0 looks right" for r in results)
+    assert actions(runner, suite) == [Action.CACHED] * 6
+
+
+def test_evaluation_cascade_rescores(runner):
+    suite = make_suite()
+    suite.templates["qa"].metrics = ["simple_question"]
+    runner.run(suite)
+    runner.config.evaluation_cascade = True
+    plan = runner.plan(suite)
+    assert [c.action for c in plan] == [Action.RESCORE] * 6
+    assert plan[0].reason == "changed: cascade"
+    calls = FakeModel.calls
+    results = runner.run(suite)
+    # "YES i" against "YES" is decided by its first token, without the judge
+    assert FakeModel.calls == calls
+    assert {r.evaluation_tier for r in results} == {"first_token_match"}
+    assert actions(runner, suite) == [Action.CACHED] * 6
+    assert {r.evaluation_tier for r in runner.run(suite)} == {"first_token_match"}
+
+
+def test_version_bump_reuses_unchanged_cells(runner):
+    runner.run(make_suite(version="1"))
+    suite = make_suite(version="2")
+    suite.cases[1].template = "other"
+    plan = runner.plan(suite)
+    assert [c.action for c in plan] == [Action.REUSE, Action.GENERATE, Action.REUSE] * 2
+    assert plan[0].reason == "unchanged in test-planner--1"
+    calls = FakeModel.calls
+    results = runner.run(suite)
+    assert FakeModel.calls == calls + 2
+    assert len(results) == 6
+    assert runner._get_store().size == 12
+    assert actions(runner, suite) == [Action.CACHED] * 6
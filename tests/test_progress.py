@@ -0,0 +1,95 @@
+import json
+import socket
+import threading
+from pathlib import Path
+
+import pytest
+
+from llm_matrix import LLMRunner, Suite, TestCase
+from llm_matrix.progress import JsonLinesSink, ProgressReporter, ProgressTracker, format_snapshot
+from llm_matrix.runner import LLMRunnerConfig
+
+
+def make_suite() -> Suite:
+    return Suite(
+        name="test-progress",
+        cases=[TestCase(input=f"case {i}") for i in range(5)],
+        matrix={"hyperparameters": {"model": ["fake-echo", "no-such-model"]}},
+    )
+
+
+def test_progress_counts_errors(tmp_path: Path):
+    runner = LLMRunner(
+        store_path=tmp_path / "cache.db",
+        config=LLMRunnerConfig(continue_on_error=True),
+        progress=ProgressTracker(),
+    )
+    results = runner.run(make_suite())
+    assert len(results) == 5
+    snapshot = runner.progress.snapshot()
+    assert snapshot["total"] == 10
+    assert snapshot["done"] == 10
+    assert snapshot["errors"] == 5
+    assert snapshot["model_errors"] == {"no-such-model": 5}
+    assert set(snapshot["requests_per_second"]) == {"fake-echo"}
+    assert "10/10 cells" in format_snapshot(snapshot)
+    # a second run takes the good cells from the store and retries the failed ones
+    runner.progress = ProgressTracker()
+    runner.run(make_suite())
+    assert runner.progress.cached == 5
+    assert runner.progress.errors == 5
+
+
+def test_progress_counts_only_generated_requests(tmp_path: Path):
+    runner = LLMRunner(store_path=tmp_path / "cache.db", config=LLMRunnerConfig(evaluation_model_name="fake-judge"))
+    suite = Suite(
+        name="test-progress-actions",
+        version="1",
+        template="qa",
+        templates={"qa": {"prompt": "{input}", "metrics": ["qa_with_explanation"]}},
+        cases=[TestCase(input=f"case {i}", ideal="case") for i in range(4)],
+        matrix={"hyperparameters": {"model": ["fake-echo"]}},
+    )
+    runner.run(suite)
+    # a new version copies the unchanged cells from the first one
+    suite.version = "2"
+    runner.progress = ProgressTracker()
+    runner.run(suite)
+    snapshot = runner.progress.snapshot()
+    assert (snapshot["reused"], snapshot["rescored"]) == (4, 0)
+    assert snapshot["requests_per_second"] == {}
+    assert "reused 4" in format_snapshot(snapshot)
+    # a new metric only evaluates the stored responses again
+    suite.templates["qa"].metrics = ["qa_with_explanation", "simple_question"]
+    runner.progress = ProgressTracker()
+    runner.run(suite)
+    snapshot = runner.progress.snapshot()
+    assert (snapshot["reused"], snapshot["rescored"]) == (0, 4)
+    assert snapshot["requests_per_second"] == {}
+
+
+def test_errors_stop_run_by_default(tmp_path: Path):
+    runner = LLMRunner(store_path=tmp_path / "cache.db")
+    with pytest.raises(Exception):
+        runner.run(make_suite())
+
+
+def test_json_lines_to_socket():
+    server = socket.create_server(("127.0.0.1", 0))
+    port = server.getsockname()[1]
+    received = []
+
+    def serve():
+        conn, _ = server.accept()
+        with conn, conn.makefile() as f:
+            received.extend(json.loads(line) for line in f)
+
+    thread = threading.Thread(target=serve)
+    thread.start()
+    tracker = ProgressTracker(total=3)
+    with ProgressReporter(tracker, [JsonLinesSink(f"tcp://127.0.0.1:{port}")], interval=0.01):
+        pass
+    thread.join(timeout=5)
+    server.close()
+    assert received
+    assert received[-1]["total"] == 3
@@ -0,0 +1,125 @@
+import time
+from pathlib import Path
+
+import pytest
+
+from llm_matrix import AIModel, LLMRunner, Suite, TestCase
+from llm_matrix.hedging import DeadlineExceeded
+from llm_matrix.runner import LLMRunnerConfig
+from llm_matrix.schema import results_to_dataframe
+from llm_matrix.store import Store
+from llm_matrix.summary_stats import agreement_by_config, replicate_summary
+from llm_matrix.utils import Shard, iter_cells
+from llm_matrix.workqueue import WorkQueue
+from tests.conftest import FakeModel
+
+
+def make_suite(model: str, replicates: int = 3, n_cases: int = 2) -> Suite:
+    return Suite(
+        name=f"test-replicates-{model}",
+        template="qa",
+        templates={"qa": {"prompt": "{input}", "metrics": ["qa_with_explanation"]}},
+        cases=[TestCase(input=f"YES {i}", ideal="YES") for i in range(n_cases)],
+        matrix={"hyperparameters": {"model": [model], "temperature": [0.7]}, "replicates": replicates},
+    )
+
+
+def runner(tmp_path: Path) -> LLMRunner:
+    return LLMRunner(
+        store_path=tmp_path / "cache.db",
+        config=LLMRunnerConfig(evaluation_model_name="fake-judge", generation_workers=2),
+    )
+
+
+def test_samples_in_one_request(tmp_path: Path):
+    suite = make_suite("fake-sample")
+    calls = FakeModel.calls
+    results = runner(tmp_path).run(suite)
+    # one request per cell, plus nothing for the judge-free metric
+    assert FakeModel.calls - calls == 2
+    assert sorted((r.case.input, r.replicate, r.response.text) for r in results) == [
+        (f"YES {i}", j, f"YES {i} #{j}") for i in range(2) for j in range(3)
+    ]
+    # each replicate is stored under its own key
+    store = Store(tmp_path / "cache.db")
+    assert store.size == 6
+    assert store.get_result(suite, suite.cases[0], suite.matrix.hyperparameters and {
+        "model": "fake-sample", "temperature": 0.7
+    }, replicate=2).response.text == "YES 0 #2"
+    store.close()
+
+
+def test_concurrent_calls_without_sampling(tmp_path: Path):
+    suite = make_suite("fake-echo")
+    calls = FakeModel.calls
+    r = runner(tmp_path)
+    results = r.run(suite)
+    assert FakeModel.calls - calls == 6
+    assert sorted(v.replicate for v in results) == [0, 0, 1, 1, 2, 2]
+    # a re-run is cached, and more replicates only generate the new ones
+    calls = FakeModel.calls
+    assert len(r.run(suite)) == 6
+    assert FakeModel.calls == calls
+    results = r.run(make_suite("fake-echo", replicates=5))
+    assert len(results) == 10
+    assert FakeModel.calls - calls == 4
+
+
+def test_unreplicated_result_is_first_replicate(tmp_path: Path):
+    r = runner(tmp_path)
+    single = r.run(make_suite("fake-sample", replicates=1))
+    assert [v.replicate for v in single] == [None, None]
+    calls = FakeModel.calls
+    results = r.run(make_suite("fake-sample", replicates=3))
+    # replicates 1 and 2 of each case, in one request per case
+    assert FakeModel.calls - calls == 2
+    assert sorted(v.response.text for v in results if v.case.input == "YES 0") == [
+        "YES 0 #0", "YES 0 #0", "YES 0 #1"
+    ]
+
+
+def test_replicate_summary(tmp_path: Path):
+    results = runner(tmp_path).run(make_suite("fake-sample"))
+    by_cell = replicate_summary(results_to_dataframe(results))
+    assert by_cell["replicates"].tolist() == [3, 3]
+    assert by_cell["score_mean"].tolist() == [1.0, 1.0]
+    assert by_cell["score_agreement"].tolist() == [1.0, 1.0]
+    # the completions are numbered, so no two agree
+    assert by_cell["response_agreement"].round(3).tolist() == [0.333, 0.333]
+    agreement = agreement_by_config(by_cell)
+    assert agreement["unanimous"].tolist() == [1.0]
+
+
+def test_replicate_cells():
+    suite = make_suite("fake-echo", replicates=2, n_cases=30)
+    cells = list(iter_cells(suite))
+    assert len(cells) == 60
+    shards = [Shard(i, 3) for i in range(1, 4)]
+    assert all(sum(s.contains(c) for s in shards) == 1 for c in cells)
+    queue = WorkQueue(None)
+    assert queue.add_suite(suite) == 60
+    assert sorted({c.replicate for _, c in queue.claim("w1", 60)}) == [0, 1]
+
+
+def test_models_without_samples_fall_back_to_concurrent_calls(tmp_path: Path, monkeypatch):
+    def not_called(*args, **kwargs):
+        raise AssertionError("prompt_samples called")
+
+    monkeypatch.setattr(AIModel, "prompt_samples", not_called)
+    suite = make_suite("fake-echo")
+    r = runner(tmp_path)
+    calls = FakeModel.calls
+    start = time.monotonic()
+    results = r.generate_samples(suite.cases[0], {"model": "fake-echo", "delay": 0.3}, suite, 4)
+    assert time.monotonic() - start < 1.0
+    assert FakeModel.calls - calls == 4
+    assert [result.response.text for result in results] == ["YES 0"] * 4
+
+
+def test_sampling_within_deadline(tmp_path: Path):
+    suite = make_suite("fake-sample")
+    r = LLMRunner(store_path=tmp_path / "cache.db", config=LLMRunnerConfig(request_timeout=0.1))
+    with pytest.raises(DeadlineExceeded):
+        r.generate_samples(suite.cases[0], {"model": "fake-sample", "delay": 0.5}, suite, 3)
+    results = r.generate_samples(suite.cases[0], {"model": "fake-sample"}, suite, 3)
+    assert [result.response.text for result in results] == ["YES 0 #0", "YES 0 #1", "YES 0 #2"]
@@ -0,0 +1,103 @@
+import gc
+import tracemalloc
+from pathlib import Path
+
+import pytest
+
+from llm_matrix import Suite, TestCase
+from llm_matrix.results import ResultInterner, ResultSet, ResultView
+from llm_matrix.schema import Response, TestCaseResult, results_to_dataframe
+from llm_matrix.store import Store
+
+
+def make_results(n_cases: int = 10, models=("m1", "m2", "m3")):
+    cases = [
+        TestCase(input=f"question {i}", ideal="YES", tags=["t"], original_input={"id": i, "text": "x" * 500})
+        for i in range(n_cases)
+    ]
+    return [
+        TestCaseResult(
+            case=case,
+            response=Response(text=f"answer from {model}", prompt=f"Please answer: {case.input}", system="Be brief",
+                              latency=0.5),
+            hyperparameters={"model": model, "temperature": 0.0},
+            metrics=["qa_with_explanation"],
+            score=1.0,
+        )
+        for model in models
+        for case in cases
+    ]
+
+
+def test_dataframe_parity():
+    results = make_results()
+    expected = results_to_dataframe(results)
+    views = ResultSet(results)
+    assert all(isinstance(v, ResultView) for v in views)
+    assert views.to_dataframe().equals(expected)
+    assert results_to_dataframe(views).equals(expected)
+    assert views.to_results() == results
+
+
+def test_store_reads_share_cases(tmp_path: Path):
+    suite = Suite(name="test-views", cases=[], matrix={"hyperparameters": {}})
+    results = make_results()
+    store = Store(tmp_path / "cache.db")
+    store.add_results(suite, results)
+    assert len(store.load_results(suite)) == 30
+    # several fetch batches
+    store.add_results(Suite(name="test-many", cases=[], matrix={"hyperparameters": {}}), make_results(n_cases=400))
+    assert len(store.load_results()) == 1230
+    views = store.load_results(suite)
+    # one case object per distinct case, shared across models
+    assert len({id(v.case) for v in views}) == 10
+    # prompts are loaded from the store when accessed
+    view = next(v for v in views if v.case.input == "question 3" and v.hyperparameters["model"] == "m2")
+    assert view._prompt is None
+    assert view.response.prompt == "Please answer: question 3"
+    assert view.response.latency == 0.5
+    assert sorted(views.to_results(), key=repr) == sorted(results, key=repr)
+    assert store.load_results(Suite(name="other", cases=[], matrix={"hyperparameters": {}})) == []
+
+
+def test_views_use_less_memory(tmp_path: Path):
+    suite = Suite(name="test-memory", cases=[], matrix={"hyperparameters": {}})
+    store = Store(tmp_path / "cache.db")
+    store.add_results(suite, make_results(n_cases=100))
+
+    def measure(load):
+        tracemalloc.start()
+        loaded = load()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        assert len(loaded) == 300
+        return size
+
+    full = measure(lambda: [store._decode(r) for (r,) in store._conn.execute("SELECT result FROM results").fetchall()])
+    views = measure(lambda: store.load_results(suite))
+    assert views < full / 2
+
+
+def test_view_response_changes_stick():
+    views = ResultSet(make_results(n_cases=1, models=("m1",)))
+    view = views[0]
+    view.response.text = "edited"
+    assert view.response_text == "edited"
+    assert view.to_result().response.text == "edited"
+    assert views.to_dataframe()["response_text"].tolist() == ["edited"]
+    with pytest.raises(TypeError):
+        hash(view)
+
+
+def test_interner_does_not_keep_cases():
+    interner = ResultInterner()
+    cases = [TestCase(input=f"question {i}") for i in range(100)]
+    flats = [interner.flat_case(case) for case in cases]
+    assert interner.flat_case(cases[0]) is flats[0]
+    del cases
+    gc.collect()
+    assert not interner._flat_cases
+    assert not interner.cases
+    # a new case of the same id gets its own flat dict
+    case = TestCase(input="new")
+    assert interner.flat_case(case)["case_input"] == "new"
@@ -1,9 +1,14 @@
+import time
 from pathlib import Path
 
 import pytest
 
 from llm_matrix import load_suite, Suite, LLMRunner, TestCase
-from tests.conftest import INPUT_DIR, STORE_PATH
+from llm_matrix.runner import LLMRunnerConfig
+from llm_matrix.schema import load_suites
+from llm_matrix.store import merge_stores
+from llm_matrix.utils import CaseIndex, Shard, select_cases
+from tests.conftest import INPUT_DIR, STORE_PATH, FakeModel
 
 
 @pytest.mark.parametrize("example,store_path", [
@@ -37,4 +42,206 @@ def test_generate_ideal():
         assert r.score is None
 
 
+def test_run_offline(tmp_path: Path):
+    suite = load_suite(INPUT_DIR / "test-eval.yaml")
+    suite.matrix.hyperparameters = {"model": ["fake-echo"]}
+    config = LLMRunnerConfig(evaluation_batch_size=1)
+    runner = LLMRunner(store_path=tmp_path / "cache.db", config=config)
+    results = runner.run(suite)
+    assert len(results) == len(suite.cases)
+    for r in results:
+        assert r.response.text == r.case.input
+        assert r.score is not None
+    assert runner._get_store().size == len(suite.cases)
+    # second run is served from the store
+    calls = FakeModel.calls
+    assert [r.score for r in runner.run(suite)] == [r.score for r in results]
+    assert FakeModel.calls == calls
+
+
+def test_run_batched_evaluation(tmp_path: Path):
+    suite = Suite(
+        name="test-batched",
+        template="qa",
+        templates={"qa": {"prompt": "{input}", "metrics": ["simple_question"]}},
+        cases=[TestCase(input=f"YES {i}", ideal="YES") for i in range(5)],
+        matrix={"hyperparameters": {"model": ["fake-echo"]}},
+    )
+    config = LLMRunnerConfig(
+        evaluation_model_name="fake-judge",
+        evaluation_batch_size=2,
+        generation_workers=3,
+        evaluation_workers=2,
+        write_batch_size=2,
+    )
+    runner = LLMRunner(store_path=tmp_path / "cache.db", config=config)
+    results = runner.run(suite)
+    assert [r.score for r in results] == [1.0] * 5
+    assert runner._get_store().size == 5
+
+
+def test_streaming_stops_early(tmp_path: Path):
+    long_answer = "YES because " + " ".join(["word"] * 50)
+    suite = Suite(
+        name="test-streaming",
+        template="qa",
+        templates={
+            "qa": {"prompt": "{input}", "metrics": ["qa_with_explanation"]},
+            "judged": {"prompt": "{input}", "metrics": ["simple_question"]},
+        },
+        cases=[
+            TestCase(input=long_answer, ideal="YES"),
+            TestCase(input=long_answer + " again", ideal="YES", template="judged"),
+        ],
+        matrix={"hyperparameters": {"model": ["fake-stream"]}},
+    )
+    config = LLMRunnerConfig(evaluation_model_name="fake-judge", streaming=True)
+    runner = LLMRunner(store_path=tmp_path / "cache.db", config=config)
+    chunks = FakeModel.chunks
+    prefix_result, full_result = runner.run(suite)
+    # the first-token metric only needs "YES "; the judge needs everything
+    assert prefix_result.response.truncated
+    assert prefix_result.response.text == "YES "
+    assert prefix_result.score == 1.0
+    assert not full_result.response.truncated
+    assert full_result.response.text.strip() == long_answer + " again"
+    assert FakeModel.chunks - chunks < 2 * 53
+    for r in (prefix_result, full_result):
+        assert r.response.time_to_first_token <= r.response.latency
+    # turning streaming off changes what is stored, so the truncated cell is regenerated
+    runner.config.streaming = False
+    assert [c.action.value for c in runner.plan(suite)] == ["generate", "cached"]
+    result = next(r for r in runner.run(suite) if r.case.input == long_answer)
+    assert result.response.truncated is None
+    assert result.response.text.strip() == long_answer
+    assert result.response.latency is not None
+
+
+def test_interleaved_providers(tmp_path: Path):
+    suite = Suite(
+        name="test-interleave",
+        cases=[TestCase(input=f"case {i}") for i in range(8)],
+        matrix={"hyperparameters": {"model": ["fake-echo", "fake-stream"], "delay": [0.05]}},
+    )
+    config = LLMRunnerConfig(
+        model_providers={"fake-echo": "a", "fake-stream": "b"},
+        provider_concurrency={"a": 1, "b": 1},
+    )
+    runner = LLMRunner(store_path=tmp_path / "cache.db", config=config)
+    start = time.monotonic()
+    assert len(runner.run(suite)) == 16
+    # one call at a time per provider, but both providers at once
+    assert time.monotonic() - start < 16 * 0.05 * 0.75
+    # the slower model now has a higher mean latency in the store
+    suite.cases.append(TestCase(input="new case"))
+    slow = Suite(name="test-slow", cases=[TestCase(input="slow")], matrix={"hyperparameters": {"model": ["fake-echo"], "delay": [0.2]}})
+    runner.run(slow)
+    latencies = runner._get_store().model_latencies()
+    assert latencies["fake-echo"] > latencies["fake-stream"]
+    runner.config.order_by_latency = True
+    assert [c.hyperparameters["model"] for c in runner._iter_cells(suite)] == ["fake-stream"] * 9 + ["fake-echo"] * 9
+
+
+
+def test_run_suites(tmp_path: Path):
+    def make_suite(name: str, inputs, models) -> Suite:
+        return Suite(
+            name=name,
+            cases=[TestCase(input=i) for i in inputs],
+            matrix={"hyperparameters": {"model": models, "delay": [0.05]}},
+        )
+    genes = make_suite("genes", ["gene 1", "gene 2", "shared"], ["fake-echo"])
+    diseases = make_suite("diseases", ["disease 1", "shared"], ["fake-echo", "fake-stream"])
+    config = LLMRunnerConfig(
+        model_providers={"fake-echo": "a", "fake-stream": "b"},
+        provider_concurrency={"a": 1, "b": 1},
+    )
+    runner = LLMRunner(store_path=tmp_path / "cache.db", config=config)
+    runner._get_store()
+    # load the models before timing
+    for model in ("fake-echo", "fake-stream"):
+        runner.generate(TestCase(input="warm up"), {"model": model}, genes)
+    calls = FakeModel.calls
+    start = time.monotonic()
+    genes_results, diseases_results = runner.run_suites([genes, diseases])
+    assert {(r.case.input, r.hyperparameters["model"]) for r in genes_results} == {
+        ("gene 1", "fake-echo"), ("gene 2", "fake-echo"), ("shared", "fake-echo")
+    }
+    assert len(diseases_results) == 4
+    # the shared prompt is generated once for fake-echo
+    assert FakeModel.calls == calls + 6
+    # both providers at once, instead of one suite after the other
+    assert time.monotonic() - start < 7 * 0.05
+    assert runner._get_store().size == 7
+    again = runner.run_suites([genes, diseases])
+    assert [sorted(rs, key=repr) for rs in again] == [sorted(rs, key=repr) for rs in (genes_results, diseases_results)]
+    assert FakeModel.calls == calls + 6
+
+
+def test_load_suites(tmp_path: Path):
+    (tmp_path / "a").mkdir()
+    for name in ("a/one", "two"):
+        (tmp_path / f"{name}.yaml").write_text((INPUT_DIR / "test-eval.yaml").read_text())
+    (tmp_path / "manifest.yaml").write_text("suites:\n  - a/one.yaml\n  - two.yaml\n")
+    suites = load_suites([tmp_path / "manifest.yaml", tmp_path / "two.yaml"])
+    assert [path.relative_to(tmp_path) for path, _ in suites] == [Path("a/one.yaml"), Path("two.yaml"), Path("two.yaml")]
+    assert all(isinstance(suite, Suite) for _, suite in suites)
+
+
+def test_sharded_run_and_merge(tmp_path: Path):
+    suite = Suite(
+        name="test-shards",
+        cases=[TestCase(input=f"case {i}") for i in range(20)],
+        matrix={"hyperparameters": {"model": ["fake-echo"], "temperature": [0.0, 0.5]}},
+    )
+    shard_paths = []
+    total = 0
+    for i in (1, 2, 3):
+        path = tmp_path / f"shard-{i}.db"
+        results = LLMRunner(store_path=path, shard=Shard(i, 3)).run(suite)
+        assert results, "with 40 cells every shard should get some"
+        total += len(results)
+        shard_paths.append(path)
+    assert total == 40
+    merged_path = tmp_path / "merged.db"
+    merge_stores(shard_paths, merged_path).close()
+    calls = FakeModel.calls
+    results = LLMRunner(store_path=merged_path).run(suite)
+    assert len(results) == 40
+    assert FakeModel.calls == calls
+
+
+def test_sampled_run_is_reused(tmp_path: Path):
+    tags = ["gene", "disease", "pathway", "slow"]
+    suite = Suite(
+        name="test-sample",
+        cases=[
+            TestCase(input=f"case {i}", ideal=["YES", "NO"][i % 2], tags=[tags[min(i % 10, 3)]])
+            for i in range(100)
+        ],
+        matrix={"hyperparameters": {"model": ["fake-echo"]}},
+    )
+    index = CaseIndex.from_cases(suite.cases)
+    subset = select_cases(suite, index, exclude_tags=["slow"], sample=10, stratify_by="tag", seed=3)
+    # 10 cases each are tagged gene, disease and pathway; the remainder goes to the first in order
+    assert sorted(c.tags[0] for c in subset.cases) == ["disease"] * 4 + ["gene"] * 3 + ["pathway"] * 3
+    assert subset.cases == select_cases(suite, index, exclude_tags=["slow"], sample=10, stratify_by="tag",
+                                        seed=3).cases
+    by_ideal = select_cases(suite, index, sample=10, stratify_by="ideal", seed=3)
+    assert sorted(c.ideal for c in by_ideal.cases) == ["NO"] * 5 + ["YES"] * 5
+    runner = LLMRunner(store_path=tmp_path / "cache.db")
+    runner.run(subset)
+    calls = FakeModel.calls
+    results = runner.run(select_cases(suite, index, tags=["gene", "disease", "pathway"]))
+    assert len(results) == 30
+    assert FakeModel.calls == calls + 20
+
 
+def test_case_index_scales():
+    cases = [TestCase(input=f"case {i}", ideal=str(i % 7), tags=[f"t{i % 50}", "all"]) for i in range(100_000)]
+    start = time.monotonic()
+    index = CaseIndex.from_cases(cases)
+    assert len(index.select(tags=["t1", "t2"], exclude_tags=["t2"])) == 2000
+    assert len(index.sample(500, stratify_by="tag", seed=0)) == 500
+    assert len(index.sample(500, stratify_by="ideal", seed=0)) == 500
+    assert time.monotonic() - start < 5
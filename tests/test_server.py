@@ -0,0 +1,82 @@
+import threading
+from pathlib import Path
+
+import pytest
+
+from llm_matrix import LLMRunner, Suite, TestCase
+from llm_matrix.runner import LLMRunnerConfig
+from llm_matrix.server import make_server, server_health, submit_results, submit_suite
+from tests.conftest import FakeModel
+
+
+def make_suite(n: int = 3) -> Suite:
+    return Suite(
+        name="test-server",
+        template="qa",
+        templates={"qa": {"prompt": "{input}", "metrics": ["qa_with_explanation"]}},
+        cases=[TestCase(input=f"YES {i}", ideal="YES") for i in range(n)],
+        matrix={"hyperparameters": {"model": ["fake-echo"]}},
+    )
+
+
+def serve(server) -> str:
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return thread
+
+
+@pytest.fixture
+def server_url(tmp_path: Path):
+    runner = LLMRunner(store_path=tmp_path / "cache.db", config=LLMRunnerConfig(evaluation_model_name="fake-judge"))
+    server = make_server(runner, port=0)
+    serve(server)
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_submit(server_url: str):
+    assert server_health(server_url)["jobs"] == 0
+    calls = FakeModel.calls
+    results = list(submit_results(make_suite(), server_url))
+    assert sorted(r.case.input for r in results) == ["YES 0", "YES 1", "YES 2"]
+    assert all(r.score == 1.0 for r in results)
+    assert FakeModel.calls == calls + 3
+    # the server's store has them now
+    events = list(submit_suite(make_suite(4), server_url))
+    assert [e["type"] for e in events] == ["result"] * 4 + ["summary"]
+    assert events[-1]["results"] == 4
+    assert FakeModel.calls == calls + 4
+    assert server_health(server_url)["jobs"] == 2
+
+
+def test_submit_concurrently(server_url: str):
+    suites = [make_suite(5).model_copy(update={"name": f"test-server-{i}"}) for i in range(3)]
+    counts = []
+    threads = [threading.Thread(target=lambda s=s: counts.append(len(list(submit_results(s, server_url))))) for s in suites]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert counts == [5, 5, 5]
+
+
+def test_submit_invalid(server_url: str):
+    with pytest.raises(ValueError, match="400"):
+        list(submit_suite("name: no-cases", server_url))
+    events = list(submit_suite(make_suite().model_copy(update={"template": "missing"}), server_url))
+    assert events[-1]["type"] == "error"
+
+
+def test_unix_socket(tmp_path: Path):
+    runner = LLMRunner(store_path=tmp_path / "cache.db")
+    socket_path = tmp_path / "llm-matrix.sock"
+    server = make_server(runner, socket_path=socket_path)
+    serve(server)
+    try:
+        url = f"unix://{socket_path}"
+        assert server_health(url)["status"] == "ok"
+        assert len(list(submit_results(make_suite(2).model_copy(update={"template": None}), url))) == 2
+    finally:
+        server.shutdown()
+        server.server_close()
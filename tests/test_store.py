@@ -1,11 +1,13 @@
 import json
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from pathlib import Path
 from typing import Union, Optional
 
+import duckdb
 import pytest
 from databricks.sdk.retries import retried
-from llm_matrix.store import Store
+from llm_matrix.store import Store, merge_stores, unique_key, compact_store, SCHEMA_VERSION
 from llm_matrix.schema import TestCaseResult, Response, Suite, TestCase
 
 from tests.conftest import INPUT_DIR
@@ -101,4 +103,251 @@ def test_duckdb(obj, pre_serialize):
     conn.execute("INSERT INTO test VALUES (?)", (obj_to_insert,))
     result = conn.execute("SELECT * FROM test").fetchone()
     retrieved_obj = json.loads(result[0])
-    assert retrieved_obj == obj
\ No newline at end of file
+    assert retrieved_obj == obj
+
+def test_merge_stores(tmp_path: Path):
+    case = TestCase(input="1+1", ideal="2")
+    other_case = TestCase(input="1+2", ideal="3")
+    suite = Suite(name="test", cases=[case, other_case], matrix={"hyperparameters": {}})
+    params = {"model": "gpt-4"}
+    # a store written before results were timestamped
+    legacy_path = tmp_path / "legacy.db"
+    conn = duckdb.connect(str(legacy_path))
+    conn.execute("""
+        CREATE TABLE results (
+            suite_name VARCHAR, test_case VARCHAR, ideal VARCHAR, hyperparameters JSON, result JSON,
+            PRIMARY KEY (suite_name, test_case, ideal, hyperparameters)
+        )
+    """)
+    legacy_result = TestCaseResult(case=case, response=Response(text="legacy"), hyperparameters=params)
+    conn.execute(
+        "INSERT INTO results VALUES (?, ?, ?, ?, ?)",
+        (*unique_key(suite, case, params), legacy_result.model_dump_json(exclude_unset=True)),
+    )
+    conn.close()
+    paths = []
+    for n, text in enumerate(["old", "new"]):
+        path = tmp_path / f"shard{n}.db"
+        store = Store(path)
+        store.add_result(suite, TestCaseResult(case=case, response=Response(text=text), hyperparameters=params))
+        if n == 0:
+            store.add_result(suite, TestCaseResult(case=other_case, response=Response(text="3"), hyperparameters=params))
+        store.close()
+        paths.append(path)
+    # the newest result wins regardless of merge order
+    merged = merge_stores([paths[1], legacy_path, paths[0]], tmp_path / "merged.db")
+    assert merged.size == 2
+    assert merged.get_result(suite, case, params).response.text == "new"
+    assert merged.get_result(suite, other_case, params).response.text == "3"
+    with pytest.raises(ValueError):
+        merged.merge(tmp_path / "merged.db")
+
+
+def _write_legacy_store(path: Path, suite: Suite, results):
+    """Write results in the original layout, with the full result JSON inline."""
+    conn = duckdb.connect(str(path))
+    conn.execute("""
+        CREATE TABLE results (
+            suite_name VARCHAR, test_case VARCHAR, ideal VARCHAR, hyperparameters JSON, result JSON,
+            PRIMARY KEY (suite_name, test_case, ideal, hyperparameters)
+        )
+    """)
+    for result in results:
+        conn.execute(
+            "INSERT INTO results VALUES (?, ?, ?, ?, ?)",
+            (*unique_key(suite, result.case, result.hyperparameters), result.model_dump_json(exclude_unset=True)),
+        )
+    conn.close()
+
+
+def _abstracts_results(n_cases=10, models=("m1", "m2", "m3")):
+    system = "Here are the potentially relevant abstracts:\n" + "Lorem ipsum dolor sit amet. " * 500
+    cases = [TestCase(input=f"gene {i}", ideal="YES", original_input={"id": i, "text": "x" * 500})
+             for i in range(n_cases)]
+    suite = Suite(name="test-compact", cases=cases, matrix={"hyperparameters": {"model": list(models)}})
+    results = [
+        TestCaseResult(
+            case=case,
+            response=Response(text=f"YES {m}", prompt=f"Is {case.input} real?", system=system),
+            hyperparameters={"model": m},
+            score=1.0,
+        )
+        for m in models for case in cases
+    ]
+    return suite, results
+
+
+def test_store_interns_blobs():
+    suite, results = _abstracts_results()
+    store = Store(None)
+    store.add_results(suite, results)
+    # one system prompt, and one case and one prompt per case
+    n_blobs = store._conn.execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+    assert n_blobs == 1 + 2 * len(suite.cases)
+    store._blob_cache.clear()
+    for result in results:
+        assert store.get_result(suite, result.case, result.hyperparameters) == result
+
+
+def test_compact_store(tmp_path: Path):
+    suite, results = _abstracts_results(n_cases=100)
+    path = tmp_path / "legacy.db"
+    _write_legacy_store(path, suite, results)
+    legacy_size = path.stat().st_size
+    store = Store(path)
+    assert store.get_result(suite, results[0].case, results[0].hyperparameters) == results[0]
+    store.close()
+    compacted = compact_store(path)
+    assert compacted.size == len(results)
+    assert path.stat().st_size < legacy_size
+    for result in results:
+        assert compacted.get_result(suite, result.case, result.hyperparameters) == result
+    rows = compacted._conn.execute("SELECT result FROM results").fetchall()
+    assert all("case_ref" in json.loads(row[0]) for row in rows)
+
+
+def test_compact_store_onto_itself(tmp_path: Path):
+    suite, results = _abstracts_results(n_cases=1, models=("m1",))
+    path = tmp_path / "cache.db"
+    store = Store(path)
+    store.add_results(suite, results)
+    store.close()
+    compacted = compact_store(path, tmp_path / "." / "cache.db")
+    assert compacted.size == 1
+    assert compacted.get_result(suite, results[0].case, results[0].hyperparameters) == results[0]
+
+
+def test_typed_columns():
+    suite, results = _abstracts_results(n_cases=3)
+    results[0].case.tags = ["chemistry"]
+    results[0].evaluation_message = "ok"
+    store = Store(None)
+    store.add_results(suite, results)
+    df = store.query("""
+        SELECT model, avg(score) AS mean, count(*) AS n FROM results
+        WHERE hyperparameter_values['model'] IN ('m1', 'm2')
+        GROUP BY model ORDER BY model
+    """)
+    assert df.to_dict("records") == [{"model": "m1", "mean": 1.0, "n": 3}, {"model": "m2", "mean": 1.0, "n": 3}]
+    df = store.query("""
+        SELECT response_text, evaluation_message FROM results
+        WHERE list_contains(tags, ?) ORDER BY response_text
+    """, ["chemistry"])
+    assert list(df["response_text"]) == ["YES m1", "YES m2", "YES m3"]
+    assert list(df["evaluation_message"].fillna("")) == ["ok", "", ""]
+
+
+def test_migrate_unversioned_store(tmp_path: Path):
+    suite, results = _abstracts_results(n_cases=5)
+    results[0].score = None
+    path = tmp_path / "legacy.db"
+    _write_legacy_store(path, suite, results)
+    store = Store(path)
+    assert store.schema_version == SCHEMA_VERSION
+    df = store.query("SELECT model, score, response_text, hyperparameter_values['model'] AS m FROM results")
+    assert len(df) == len(results)
+    assert (df["model"] == df["m"]).all()
+    assert df["score"].isna().sum() == 1
+    assert set(df["response_text"]) == {r.response.text for r in results}
+    indexes = store.query("SELECT index_name FROM duckdb_indexes() WHERE table_name = 'results'")
+    assert {"results_model_idx", "results_score_idx"} <= set(indexes["index_name"])
+    store.close()
+    # re-opening a migrated store is a no-op
+    assert Store(path).schema_version == SCHEMA_VERSION
+
+
+
+def test_read_results(tmp_path: Path):
+    suite, results = _abstracts_results(n_cases=400)
+    store = Store(tmp_path / "cache.db")
+    store.add_results(suite, results)
+    # more rows than fit in one fetch batch
+    loaded = store.read_results(suite)
+    assert len(loaded) == 1200
+    assert sorted(loaded, key=repr) == sorted(results, key=repr)
+    assert len({id(r.case) for r in loaded}) == 400
+    assert store.read_results(Suite(name="other", cases=[], matrix={"hyperparameters": {}})) == []
+
+
+def test_iter_results(tmp_path: Path):
+    suite, results = _abstracts_results(n_cases=100)
+    for i, result in enumerate(results):
+        result.hyperparameters["temperature"] = [0.0, 0.5][i % 2]
+        result.score = (i % 5) / 4
+        if i % 3 == 0:
+            result.case = result.case.model_copy(update={"tags": ["chemistry", f"t{i % 2}"]})
+    store = Store(tmp_path / "cache.db")
+    store.add_results(suite, results)
+    other, other_results = _abstracts_results(n_cases=5)
+    store.add_results(other.model_copy(update={"name": "other"}), other_results)
+
+    def selected(**kwargs):
+        return [r for batch in store.iter_results(suite, **kwargs) for r in batch]
+
+    def expected(predicate):
+        return sorted(repr(r) for r in results if predicate(r))
+
+    assert len(selected()) == 300
+    assert len(list(store.iter_results())) == 1
+    batches = list(store.iter_results(suite, batch_size=64))
+    assert [len(b) for b in batches] == [64] * 4 + [44]
+    # batches share interned cases and hyperparameters
+    assert batches[0].interner is batches[-1].interner
+    found = selected(hyperparameters={"model": ["m1", "m3"], "temperature": 0.5}, tags=["chemistry"],
+                     score_range=(0.5, 0.75))
+    assert sorted(repr(r.to_result()) for r in found) == expected(
+        lambda r: r.hyperparameters["model"] in ("m1", "m3") and r.hyperparameters["temperature"] == 0.5
+        and "chemistry" in (r.case.tags or []) and 0.5 <= r.score <= 0.75
+    )
+    assert len(found) > 0
+    assert len(selected(tags=["chemistry", "t1"])) == 50
+    assert len(selected(score_range=(None, 0.0))) == 60
+    assert selected(hyperparameters={"model": "m4"}) == []
+    assert len(list(store.iter_results("other"))[0]) == 15
+
+
+def test_iter_results_arrow():
+    pytest.importorskip("pyarrow")
+    suite, results = _abstracts_results(n_cases=10)
+    store = Store(None)
+    store.add_results(suite, results)
+    batches = list(store.iter_results(suite, hyperparameters={"model": "m2"}, batch_size=4, as_arrow=True))
+    assert sum(b.num_rows for b in batches) == 10
+    assert set(batches[0].column("model").to_pylist()) == {"m2"}
+
+
+@pytest.mark.benchmark
+def test_replay_benchmark(tmp_path: Path):
+    """Time a 100k-row replay; run with ``pytest -m benchmark -s``."""
+    import time
+    suite, results = _abstracts_results(n_cases=10_000, models=[f"m{i}" for i in range(10)])
+    store = Store(tmp_path / "cache.db")
+    start = time.monotonic()
+    for i in range(0, len(results), 10_000):
+        store.add_results(suite, results[i:i + 10_000])
+    timings = {"write": time.monotonic() - start}
+    rows = [encoded for (encoded,) in store._conn.execute("SELECT result FROM results").fetchall()]
+    replays = {
+        "row by row": lambda: [store._decode(encoded) for encoded in rows],
+        "bulk": lambda: store.read_results(suite),
+        "views": lambda: store.load_results(suite),
+    }
+    for name, replay in replays.items():
+        store._blob_cache.clear()
+        start = time.monotonic()
+        assert len(replay()) == 100_000
+        timings[name] = time.monotonic() - start
+    print(", ".join(f"{name}: {seconds:.1f}s" for name, seconds in timings.items()))
+    assert timings["bulk"] < timings["row by row"]
+
+
+def test_blob_cache_is_thread_safe(monkeypatch):
+    suite, results = _abstracts_results(n_cases=20, models=("m1",))
+    store = Store(None)
+    store.add_results(suite, results)
+    # a tiny cache is cleared all the time while other threads read it
+    monkeypatch.setattr("llm_matrix.store.BLOB_CACHE_SIZE", 3)
+    hashes = [h for (h,) in store._conn.execute("SELECT hash FROM blobs").fetchall()]
+    with ThreadPoolExecutor(8) as pool:
+        found = list(pool.map(lambda i: store._get_blobs(hashes[i % 5:] + hashes[:i % 5]), range(400)))
+    assert all(set(blobs) == set(hashes) for blobs in found)
@@ -0,0 +1,107 @@
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+from llm_matrix import LLMRunner, Suite, TestCase
+from llm_matrix.runner import LLMRunnerConfig
+from llm_matrix.store import Store
+from llm_matrix.workqueue import CLAIMS_AHEAD, WorkQueue, run_worker
+
+REPO_DIR = Path(__file__).parent.parent
+
+
+def make_suite(n_cases: int = 6) -> Suite:
+    return Suite(
+        name="test-queue",
+        cases=[TestCase(input=f"case {i}") for i in range(n_cases)],
+        matrix={"hyperparameters": {"model": ["fake-echo", "fake-stream"], "delay": [0.02]}},
+    )
+
+
+def test_leases_expire(tmp_path: Path):
+    queue = WorkQueue(tmp_path / "run.queue", lease_seconds=0.2)
+    assert queue.add_suite(make_suite(2)) == 4
+    claimed = queue.claim("w1", 10)
+    assert len(claimed) == 4
+    assert queue.claim("w2", 10) == []
+    time.sleep(0.3)
+    reclaimed = queue.claim("w2", 10)
+    assert [cell_id for cell_id, _ in reclaimed] == [cell_id for cell_id, _ in claimed]
+    # w1 lost its leases
+    assert not queue.complete(claimed[0][0], "w1")
+    assert queue.complete(reclaimed[0][0], "w2")
+    queue.fail(reclaimed[1][0], "w2", "boom", max_attempts=2)
+    queue.release("w2")
+    assert queue.counts() == {"pending": 2, "leased": 0, "done": 1, "failed": 1}
+    assert queue.errors() == [("test-queue", {"model": "fake-echo", "delay": 0.02}, "boom")]
+
+
+def test_run_worker(tmp_path: Path):
+    queue = WorkQueue(tmp_path / "run.queue")
+    queue.add_suite(make_suite())
+    runner = LLMRunner(store_path=tmp_path / "w1.db", config=LLMRunnerConfig(generation_workers=2))
+    assert run_worker(queue, runner, owner="w1", claim_size=3) == 12
+    assert queue.counts()["done"] == 12
+    assert runner._get_store().size == 12
+    # a long-lived worker does not hold on to the responses it generated
+    assert runner._active_runs == 0
+    assert not runner._responses
+
+
+def test_workers_share_a_large_queue(tmp_path: Path):
+    queue_path = tmp_path / "run.queue"
+    WorkQueue(queue_path).add_suite(make_suite(100))
+    claim_size = 5
+    leased = []
+    done = {}
+
+    def work(name):
+        runner = LLMRunner(store_path=tmp_path / f"{name}.db", config=LLMRunnerConfig(generation_workers=4))
+        done[name] = run_worker(WorkQueue(queue_path), runner, owner=name, claim_size=claim_size)
+
+    threads = [threading.Thread(target=work, args=(f"w{i}",)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    monitor = WorkQueue(queue_path)
+    while any(thread.is_alive() for thread in threads):
+        leased.append(monitor.counts()["leased"])
+        time.sleep(0.05)
+    assert sum(done.values()) == 200
+    # each worker only holds a couple of claims, so both get cells
+    assert all(n > 0 for n in done.values())
+    assert max(leased) <= 2 * CLAIMS_AHEAD * claim_size
+
+
+def test_workers_in_processes(tmp_path: Path):
+    queue_path = tmp_path / "run.queue"
+    queue = WorkQueue(queue_path, lease_seconds=1)
+    suite = make_suite(10)
+    queue.add_suite(suite)
+    # a worker that dies holding cells
+    assert len(queue.claim("crashed", 4)) == 4
+    code = (
+        f"import sys; sys.path.insert(0, {str(REPO_DIR)!r}); import tests.conftest; "
+        "from llm_matrix.cli import app; app(sys.argv[1:])"
+    )
+    workers = [
+        subprocess.Popen(
+            [sys.executable, "-c", code, "queue", "work", str(queue_path), "--name", f"w{i}",
+             "--lease", "2", "--claim-size", "2"],
+            cwd=REPO_DIR,
+        )
+        for i in range(3)
+    ]
+    assert [w.wait(timeout=120) for w in workers] == [0, 0, 0]
+    assert queue.counts() == {"pending": 0, "leased": 0, "done": 20, "failed": 0}
+    stores = queue.worker_stores()
+    assert len(stores) == 3
+    store = queue.collect(tmp_path / "merged.db")
+    assert store.size == 20
+    results = store.load_results(suite)
+    assert {(r.case.input, r.hyperparameters["model"]) for r in results} == {
+        (c.input, m) for c in suite.cases for m in ("fake-echo", "fake-stream")
+    }
+    # cells were shared between the workers
+    assert sum(Store(p).size for p in stores) == 20